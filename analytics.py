@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from mysql.connector import Error
+
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+# ANALYTICS CACHE CONFIGURATION
+ANALYTICS_CACHE_SIZE = 32   # Date ranges kept in memory
+ANALYTICS_CACHE_TTL = 60    # Seconds; only applies to ranges that include today
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+ITEM_SALES_COLUMNS = [
+    "order_id", "created_at", "payment_mode", "item_name", "category", "quantity", "total"
+]
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# BULK FETCH
+def fetch_item_sales(start_date, end_date):
+    """Fetch order_items joined to orders for a date range as one columnar DataFrame.
+
+    Returns None if the rows could not be fetched.
+    """
+    connection = get_connection()
+    if not connection:
+        logger.error("Database connection failed while fetching item sales")
+        return None
+
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            """SELECT o.id, o.created_at, o.payment_mode, i.item_name,
+                      COALESCE(m.category, 'Other'), i.quantity, i.total
+               FROM orders o
+               JOIN order_items i ON i.order_id = o.id
+               LEFT JOIN menu m ON m.id = i.menu_id
+               WHERE o.created_at >= %s AND o.created_at < %s""",
+            (
+                datetime.combine(start_date, datetime.min.time()),
+                datetime.combine(end_date + timedelta(days=1), datetime.min.time()),
+            )
+        )
+        rows = cursor.fetchall()
+        cursor.close()
+
+        df = pd.DataFrame.from_records(rows, columns=ITEM_SALES_COLUMNS)
+        df["created_at"] = pd.to_datetime(df["created_at"])
+        df["quantity"] = df["quantity"].astype(np.int64)
+        df["total"] = df["total"].astype(np.float64)
+        logger.info(f"Fetched {len(df)} order item rows from {start_date} to {end_date}")
+        return df
+    except Error as e:
+        logger.error(f"Error fetching item sales: {e}")
+        return None
+    finally:
+        connection.close()
+
+# VECTORIZED COMPUTATIONS
+def top_sellers(df, limit=10):
+    """Items ranked by quantity sold, with revenue."""
+    if df.empty:
+        return pd.DataFrame(columns=["Item", "Quantity", "Revenue (₹)"])
+    grouped = (
+        df.groupby("item_name", sort=False)
+        .agg(quantity=("quantity", "sum"), revenue=("total", "sum"))
+        .nlargest(limit, "quantity")
+        .reset_index()
+    )
+    grouped.columns = ["Item", "Quantity", "Revenue (₹)"]
+    return grouped
+
+def demand_heatmap(df):
+    """Items sold per weekday (rows) and hour of day (columns)."""
+    counts = np.zeros((7, 24), dtype=np.int64)
+    if not df.empty:
+        np.add.at(
+            counts,
+            (df["created_at"].dt.dayofweek.to_numpy(), df["created_at"].dt.hour.to_numpy()),
+            df["quantity"].to_numpy()
+        )
+    return pd.DataFrame(counts, index=WEEKDAYS, columns=[f"{hour:02d}" for hour in range(24)])
+
+def category_mix(df):
+    """Revenue and quantity per category with each category's share of revenue."""
+    if df.empty:
+        return pd.DataFrame(columns=["Category", "Quantity", "Revenue (₹)", "Share (%)"])
+    grouped = (
+        df.groupby("category", sort=False)
+        .agg(quantity=("quantity", "sum"), revenue=("total", "sum"))
+        .sort_values("revenue", ascending=False)
+        .reset_index()
+    )
+    total_revenue = grouped["revenue"].sum()
+    grouped["share"] = np.round(grouped["revenue"] / total_revenue * 100, 1) if total_revenue else 0.0
+    grouped.columns = ["Category", "Quantity", "Revenue (₹)", "Share (%)"]
+    return grouped
+
+def basket_stats(df):
+    """Average items and value per order."""
+    if df.empty:
+        return {"orders": 0, "avg_items": 0.0, "avg_value": 0.0}
+    per_order = df.groupby("order_id", sort=False).agg(items=("quantity", "sum"), value=("total", "sum"))
+    return {
+        "orders": int(len(per_order)),
+        "avg_items": float(per_order["items"].mean()),
+        "avg_value": float(per_order["value"].mean()),
+    }
+
+# CACHED ENTRY POINT
+def get_item_analytics(start_date, end_date):
+    """Get item-level analytics for a date range, cached per range.
+
+    Ranges that end before today never change and stay cached until evicted;
+    ranges that include today are refreshed after ANALYTICS_CACHE_TTL.
+    Returns None if the sales could not be fetched; failures are not cached.
+    """
+    key = (start_date, end_date)
+    now = time.monotonic()
+
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            loaded_at, result = entry
+            if end_date < date.today() or now - loaded_at < ANALYTICS_CACHE_TTL:
+                _cache.move_to_end(key)
+                return result
+
+    df = fetch_item_sales(start_date, end_date)
+    if df is None:
+        return None
+    result = {
+        "top_sellers": top_sellers(df),
+        "heatmap": demand_heatmap(df),
+        "category_mix": category_mix(df),
+        "basket": basket_stats(df),
+    }
+
+    with _cache_lock:
+        _cache[key] = (now, result)
+        _cache.move_to_end(key)
+        while len(_cache) > ANALYTICS_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
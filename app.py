@@ -1,18 +1,30 @@
 import streamlit as st
 import pandas as pd
 import re
+import os
 import time
 from datetime import datetime
+from decimal import Decimal
+
+from mysql.connector import Error as DatabaseError
 
 # Import all database functions
 from database import (
-    add_user, validate_user, user_exists, get_menu, add_menu_item,
-    update_menu_item, delete_menu_item, create_order, get_user_orders,
-    get_all_orders, get_dashboard_stats, get_low_stock_items,
-    get_order_by_reference, update_order_status, generate_order_reference,
-    check_stock_availability, get_user_favorites, add_favorite, remove_favorite,
-    add_order_rating, get_order_rating
+    add_user, validate_user, user_exists, get_menu, get_menu_snapshot, add_menu_item,
+    update_menu_items, delete_menu_items, upsert_menu_items, create_order, get_user_orders_page,
+    get_all_orders_page, get_dashboard_stats, get_low_stock_items,
+    get_order_by_reference, update_order_status, update_order_statuses, get_kitchen_orders,
+    ACTIVE_ORDER_STATUSES, NEXT_ORDER_STATUS, generate_order_reference,
+    get_user_favorites, queue_favorite,
+    add_order_rating, get_order_ratings, session, reserve_stock, release_reservation,
+    save_cart, load_cart, evaluate_promotion, validate_promotion, start_reservation_sweeper
+)
+from analytics import get_item_analytics
+from cart import Cart
+from menu_io import (
+    read_menu_file, validate_menu_import, export_menu, excel_supported, menu_editor_frame, diff_menu_edits
 )
+from exports import export_orders, available_export_formats, EXPORT_FORMATS
 
 # Page configuration
 st.set_page_config(
@@ -109,6 +121,18 @@ st.markdown("""
   color: #FFFFFF;
 }
 
+div[role="radiogroup"] label {
+  background-color: #111111;
+  border-radius: 999px;
+  padding: 0.35rem 1.1rem;
+  border: 1px solid transparent;
+}
+
+div[role="radiogroup"] label:has(input:checked) {
+  background: rgba(6, 193, 103, 0.16);
+  border-color: rgba(6, 193, 103, 0.65);
+}
+
 [data-testid="stMetricValue"] {
   font-size: 1.8rem;
   color: var(--green);
@@ -181,15 +205,16 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Constants
-DISCOUNT_CODES = {
-    "WELCOME10": 10,
-    "STUDENT20": 20,
-    "FREESHIP": 5,
-    "SAVE15": 15
-}
-
 ORDER_STATUSES = ["Preparing", "Ready", "Completed"]
 
+MENU_CATEGORIES = ["Food", "Dessert", "Snack", "Beverage"]
+MENU_PAGE_SIZE = 12  # Menu rows rendered per page in Browse Menu
+KITCHEN_REFRESH_SECONDS = 10       # Kitchen board polls for status changes this often
+KITCHEN_FULL_RELOAD_SECONDS = 300  # ...and reloads from scratch this often
+
+CUSTOMER_SECTIONS = ["Browse Menu", "My Cart", "Order History", "Favorites", "Track Order"]
+ADMIN_SECTIONS = ["Dashboard", "Kitchen", "Menu Management", "Inventory", "Sales Report"]
+
 # Session state initialization
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
@@ -200,9 +225,7 @@ if "role" not in st.session_state:
 if "current_page" not in st.session_state:
     st.session_state.current_page = "Home"
 if "cart" not in st.session_state:
-    st.session_state.cart = []
-if "cart_total" not in st.session_state:
-    st.session_state.cart_total = 0
+    st.session_state.cart = Cart()
 if "payment_mode" not in st.session_state:
     st.session_state.payment_mode = None
 if "payment_reference" not in st.session_state:
@@ -212,11 +235,19 @@ if "page_history" not in st.session_state:
 if "pending_payment_data" not in st.session_state:
     st.session_state.pending_payment_data = {}
 if "favorites" not in st.session_state:
-    st.session_state.favorites = []
+    st.session_state.favorites = {}
 if "final_payment_amount" not in st.session_state:
     st.session_state.final_payment_amount = None
-if "discount_applied" not in st.session_state:
-    st.session_state.discount_applied = 0
+if "discount_code" not in st.session_state:
+    st.session_state.discount_code = None
+if "order_history" not in st.session_state:
+    st.session_state.order_history = None
+if "admin_orders" not in st.session_state:
+    st.session_state.admin_orders = None
+if "kitchen_board" not in st.session_state:
+    st.session_state.kitchen_board = None
+if "order_ratings" not in st.session_state:
+    st.session_state.order_ratings = {}
 
 # Navigation functions
 def go_to(page_name):
@@ -245,10 +276,35 @@ def format_currency(amount):
 
 def get_cart_count():
     """Get total items in cart"""
-    total = 0
-    for item in st.session_state.cart:
-        total += item.get("quantity", 0)
-    return total
+    return st.session_state.cart.item_count
+
+def toggle_favorite(item):
+    """Flip an item's favorite state locally now; the database write is batched"""
+    favorites = st.session_state.favorites
+    is_favorite = item['id'] not in favorites
+    if is_favorite:
+        favorites[item['id']] = item
+    else:
+        favorites.pop(item['id'], None)
+    queue_favorite(st.session_state.username, item['id'], is_favorite)
+
+def get_order_listing(state_key):
+    """Get the keyset-paginated order listing kept in session state"""
+    listing = st.session_state.get(state_key)
+    if listing is None:
+        listing = {"orders": [], "cursor": None, "done": False}
+        st.session_state[state_key] = listing
+    return listing
+
+def load_more_orders(listing, fetch_page, **kwargs):
+    """Append the next page of orders to a listing; False (listing unchanged) if it failed"""
+    orders, next_cursor = fetch_page(after=listing["cursor"], **kwargs)
+    if orders is None:
+        return False
+    listing["orders"].extend(orders)
+    listing["cursor"] = next_cursor
+    listing["done"] = next_cursor is None
+    return True
 
 def show_cart_badge():
     """Display cart item count badge"""
@@ -259,6 +315,18 @@ def show_cart_badge():
                 <div class='cart-badge'>{count}</div>
             """, unsafe_allow_html=True)
 
+def render_with_session(render):
+    """Run a page section on its own database unit of work.
+
+    Only database errors are reported here; anything else is a bug and is
+    left to propagate (the unit of work still rolls back).
+    """
+    try:
+        with session() as db:
+            render(db)
+    except DatabaseError as e:
+        st.error(f"Database unavailable: {e}")
+
 # Navigation bar
 def show_navigation_bar():
     st.markdown("""
@@ -293,9 +361,12 @@ def show_navigation_bar():
                 st.session_state.logged_in = False
                 st.session_state.username = ""
                 st.session_state.role = ""
-                st.session_state.cart = []
-                st.session_state.cart_total = 0
-                st.session_state.favorites = []
+                st.session_state.cart.clear()
+                st.session_state.favorites = {}
+                st.session_state.order_history = None
+                st.session_state.admin_orders = None
+                st.session_state.kitchen_board = None
+                st.session_state.order_ratings = {}
                 go_to("Home")
         else:
             if st.button("Login", key="nav_login", use_container_width=True):
@@ -304,24 +375,13 @@ def show_navigation_bar():
     st.markdown("---")
 
 def get_menu_df():
-    """Get menu from database and convert to DataFrame"""
+    """Get the cached menu snapshot as a DataFrame"""
     try:
-        with st.spinner("Loading menu..."):
-            menu_items = get_menu(available_only=True)
+        menu_df = get_menu_snapshot().df
        
-        if not menu_items:
+        if menu_df.empty:
             st.warning("No menu items available at the moment.")
-            return pd.DataFrame()
-       
-        menu_data = {
-            "ID": [item['id'] for item in menu_items],
-            "Items": [item['item_name'] for item in menu_items],
-            "Category": [item['category'] for item in menu_items],
-            "Price (₹)": [float(item['price']) for item in menu_items],
-            "Stock": [item['stock'] for item in menu_items],
-            "Description": [item.get('description', '') for item in menu_items]
-        }
-        return pd.DataFrame(menu_data)
+        return menu_df
     except Exception as e:
         st.error(f"Error loading menu: {e}")
         return pd.DataFrame()
@@ -509,20 +569,27 @@ def customer_login_page():
        
         if submitted:
             if username and password:
-                with st.spinner("Logging in..."):
-                    time.sleep(0.5)
-                    role = validate_user(username, password)
-               
+                favorites = []
+                cart = None
+                try:
+                    with session() as db:
+                        with st.spinner("Logging in..."):
+                            time.sleep(0.5)
+                            role = validate_user(username, password, session=db)
+
+                        # Load user favorites and saved cart on the same connection
+                        if role == "Customer":
+                            favorites = get_user_favorites(username, session=db)
+                            cart = load_cart(username, session=db)
+                except Exception:
+                    role = None
+
                 if role == "Customer":
                     st.session_state.logged_in = True
                     st.session_state.username = username
                     st.session_state.role = role
-                   
-                    # Load user favorites
-                    try:
-                        st.session_state.favorites = get_user_favorites(username)
-                    except:
-                        st.session_state.favorites = []
+                    st.session_state.favorites = {item['id']: item for item in favorites}
+                    st.session_state.cart = cart
                    
                     st.success(f"Welcome back, {username}!")
                     time.sleep(0.3)
@@ -695,7 +762,7 @@ def signup_page():
                         st.session_state.logged_in = True
                         st.session_state.username = u
                         st.session_state.role = role
-                        st.session_state.favorites = []
+                        st.session_state.favorites = {}
                         time.sleep(0.5)
                         go_to("Portal")
                     else:
@@ -730,176 +797,210 @@ def customer_portal():
         unsafe_allow_html=True,
     )
 
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Browse Menu", "My Cart", "Order History", "Favorites", "Track Order"])
+    # Only the selected section runs, so the others issue no queries. Browse
+    # Menu and Favorites read the menu snapshot and session state and need no
+    # connection; every other section (or fragment) holds one connection and
+    # one transaction per run.
+    section = st.radio(
+        "Section", CUSTOMER_SECTIONS, horizontal=True,
+        key="customer_section", label_visibility="collapsed",
+    )
+
+    if section == "Browse Menu":
+        customer_menu_tab()
+    elif section == "My Cart":
+        render_with_session(customer_cart_tab)
+    elif section == "Order History":
+        customer_orders_fragment()
+    elif section == "Favorites":
+        customer_favorites_tab()
+    elif section == "Track Order":
+        render_with_session(customer_track_tab)
+
+# Customer: Browse Menu with Search
+def customer_menu_tab():
+    st.header("Menu")
+   
+    search_query = st.text_input("🔍 Search for items...", placeholder="Search names, categories or descriptions (e.g., Chai, sweet)")
+   
+    snapshot = get_menu_snapshot()
+   
+    if not snapshot.items:
+        st.warning("No menu items available.")
+        return
 
-    # TAB 1: Browse Menu with Search
-    with tab1:
-        st.header("Menu")
+    if search_query:
+        # Ranked matches from the snapshot's search index, best first
+        records = [snapshot.by_id[menu_id] for menu_id in snapshot.search.search(search_query)]
+        view = ("search", search_query)
+        if not records:
+            st.info(f"No items found for '{search_query}'. Try a different search term.")
+            return
+    else:
+        # Only the chosen category's records are rendered
+        selected_category = st.radio(
+            "Category",
+            ["All"] + list(snapshot.by_category),
+            horizontal=True,
+            key="menu_category",
+        )
+        records = snapshot.items if selected_category == "All" else snapshot.by_category[selected_category]
+        view = ("category", selected_category)
+
+    # Start from the first page whenever the search or category changes
+    if st.session_state.get("menu_view") != view:
+        st.session_state.menu_view = view
+        st.session_state.menu_page = 0
+
+    page_count = max(1, -(-len(records) // MENU_PAGE_SIZE))
+    page = min(st.session_state.get("menu_page", 0), page_count - 1)
+    start = page * MENU_PAGE_SIZE
+
+    st.divider()
+
+    for item in records[start:start + MENU_PAGE_SIZE]:
+        render_menu_row(item)
+
+    if page_count > 1:
+        col_prev, col_info, col_next = st.columns([1, 2, 1])
+        with col_prev:
+            if st.button("← Previous", disabled=page == 0, use_container_width=True, key="menu_prev"):
+                st.session_state.menu_page = page - 1
+                st.rerun()
+        with col_info:
+            st.markdown(
+                f"<p style='text-align:center;color:#9E9E9E;'>Page {page + 1} of {page_count} "
+                f"· {len(records)} items</p>",
+                unsafe_allow_html=True,
+            )
+        with col_next:
+            if st.button("Next →", disabled=page >= page_count - 1, use_container_width=True, key="menu_next"):
+                st.session_state.menu_page = page + 1
+                st.rerun()
+
+def render_menu_row(item):
+    """Render one menu item with its favorite toggle and quantity box"""
+    menu_id = item['id']
+    with st.container():
+        col1, col2, col3, col4 = st.columns([3, 1, 1, 2])
        
-        search_query = st.text_input("🔍 Search for items...", placeholder="Type item name (e.g., Chai, Samosa)")
+        with col1:
+            col_name, col_fav = st.columns([5, 1])
+            with col_name:
+                st.markdown(
+                    f"<div style='display:flex;flex-direction:column;'>"
+                    f"<span style='font-weight:600;'>{item['item_name']}</span>"
+                    f"<span style='font-size:0.85rem;color:#9E9E9E;'>{item['category']}</span>"
+                    f"</div>",
+                    unsafe_allow_html=True,
+                )
+            with col_fav:
+                is_favorite = menu_id in st.session_state.favorites
+                st.button(
+                    "❤️" if is_favorite else "🤍",
+                    key=f"fav_{menu_id}",
+                    on_click=toggle_favorite,
+                    args=(item,),
+                )
        
-        menu_df = get_menu_df()
+        with col2:
+            st.markdown(f"<span class='price-badge'>₹{item['price']}</span>", unsafe_allow_html=True)
        
-        if not menu_df.empty:
-            if search_query:
-                filtered_menu = menu_df[menu_df["Items"].str.contains(search_query, case=False, na=False)]
-                if filtered_menu.empty:
-                    st.info(f"No items found for '{search_query}'. Try a different search term.")
+        with col3:
+            stock_text = f"Stock: {item['stock']}"
+            if item['stock'] < 10:
+                st.markdown(f"<span style='color:orange;font-size:0.85rem;'>⚠️ {stock_text}</span>", unsafe_allow_html=True)
             else:
-                categories = ["All"] + list(menu_df["Category"].unique())
-                selected_category = st.selectbox("Filter by Category", categories)
-               
-                if selected_category != "All":
-                    filtered_menu = menu_df[menu_df["Category"] == selected_category]
-                else:
-                    filtered_menu = menu_df
-           
-            st.divider()
-
-            if not filtered_menu.empty:
-                for idx, row in filtered_menu.iterrows():
-                    with st.container():
-                        col1, col2, col3, col4 = st.columns([3, 1, 1, 2])
-                       
-                        with col1:
-                            col_name, col_fav = st.columns([5, 1])
-                            with col_name:
-                                st.markdown(
-                                    f"<div style='display:flex;flex-direction:column;'>"
-                                    f"<span style='font-weight:600;'>{row['Items']}</span>"
-                                    f"<span style='font-size:0.85rem;color:#9E9E9E;'>{row['Category']}</span>"
-                                    f"</div>",
-                                    unsafe_allow_html=True,
-                                )
-                            with col_fav:
-                                is_favorite = row['Items'] in st.session_state.favorites
-                                if st.button("❤️" if is_favorite else "🤍", key=f"fav_{idx}"):
-                                    try:
-                                        if is_favorite:
-                                            remove_favorite(st.session_state.username, row['Items'])
-                                            st.session_state.favorites.remove(row['Items'])
-                                        else:
-                                            add_favorite(st.session_state.username, row['Items'])
-                                            st.session_state.favorites.append(row['Items'])
-                                        st.rerun()
-                                    except Exception as e:
-                                        st.error(f"Error updating favorites: {e}")
-                       
-                        with col2:
-                            st.markdown(f"<span class='price-badge'>₹{row['Price (₹)']}</span>", unsafe_allow_html=True)
-                       
-                        with col3:
-                            stock_text = f"Stock: {row['Stock']}"
-                            if row['Stock'] < 10:
-                                st.markdown(f"<span style='color:orange;font-size:0.85rem;'>⚠️ {stock_text}</span>", unsafe_allow_html=True)
-                            else:
-                                st.markdown(f"<span style='color:#9E9E9E;font-size:0.85rem;'>✓ {stock_text}</span>", unsafe_allow_html=True)
-                       
-                        with col4:
-                            quantity = st.number_input(
-                                "Qty",
-                                min_value=0,
-                                max_value=row["Stock"],
-                                key=f"qty_{idx}",
-                                value=0,
-                                label_visibility="visible",
-                                help="Select quantity to add to cart",
-                            )
-                           
-                            if quantity > 0:
-                                existing_item_index = None
-                                for i, cart_item in enumerate(st.session_state.cart):
-                                    if cart_item["name"] == row["Items"]:
-                                        existing_item_index = i
-                                        break
-                               
-                                if existing_item_index is not None:
-                                    old_total = st.session_state.cart[existing_item_index]["total"]
-                                    st.session_state.cart_total -= old_total
-                                    st.session_state.cart[existing_item_index]["quantity"] = quantity
-                                    st.session_state.cart[existing_item_index]["total"] = row["Price (₹)"] * quantity
-                                    st.session_state.cart_total += st.session_state.cart[existing_item_index]["total"]
-                                else:
-                                    item = {
-                                        "name": row["Items"],
-                                        "price": row["Price (₹)"],
-                                        "quantity": quantity,
-                                        "total": row["Price (₹)"] * quantity,
-                                    }
-                                    st.session_state.cart.append(item)
-                                    st.session_state.cart_total += item["total"]
-                           
-                            elif quantity == 0:
-                                for i, cart_item in enumerate(st.session_state.cart):
-                                    if cart_item["name"] == row["Items"]:
-                                        st.session_state.cart_total -= cart_item["total"]
-                                        st.session_state.cart.pop(i)
-                                        break
-        else:
-            st.warning("No menu items available.")
-
-    # TAB 2: Cart with Stock Validation
-    with tab2:
-        st.header("Shopping Cart")
+                st.markdown(f"<span style='color:#9E9E9E;font-size:0.85rem;'>✓ {stock_text}</span>", unsafe_allow_html=True)
        
-        if st.session_state.cart:
-            for i, item in enumerate(st.session_state.cart):
-                col1, col2, col3, col4, col5 = st.columns([2, 1, 1, 1, 1])
-               
-                with col1:
-                    st.write(item["name"])
-                with col2:
-                    st.write(f"₹{item['price']}")
-                with col3:
-                    st.write(f"Qty: {item['quantity']}")
-                with col4:
-                    st.write(f"₹{item['total']}")
-                with col5:
-                    if st.button("Remove", key=f"remove_{i}"):
-                        st.session_state.cart_total -= item["total"]
-                        st.session_state.cart.pop(i)
-                        st.rerun()
-
-            st.divider()
-           
-            st.subheader("Have a promo code?")
-            discount_code = st.text_input("Enter discount code", placeholder="e.g., WELCOME10")
-           
-            discount_percentage = 0
-            if discount_code:
-                code_upper = discount_code.upper()
-                if code_upper in DISCOUNT_CODES:
-                    discount_percentage = DISCOUNT_CODES[code_upper]
-                    st.success(f"🎉 {discount_percentage}% discount applied!")
-                else:
-                    st.error("Invalid discount code. Try: WELCOME10, STUDENT20, FREESHIP, SAVE15")
+        with col4:
+            # Start from the cart so quantities survive switching sections and pages
+            in_cart = st.session_state.cart.quantity(menu_id)
+            quantity = st.number_input(
+                "Qty",
+                min_value=0,
+                max_value=item["stock"],
+                key=f"qty_{menu_id}",
+                value=min(in_cart, item["stock"]),
+                label_visibility="visible",
+                help="Select quantity to add to cart",
+            )
            
-            subtotal = st.session_state.cart_total
-            discount_amount = subtotal * (discount_percentage / 100)
-            final_total = subtotal - discount_amount
+            if quantity != in_cart:
+                st.session_state.cart.update(menu_id, item["item_name"], item["price"], quantity)
+                save_cart(st.session_state.username, st.session_state.cart)
+
+# Customer: Cart with Stock Validation
+def customer_cart_tab(db):
+    st.header("Shopping Cart")
+   
+    cart = st.session_state.cart
+    if cart:
+        for line in cart:
+            col1, col2, col3, col4, col5 = st.columns([2, 1, 1, 1, 1])
            
-            if discount_percentage > 0:
-                st.write(f"**Subtotal:** ₹{subtotal}")
-                st.write(f"**Discount ({discount_percentage}%):** -₹{discount_amount:.2f}")
-                st.markdown(f"### Total: {format_currency(final_total)}")
+            with col1:
+                st.write(line.name)
+            with col2:
+                st.write(f"₹{line.price}")
+            with col3:
+                st.write(f"Qty: {line.quantity}")
+            with col4:
+                st.write(f"₹{line.total}")
+            with col5:
+                if st.button("Remove", key=f"remove_{line.menu_id}"):
+                    cart.remove(line.menu_id)
+                    save_cart(st.session_state.username, cart)
+                    st.rerun()
+
+        st.divider()
+       
+        st.subheader("Have a promo code?")
+        discount_code = st.text_input("Enter discount code", placeholder="e.g., WELCOME10")
+       
+        # Priced from the cached promotion rules; checked again at checkout
+        promotion = None
+        if discount_code:
+            promotion = evaluate_promotion(discount_code, cart)
+            if promotion.ok:
+                st.success(f"🎉 {promotion.message} applied!")
             else:
-                st.markdown(f"### Total: {format_currency(subtotal)}")
+                st.error(promotion.message)
+       
+        subtotal = cart.subtotal
+        discount_amount = promotion.discount if promotion and promotion.ok else Decimal("0")
+        final_total = subtotal - discount_amount
+       
+        if discount_amount > 0:
+            st.write(f"**Subtotal:** ₹{subtotal}")
+            st.write(f"**Discount ({promotion.code}):** -₹{discount_amount:.2f}")
+            st.markdown(f"### Total: {format_currency(final_total)}")
+        else:
+            st.markdown(f"### Total: {format_currency(subtotal)}")
 
-            st.subheader("Checkout")
-            payment_method = st.selectbox("Select Payment Method", ["UPI", "Card", "Cash"], key="checkout_method")
+        st.subheader("Checkout")
+        payment_method = st.selectbox("Select Payment Method", ["UPI", "Card", "Cash"], key="checkout_method")
 
-            if st.button("Proceed to Payment", use_container_width=True):
-                # Validate stock for all items
-                stock_valid = True
-                error_messages = []
-               
-                with st.spinner("Validating stock availability..."):
-                    for item in st.session_state.cart:
-                        success, message = check_stock_availability(item['name'], item['quantity'])
-                        if not success:
-                            stock_valid = False
-                            error_messages.append(message)
-               
+        if st.button("Proceed to Payment", use_container_width=True):
+            # Usage limits are only exact in the database
+            promotion_valid = True
+            if promotion and promotion.ok:
+                promotion = validate_promotion(promotion.code, st.session_state.username, cart, session=db)
+                promotion_valid = promotion.ok
+                final_total = subtotal - promotion.discount
+
+            if not promotion_valid:
+                st.error(promotion.message)
+            else:
+                # Drop any hold from an abandoned earlier checkout
+                if st.session_state.payment_reference:
+                    release_reservation(st.session_state.payment_reference, session=db)
+
+                # Validate and hold stock for all items until payment completes
+                payment_reference = generate_order_reference()
+                with st.spinner("Reserving your items..."):
+                    stock_valid, error_messages = reserve_stock(payment_reference, cart, session=db)
+           
                 if not stock_valid:
                     st.error("Stock validation failed:")
                     for msg in error_messages:
@@ -908,42 +1009,55 @@ def customer_portal():
                 else:
                     # All validation passed, proceed to payment
                     st.session_state.final_payment_amount = final_total
-                    st.session_state.discount_applied = discount_percentage
+                    st.session_state.discount_code = promotion.code if promotion and promotion.ok else None
                     st.session_state.payment_mode = payment_method
-                    st.session_state.payment_reference = generate_order_reference()
-                   
+                    st.session_state.payment_reference = payment_reference
+               
                     if payment_method == "Card":
                         go_to("CardDetails")
                     else:
                         go_to("Payment")
-        else:
-            st.info("Your cart is currently empty. Add items from the menu.")
+    else:
+        st.info("Your cart is currently empty. Add items from the menu.")
 
-    # TAB 3: Order History from Database
-    with tab3:
-        st.header("Order History")
-       
-        try:
+# Customer: Order History from Database
+def customer_orders_tab(db):
+    st.header("Order History")
+   
+    try:
+        listing = get_order_listing("order_history")
+        if not listing["orders"] and not listing["done"]:
             with st.spinner("Loading your orders..."):
-                orders = get_user_orders(st.session_state.username)
-           
-            if orders:
-                for order in orders:
-                    order_ref = order['order_reference']
-                    status = order.get('status', 'Completed')
-                   
-                    status_colors = {
-                        "Preparing": "#FFA500",
-                        "Ready": "#06C167",
-                        "Completed": "#9E9E9E",
-                        "Pending": "#FFD700",
-                        "Cancelled": "#FF4444"
-                    }
-                    status_color = status_colors.get(status, "#9E9E9E")
-                   
-                    with st.container():
-                        st.markdown(
-                            f"""
+                load_more_orders(listing, get_user_orders_page, username=st.session_state.username, session=db)
+        orders = listing["orders"]
+
+        # Resolve ratings for all newly loaded orders in one query
+        ratings = st.session_state.order_ratings
+        unrated = [order['order_reference'] for order in orders if order['order_reference'] not in ratings]
+        if unrated:
+            fetched = get_order_ratings(unrated, session=db)
+            # On failure leave them unresolved so the next rerun asks again
+            if fetched is not None:
+                for ref in unrated:
+                    ratings[ref] = fetched.get(ref)
+       
+        if orders:
+            for order in orders:
+                order_ref = order['order_reference']
+                status = order.get('status', 'Completed')
+               
+                status_colors = {
+                    "Preparing": "#FFA500",
+                    "Ready": "#06C167",
+                    "Completed": "#9E9E9E",
+                    "Pending": "#FFD700",
+                    "Cancelled": "#FF4444"
+                }
+                status_color = status_colors.get(status, "#9E9E9E")
+               
+                with st.container():
+                    st.markdown(
+                        f"""
 <div style="background:#111111;border-radius:14px;padding:1.2rem;margin-bottom:1rem;border:1px solid #2A2A2A;">
 <h4 style="margin:0 0 0.5rem 0;">Order #{order_ref}
 <span style="color:{status_color};font-size:0.9rem;">● {status}</span></h4>
@@ -953,102 +1067,128 @@ def customer_portal():
 <hr style="border-top:1px solid #2A2A2A;margin:0.6rem 0;">
 <p style="margin:0.3rem 0;font-weight:500;">Items:</p>
 """,
-                            unsafe_allow_html=True,
-                        )
-                        for item in order["items"]:
-                            st.markdown(f"- {item['item_name']} x{item['quantity']} (₹{item['total']:.2f})")
-                       
-                        # Check if order has been rated
-                        try:
-                            rating_data = get_order_rating(order_ref)
-                            if rating_data:
-                                stars = "⭐" * rating_data['rating']
-                                st.markdown(f"<p style='color:#06C167;'>Your rating: {stars}</p>", unsafe_allow_html=True)
-                                if rating_data.get('feedback'):
-                                    st.markdown(f"<p style='color:#9E9E9E;font-size:0.85rem;'>Your feedback: {rating_data['feedback']}</p>", unsafe_allow_html=True)
-                            else:
-                                # Show rating form
-                                if st.button(f"⭐ Rate this order", key=f"rate_btn_{order_ref}"):
-                                    with st.form(f"rating_{order_ref}"):
-                                        st.write("How was your experience?")
-                                        rating = st.slider("Rating", 1, 5, 5, key=f"rating_slider_{order_ref}")
-                                        feedback = st.text_area("Feedback (optional)", key=f"feedback_{order_ref}")
-                                       
-                                        if st.form_submit_button("Submit Rating"):
-                                            try:
-                                                if add_order_rating(order_ref, rating, feedback):
-                                                    st.success("Thank you for your feedback! 🙏")
-                                                    time.sleep(0.5)
-                                                    st.rerun()
-                                                else:
-                                                    st.error("Failed to save rating. Please try again.")
-                                            except Exception as e:
-                                                st.error(f"Error saving rating: {e}")
-                        except Exception as e:
-                            pass
-                       
-                        st.markdown("</div>", unsafe_allow_html=True)
-            else:
-                st.info("No orders recorded yet. Place an order to see history here.")
-        except Exception as e:
-            st.error(f"Error loading order history: {e}")
+                        unsafe_allow_html=True,
+                    )
+                    for item in order["items"]:
+                        st.markdown(f"- {item['item_name']} x{item['quantity']} (₹{item['total']:.2f})")
+                   
+                    # Check if order has been rated
+                    try:
+                        rating_data = ratings.get(order_ref)
+                        if order_ref not in ratings:
+                            pass  # Rating status unknown until the lookup succeeds
+                        elif rating_data:
+                            stars = "⭐" * rating_data['rating']
+                            st.markdown(f"<p style='color:#06C167;'>Your rating: {stars}</p>", unsafe_allow_html=True)
+                            if rating_data.get('feedback'):
+                                st.markdown(f"<p style='color:#9E9E9E;font-size:0.85rem;'>Your feedback: {rating_data['feedback']}</p>", unsafe_allow_html=True)
+                        else:
+                            # Show rating form
+                            if st.button(f"⭐ Rate this order", key=f"rate_btn_{order_ref}"):
+                                with st.form(f"rating_{order_ref}"):
+                                    st.write("How was your experience?")
+                                    rating = st.slider("Rating", 1, 5, 5, key=f"rating_slider_{order_ref}")
+                                    feedback = st.text_area("Feedback (optional)", key=f"feedback_{order_ref}")
+                                   
+                                    if st.form_submit_button("Submit Rating"):
+                                        try:
+                                            if add_order_rating(order_ref, rating, feedback, session=db):
+                                                ratings[order_ref] = {
+                                                    "order_reference": order_ref,
+                                                    "rating": rating,
+                                                    "feedback": feedback,
+                                                }
+                                                st.success("Thank you for your feedback! 🙏")
+                                                time.sleep(0.5)
+                                                st.rerun(scope="fragment")
+                                            else:
+                                                st.error("Failed to save rating. Please try again.")
+                                        except Exception as e:
+                                            st.error(f"Error saving rating: {e}")
+                    except Exception as e:
+                        pass
+                   
+                    st.markdown("</div>", unsafe_allow_html=True)
+
+            col_more, col_refresh = st.columns(2)
+            with col_more:
+                if not listing["done"] and st.button("Load more orders", key="load_more_orders", use_container_width=True):
+                    with st.spinner("Loading more orders..."):
+                        loaded = load_more_orders(listing, get_user_orders_page, username=st.session_state.username, session=db)
+                    if loaded:
+                        st.rerun(scope="fragment")
+                    st.error("Could not load more orders. Please try again.")
+            with col_refresh:
+                # Picks up new orders and status changes from the kitchen
+                if st.button("Refresh", key="order_history_refresh", use_container_width=True):
+                    st.session_state.order_history = None
+                    st.rerun(scope="fragment")
+        elif listing["done"]:
+            st.info("No orders recorded yet. Place an order to see history here.")
+        else:
+            st.error("Could not load your orders right now. Please try again.")
+    except Exception as e:
+        st.error(f"Error loading order history: {e}")
 
-    # TAB 4: Favorites
-    with tab4:
-        st.header("Your Favorites ❤️")
+@st.fragment
+def customer_orders_fragment():
+    """Order History re-runs on its own when its widgets change"""
+    render_with_session(customer_orders_tab)
+
+# Customer: Favorites
+def customer_favorites_tab():
+    st.header("Your Favorites ❤️")
+   
+    favorites = st.session_state.favorites
+    if favorites:
+        st.write(f"You have {len(favorites)} favorite items")
        
-        if st.session_state.favorites:
-            st.write(f"You have {len(st.session_state.favorites)} favorite items")
+        for item in list(favorites.values()):
+            col1, col2, col3 = st.columns([3, 1, 1])
            
-            menu_df = get_menu_df()
-            if not menu_df.empty:
-                fav_items = menu_df[menu_df["Items"].isin(st.session_state.favorites)]
+            with col1:
+                st.markdown(f"**{item['item_name']}** - {item['category']}")
+                if not item.get('is_available', True):
+                    st.caption("Currently unavailable")
+            with col2:
+                st.markdown(f"<span class='price-badge'>₹{item['price']}</span>", unsafe_allow_html=True)
+            with col3:
+                st.button(
+                    "Remove ❌",
+                    key=f"remove_fav_{item['id']}",
+                    on_click=toggle_favorite,
+                    args=(item,),
+                )
+    else:
+        st.info("You haven't added any favorites yet. Click the ❤️ icon on menu items to add them here!")
+
+# Customer: Track Order
+def customer_track_tab(db):
+    st.header("Track Your Order")
+   
+    order_ref_input = st.text_input("Enter Order Reference", placeholder="e.g., ORD-20241215...")
+   
+    if st.button("Search Order"):
+        if order_ref_input:
+            try:
+                with st.spinner("Searching for order..."):
+                    order = get_order_by_reference(order_ref_input, session=db)
                
-                for idx, row in fav_items.iterrows():
-                    col1, col2, col3 = st.columns([3, 1, 1])
+                if order:
+                    st.success(f"Order found: {order_ref_input}")
                    
-                    with col1:
-                        st.markdown(f"**{row['Items']}** - {row['Category']}")
-                    with col2:
-                        st.markdown(f"<span class='price-badge'>₹{row['Price (₹)']}</span>", unsafe_allow_html=True)
-                    with col3:
-                        if st.button("Remove ❌", key=f"remove_fav_{idx}"):
-                            try:
-                                remove_favorite(st.session_state.username, row['Items'])
-                                st.session_state.favorites.remove(row['Items'])
-                                st.rerun()
-                            except Exception as e:
-                                st.error(f"Error removing favorite: {e}")
-        else:
-            st.info("You haven't added any favorites yet. Click the ❤️ icon on menu items to add them here!")
-
-    # TAB 5: Track Order
-    with tab5:
-        st.header("Track Your Order")
-       
-        order_ref_input = st.text_input("Enter Order Reference", placeholder="e.g., ORD-20241215...")
-       
-        if st.button("Search Order"):
-            if order_ref_input:
-                try:
-                    with st.spinner("Searching for order..."):
-                        order = get_order_by_reference(order_ref_input)
+                    status = order.get('status', 'Completed')
+                    status_colors = {
+                        "Preparing": "#FFA500",
+                        "Ready": "#06C167",
+                        "Completed": "#9E9E9E",
+                        "Pending": "#FFD700",
+                        "Cancelled": "#FF4444"
+                    }
+                    status_color = status_colors.get(status, "#9E9E9E")
                    
-                    if order:
-                        st.success(f"Order found: {order_ref_input}")
-                       
-                        status = order.get('status', 'Completed')
-                        status_colors = {
-                            "Preparing": "#FFA500",
-                            "Ready": "#06C167",
-                            "Completed": "#9E9E9E",
-                            "Pending": "#FFD700",
-                            "Cancelled": "#FF4444"
-                        }
-                        status_color = status_colors.get(status, "#9E9E9E")
-                       
-                        st.markdown(
-                            f"""
+                    st.markdown(
+                        f"""
 <div style="background:#111111;border-radius:14px;padding:1.5rem;border:1px solid #2A2A2A;">
 <h3>Order #{order['order_reference']}</h3>
 <p style="font-size:1.2rem;"><span style="color:{status_color};">● {status}</span></p>
@@ -1060,18 +1200,18 @@ def customer_portal():
 <h4>Items:</h4>
 </div>
 """,
-                            unsafe_allow_html=True,
-                        )
-                       
-                        for item in order['items']:
-                            st.markdown(f"- **{item['item_name']}** x{item['quantity']} - ₹{item['total']:.2f}")
-                    else:
-                        st.error(f"Order not found: {order_ref_input}")
-                        st.info("Please check your order reference and try again.")
-                except Exception as e:
-                    st.error(f"Error searching for order: {e}")
-            else:
-                st.warning("Please enter an order reference.")
+                        unsafe_allow_html=True,
+                    )
+                   
+                    for item in order['items']:
+                        st.markdown(f"- **{item['item_name']}** x{item['quantity']} - ₹{item['total']:.2f}")
+                else:
+                    st.error(f"Order not found: {order_ref_input}")
+                    st.info("Please check your order reference and try again.")
+            except Exception as e:
+                st.error(f"Error searching for order: {e}")
+        else:
+            st.warning("Please enter an order reference.")
 
 # Admin portal with database integration
 def admin_portal():
@@ -1080,302 +1220,555 @@ def admin_portal():
         unsafe_allow_html=True,
     )
 
-    tab1, tab2, tab3, tab4 = st.tabs(["Dashboard", "Menu Management", "Inventory", "Sales Report"])
+    # Only the selected section runs, so the others issue no queries. Each
+    # section (or fragment) holds one connection and one transaction per run.
+    section = st.radio(
+        "Section", ADMIN_SECTIONS, horizontal=True,
+        key="admin_section", label_visibility="collapsed",
+    )
 
-    # TAB 1: Dashboard with Real Statistics
-    with tab1:
-        st.header("Dashboard Overview")
+    if section == "Dashboard":
+        admin_dashboard_fragment()
+    elif section == "Kitchen":
+        admin_kitchen_fragment()
+    elif section == "Menu Management":
+        render_with_session(admin_menu_tab)
+    elif section == "Inventory":
+        render_with_session(admin_inventory_tab)
+    elif section == "Sales Report":
+        admin_sales_fragment()
+
+# Admin: Dashboard with Real Statistics
+def admin_dashboard_tab(db):
+    st.header("Dashboard Overview")
+   
+    try:
+        with st.spinner("Loading dashboard statistics..."):
+            stats = get_dashboard_stats(session=db)
        
-        try:
-            with st.spinner("Loading dashboard statistics..."):
-                stats = get_dashboard_stats()
+        if stats:
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Today's Orders", stats['today_orders'])
+            with col2:
+                st.metric("Today's Revenue", f"₹{stats['today_revenue']:.2f}")
+            with col3:
+                st.metric("Menu Items", stats['menu_items'])
+            with col4:
+                st.metric("Low Stock Items", stats['low_stock_items'])
            
-            if stats:
-                col1, col2, col3, col4 = st.columns(4)
-                with col1:
-                    st.metric("Today's Orders", stats['today_orders'])
-                with col2:
-                    st.metric("Today's Revenue", f"₹{stats['today_revenue']:.2f}")
-                with col3:
-                    st.metric("Menu Items", stats['menu_items'])
-                with col4:
-                    st.metric("Low Stock Items", stats['low_stock_items'])
-               
-                col5, col6 = st.columns(2)
-                with col5:
-                    st.metric("Total Customers", stats['total_customers'])
-                with col6:
-                    st.metric("Total Orders", stats['total_orders'])
-            else:
-                st.error("Failed to load dashboard statistics.")
-        except Exception as e:
-            st.error(f"Error loading statistics: {e}")
+            col5, col6 = st.columns(2)
+            with col5:
+                st.metric("Total Customers", stats['total_customers'])
+            with col6:
+                st.metric("Total Orders", stats['total_orders'])
+        else:
+            st.error("Failed to load dashboard statistics.")
+    except Exception as e:
+        st.error(f"Error loading statistics: {e}")
+   
+    st.divider()
+   
+    # Recent Orders
+    st.subheader("Recent Orders")
+    try:
+        listing = get_order_listing("admin_orders")
+        if not listing["orders"] and not listing["done"]:
+            with st.spinner("Loading recent orders..."):
+                load_more_orders(listing, get_all_orders_page, limit=10, session=db)
+        recent_orders = listing["orders"]
        
-        st.divider()
+        if recent_orders:
+            orders_data = {
+                "Order ID": [order['order_reference'] for order in recent_orders],
+                "Customer": [order['username'] for order in recent_orders],
+                "Items": [f"{len(order['items'])} items" for order in recent_orders],
+                "Total (₹)": [order['total_amount'] for order in recent_orders],
+                "Status": [order['status'] for order in recent_orders],
+                "Date": [str(order['created_at']) for order in recent_orders],
+            }
+            orders_df = pd.DataFrame(orders_data)
+            st.dataframe(orders_df, use_container_width=True)
+
+            col_more, col_refresh = st.columns(2)
+            with col_more:
+                if not listing["done"] and st.button("Load more orders", key="admin_load_more", use_container_width=True):
+                    if load_more_orders(listing, get_all_orders_page, limit=25, session=db):
+                        st.rerun(scope="fragment")
+                    st.error("Could not load more orders. Please try again.")
+            with col_refresh:
+                if st.button("Refresh", key="admin_orders_refresh", use_container_width=True):
+                    st.session_state.admin_orders = None
+                    st.rerun(scope="fragment")
+        elif listing["done"]:
+            st.info("No orders found.")
+        else:
+            st.error("Could not load recent orders right now. Please try again.")
+    except Exception as e:
+        st.error(f"Error loading recent orders: {e}")
+   
+    st.divider()
+   
+    # Low Stock Alerts
+    st.subheader("⚠️ Low Stock Alerts")
+    try:
+        with st.spinner("Checking inventory..."):
+            low_stock = get_low_stock_items(session=db)
        
-        # Recent Orders
-        st.subheader("Recent Orders")
+        if low_stock:
+            for item in low_stock:
+                stock_level = item['stock']
+                if stock_level <= 5:
+                    color = "red"
+                    icon = "🔴"
+                else:
+                    color = "orange"
+                    icon = "🟠"
+               
+                st.markdown(
+                    f"{icon} **{item['item_name']}** ({item['category']}) - "
+                    f"<span style='color:{color};font-weight:bold;'>Stock: {stock_level}</span>",
+                    unsafe_allow_html=True
+                )
+        else:
+            st.success("✅ All items are well stocked!")
+    except Exception as e:
+        st.error(f"Error loading low stock items: {e}")
+
+@st.fragment
+def admin_dashboard_fragment():
+    """Dashboard panels re-run on their own when their widgets change"""
+    render_with_session(admin_dashboard_tab)
+
+def refresh_kitchen_board(db):
+    """Bring the kitchen board in session state up to date.
+
+    Only orders whose status changed around the board's watermark are
+    fetched; a periodic full reload also drops orders that were deleted.
+    """
+    board = st.session_state.kitchen_board
+    if board is None or time.monotonic() - board["loaded_at"] > KITCHEN_FULL_RELOAD_SECONDS:
+        orders, watermark = get_kitchen_orders(session=db)
+        board = {
+            "orders": {order['id']: order for order in orders},
+            "watermark": watermark,
+            "loaded_at": time.monotonic(),
+        }
+        st.session_state.kitchen_board = board
+        return board
+
+    changed, board["watermark"] = get_kitchen_orders(after_change=board["watermark"], session=db)
+    for order in changed:
+        if order['status'] in ACTIVE_ORDER_STATUSES:
+            board["orders"][order['id']] = order
+        else:
+            board["orders"].pop(order['id'], None)
+    return board
+
+# Admin: Kitchen order board
+def admin_kitchen_tab(db):
+    st.header("Kitchen Orders")
+
+    try:
+        board = refresh_kitchen_board(db)
+    except Exception as e:
+        st.error(f"Error loading kitchen orders: {e}")
+        return
+
+    orders = sorted(board["orders"].values(), key=lambda order: (order['created_at'], order['id']))
+    if not orders:
+        st.info("No active orders. New orders appear here automatically.")
+        return
+
+    statuses = [status for status in ACTIVE_ORDER_STATUSES
+                if status != "Pending" or any(order['status'] == "Pending" for order in orders)]
+    now = datetime.now()
+    for column, status in zip(st.columns(len(statuses)), statuses):
+        with column:
+            in_status = [order for order in orders if order['status'] == status]
+            st.subheader(f"{status} ({len(in_status)})")
+            for order in in_status:
+                minutes = int((now - order['created_at']).total_seconds() // 60)
+                st.checkbox(
+                    f"{order['order_reference']} · {order['username']} · {minutes} min",
+                    key=f"kitchen_pick_{order['id']}",
+                )
+                st.caption(", ".join(f"{item['item_name']} x{item['quantity']}" for item in order['items']))
+
+            # Orders only move one step forward, from the column they are in
+            selected = [order['id'] for order in in_status
+                        if st.session_state.get(f"kitchen_pick_{order['id']}")]
+            next_status = NEXT_ORDER_STATUS[status]
+            if st.button(f"Mark {next_status} ({len(selected)})", key=f"kitchen_mark_{status}",
+                         disabled=not selected, use_container_width=True):
+                success, message = update_order_statuses(selected, next_status, session=db)
+                if success:
+                    for order_id in selected:
+                        st.session_state.pop(f"kitchen_pick_{order_id}", None)
+                    st.toast(message)
+                    st.rerun(scope="fragment")
+                else:
+                    st.error(message)
+
+    st.divider()
+    st.caption(f"Refreshes every {KITCHEN_REFRESH_SECONDS} seconds")
+
+@st.fragment(run_every=KITCHEN_REFRESH_SECONDS)
+def admin_kitchen_fragment():
+    """Kitchen board re-runs on its own to pick up new orders and status changes"""
+    render_with_session(admin_kitchen_tab)
+
+# Admin: Menu Management with Database Operations
+def admin_menu_tab(db):
+    st.header("Menu Management")
+   
+    # Edits are diffed against the snapshot the grid was built from
+    editor = st.session_state.get("menu_editor")
+    if editor is None:
         try:
-            with st.spinner("Loading recent orders..."):
-                recent_orders = get_all_orders(limit=10)
-           
-            if recent_orders:
-                orders_data = {
-                    "Order ID": [order['order_reference'] for order in recent_orders],
-                    "Customer": [order['username'] for order in recent_orders],
-                    "Items": [f"{len(order['items'])} items" for order in recent_orders],
-                    "Total (₹)": [order['total_amount'] for order in recent_orders],
-                    "Status": [order['status'] for order in recent_orders],
-                    "Date": [str(order['created_at']) for order in recent_orders],
-                }
-                orders_df = pd.DataFrame(orders_data)
-                st.dataframe(orders_df, use_container_width=True)
-            else:
-                st.info("No orders found.")
+            with st.spinner("Loading menu..."):
+                menu_items = get_menu(available_only=False, session=db)
         except Exception as e:
-            st.error(f"Error loading recent orders: {e}")
+            st.error(f"Error loading menu: {e}")
+            return
+        editor = {"items": menu_items, "frame": menu_editor_frame(menu_items), "revision": time.time_ns()}
+        st.session_state.menu_editor = editor
+
+    snapshot = editor["frame"]
+    if snapshot.empty:
+        st.info("No menu items found.")
+    else:
+        st.subheader("Current Menu Items")
+        with st.form("menu_editor_form"):
+            edited = st.data_editor(
+                snapshot,
+                key=f"menu_editor_{editor['revision']}",
+                use_container_width=True,
+                num_rows="fixed",
+                column_config={
+                    "Item": st.column_config.TextColumn(required=True, max_chars=100),
+                    "Category": st.column_config.SelectboxColumn(options=MENU_CATEGORIES, required=True),
+                    "Price (₹)": st.column_config.NumberColumn(min_value=0.0, step=1.0, format="₹%.2f", required=True),
+                    "Stock": st.column_config.NumberColumn(min_value=0, step=1, required=True),
+                    "Alert At": st.column_config.NumberColumn(min_value=0, step=1, required=True),
+                    "Available": st.column_config.CheckboxColumn(),
+                    "Description": st.column_config.TextColumn(),
+                    "Delete": st.column_config.CheckboxColumn(help="Delete this item on save"),
+                },
+            )
+            col_save, col_reload = st.columns(2)
+            with col_save:
+                save = st.form_submit_button("💾 Save Changes", use_container_width=True)
+            with col_reload:
+                reload = st.form_submit_button("🔄 Reload", use_container_width=True)
+
+        if reload:
+            st.session_state.menu_editor = None
+            st.rerun()
+
+        if save:
+            changes, deleted_ids = diff_menu_edits(snapshot, edited)
+            if not changes and not deleted_ids:
+                st.info("No changes to save.")
+            elif any(not (change["item_name"] or "").strip() or change["price"] <= 0 for change in changes):
+                st.warning("Every item needs a name and a price above zero.")
+            else:
+                try:
+                    success, message = update_menu_items(changes, session=db)
+                    if success and deleted_ids:
+                        success, message = delete_menu_items(deleted_ids, session=db)
+                    if success:
+                        st.toast(f"Saved {len(changes)} changes, deleted {len(deleted_ids)} items")
+                        st.session_state.menu_editor = None
+                        st.rerun()
+                    else:
+                        db.rollback()
+                        st.error(message)
+                except Exception as e:
+                    st.error(f"Error saving menu: {e}")
+   
+    st.divider()
+   
+    # Add New Item Form
+    st.subheader("➕ Add New Menu Item")
+    with st.form("add_menu_item_form"):
+        col1, col2 = st.columns(2)
        
-        st.divider()
+        with col1:
+            new_item_name = st.text_input("Item Name")
+            new_category = st.selectbox("Category", MENU_CATEGORIES)
+            new_price = st.number_input("Price (₹)", min_value=0.0, step=1.0)
        
-        # Low Stock Alerts
-        st.subheader("⚠️ Low Stock Alerts")
-        try:
-            with st.spinner("Checking inventory..."):
-                low_stock = get_low_stock_items(threshold=10)
-           
-            if low_stock:
-                for item in low_stock:
-                    stock_level = item['stock']
-                    if stock_level <= 5:
-                        color = "red"
-                        icon = "🔴"
-                    else:
-                        color = "orange"
-                        icon = "🟠"
-                   
-                    st.markdown(
-                        f"{icon} **{item['item_name']}** ({item['category']}) - "
-                        f"<span style='color:{color};font-weight:bold;'>Stock: {stock_level}</span>",
-                        unsafe_allow_html=True
+        with col2:
+            new_stock = st.number_input("Initial Stock", min_value=0, step=1)
+            new_threshold = st.number_input("Low Stock Alert At", min_value=0, value=10, step=1)
+            new_description = st.text_area("Description (optional)")
+       
+        submitted = st.form_submit_button("Add Item", use_container_width=True)
+       
+        if submitted:
+            if new_item_name and new_price > 0:
+                try:
+                    success, message = add_menu_item(
+                        new_item_name,
+                        new_category,
+                        new_price,
+                        new_stock,
+                        new_description if new_description else None,
+                        low_stock_threshold=new_threshold,
+                        session=db
                     )
+                    if success:
+                        st.session_state.menu_editor = None
+                        st.success(message)
+                        st.toast(f"{new_item_name} added to menu!")
+                        time.sleep(0.5)
+                        st.rerun()
+                    else:
+                        st.error(message)
+                except Exception as e:
+                    st.error(f"Error adding item: {e}")
             else:
-                st.success("✅ All items are well stocked!")
+                st.warning("Please provide item name and valid price.")
+
+    st.divider()
+    admin_menu_bulk_section(db, editor["items"])
+
+def admin_menu_bulk_section(db, menu_items):
+    """Import menu items and stock adjustments from a file, or export the menu.
+
+    The export is built from the rows the editor already loaded, and only
+    when asked for.
+    """
+    st.subheader("📦 Bulk Import / Export")
+    st.caption(
+        "Columns: id, item_name, category, price, stock, stock_delta, low_stock_threshold, "
+        "is_available, description. Rows match by id, or by item_name when id is blank; "
+        "blank cells keep the current value. Use stock to set stock, or stock_delta to adjust it."
+    )
+
+    file_types = ["csv", "xlsx"] if excel_supported() else ["csv"]
+    uploaded = st.file_uploader("Import file", type=file_types, key="menu_import_file")
+
+    if uploaded is not None and st.button("Validate and Import", use_container_width=True):
+        try:
+            df = read_menu_file(uploaded, uploaded.name)
+            menu_items = get_menu(available_only=False, session=db)
+            rows, row_errors = validate_menu_import(df, menu_items, MENU_CATEGORIES)
         except Exception as e:
-            st.error(f"Error loading low stock items: {e}")
+            st.error(f"Could not read the file: {e}")
+            return
+
+        if row_errors:
+            st.error(f"{len(row_errors)} rows have errors. Nothing was imported; fix them and upload again.")
+            st.dataframe(
+                pd.DataFrame(row_errors, columns=["Row", "Problem"]),
+                use_container_width=True,
+                hide_index=True,
+            )
+        elif not rows:
+            st.info("The file has no rows to import.")
+        else:
+            with st.spinner(f"Importing {len(rows)} items..."):
+                success, message = upsert_menu_items(rows, session=db)
+            if success:
+                st.session_state.menu_editor = None
+                st.success(message)
+            else:
+                st.error(message)
+
+    export_formats = ["CSV", "Excel"] if excel_supported() else ["CSV"]
+    col_format, col_download = st.columns(2)
+    with col_format:
+        export_format = st.selectbox("Export format", export_formats, key="menu_export_format")
+    with col_download:
+        if st.button("Prepare Menu Export", use_container_width=True):
+            extension, mime = {
+                "CSV": ("csv", "text/csv"),
+                "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+            }[export_format]
+            st.download_button(
+                label="📥 Download Menu",
+                data=export_menu(menu_items, export_format),
+                file_name=f"menu_{datetime.now().strftime('%Y%m%d')}.{extension}",
+                mime=mime,
+                use_container_width=True
+            )
 
-    # TAB 2: Menu Management with Database Operations
-    with tab2:
-        st.header("Menu Management")
+# Admin: Inventory with Database Data
+def admin_inventory_tab(db):
+    st.header("Inventory Management")
+   
+    try:
+        with st.spinner("Loading inventory data..."):
+            low_stock = get_low_stock_items(session=db)
        
-        try:
-            with st.spinner("Loading menu..."):
-                menu_items = get_menu(available_only=False)
+        st.subheader("Low Stock Items (Stock ≤ Threshold)")
+       
+        if low_stock:
+            inventory_data = {
+                "Item": [item['item_name'] for item in low_stock],
+                "Category": [item['category'] for item in low_stock],
+                "Current Stock": [item['stock'] for item in low_stock],
+                "Threshold": [item['low_stock_threshold'] for item in low_stock],
+                "Price (₹)": [float(item['price']) for item in low_stock],
+                "Status": ["🔴 Critical" if item['stock'] <= 5 else "🟠 Low" for item in low_stock]
+            }
+            inventory_df = pd.DataFrame(inventory_data)
+            st.dataframe(inventory_df, use_container_width=True)
            
-            if menu_items:
-                st.subheader("Current Menu Items")
-               
-                for item in menu_items:
-                    with st.expander(f"📋 {item['item_name']} - {item['category']}"):
-                        col1, col2, col3 = st.columns(3)
-                       
-                        with col1:
-                            new_price = st.number_input(
-                                "Price (₹)",
-                                value=float(item['price']),
-                                min_value=0.0,
-                                step=1.0,
-                                key=f"price_{item['id']}"
-                            )
-                       
-                        with col2:
-                            new_stock = st.number_input(
-                                "Stock",
-                                value=item['stock'],
-                                min_value=0,
-                                step=1,
-                                key=f"stock_{item['id']}"
-                            )
-                       
-                        with col3:
-                            is_available = st.checkbox(
-                                "Available",
-                                value=bool(item['is_available']),
-                                key=f"avail_{item['id']}"
-                            )
-                       
-                        new_desc = st.text_input(
-                            "Description",
-                            value=item.get('description', ''),
-                            key=f"desc_{item['id']}"
-                        )
-                       
-                        col_btn1, col_btn2 = st.columns(2)
-                       
-                        with col_btn1:
-                            if st.button("💾 Update", key=f"update_{item['id']}", use_container_width=True):
-                                try:
-                                    success, message = update_menu_item(
-                                        item['id'],
-                                        item['item_name'],
-                                        item['category'],
-                                        new_price,
-                                        new_stock,
-                                        is_available,
-                                        new_desc
-                                    )
-                                    if success:
-                                        st.success(message)
-                                        st.toast("Menu item updated!")
-                                        time.sleep(0.5)
-                                        st.rerun()
-                                    else:
-                                        st.error(message)
-                                except Exception as e:
-                                    st.error(f"Error updating item: {e}")
-                       
-                        with col_btn2:
-                            if st.button("🗑️ Delete", key=f"delete_{item['id']}", use_container_width=True):
-                                try:
-                                    success, message = delete_menu_item(item['id'])
-                                    if success:
-                                        st.success(message)
-                                        st.toast("Menu item deleted!")
-                                        time.sleep(0.5)
-                                        st.rerun()
-                                    else:
-                                        st.error(message)
-                                except Exception as e:
-                                    st.error(f"Error deleting item: {e}")
-            else:
-                st.info("No menu items found.")
-        except Exception as e:
-            st.error(f"Error loading menu: {e}")
+            st.warning(f"⚠️ {len(low_stock)} items need restocking!")
+        else:
+            st.success("✅ All items are well stocked!")
        
         st.divider()
        
-        # Add New Item Form
-        st.subheader("➕ Add New Menu Item")
-        with st.form("add_menu_item_form"):
-            col1, col2 = st.columns(2)
-           
-            with col1:
-                new_item_name = st.text_input("Item Name")
-                new_category = st.selectbox("Category", ["Food", "Dessert", "Snack", "Beverage"])
-                new_price = st.number_input("Price (₹)", min_value=0.0, step=1.0)
-           
-            with col2:
-                new_stock = st.number_input("Initial Stock", min_value=0, step=1)
-                new_description = st.text_area("Description (optional)")
-           
-            submitted = st.form_submit_button("Add Item", use_container_width=True)
-           
-            if submitted:
-                if new_item_name and new_price > 0:
-                    try:
-                        success, message = add_menu_item(
-                            new_item_name,
-                            new_category,
-                            new_price,
-                            new_stock,
-                            new_description if new_description else None
-                        )
-                        if success:
-                            st.success(message)
-                            st.toast(f"{new_item_name} added to menu!")
-                            time.sleep(0.5)
-                            st.rerun()
-                        else:
-                            st.error(message)
-                    except Exception as e:
-                        st.error(f"Error adding item: {e}")
-                else:
-                    st.warning("Please provide item name and valid price.")
-
-    # TAB 3: Inventory with Database Data
-    with tab3:
-        st.header("Inventory Management")
+        # Full Inventory
+        st.subheader("Full Inventory")
+        menu_items = get_menu(available_only=False, session=db)
        
+        if menu_items:
+            full_inventory = {
+                "Item": [item['item_name'] for item in menu_items],
+                "Category": [item['category'] for item in menu_items],
+                "Stock": [item['stock'] for item in menu_items],
+                "Price (₹)": [float(item['price']) for item in menu_items],
+                "Available": ["✅" if item['is_available'] else "❌" for item in menu_items]
+            }
+            full_df = pd.DataFrame(full_inventory)
+            st.dataframe(full_df, use_container_width=True)
+    except Exception as e:
+        st.error(f"Error loading inventory: {e}")
+
+# Admin: Sales Report
+def admin_sales_tab(db):
+    st.header("Sales Report")
+   
+    col1, col2 = st.columns(2)
+    with col1:
+        start_date = st.date_input("Start Date")
+    with col2:
+        end_date = st.date_input("End Date")
+   
+    if st.button("Generate Report"):
+        st.session_state.sales_report_range = (start_date, end_date)
+
+    # Keep the last generated report on screen; its analytics are cached per range
+    report_range = st.session_state.get("sales_report_range")
+    if report_range:
+        start_date, end_date = report_range
         try:
-            with st.spinner("Loading inventory data..."):
-                low_stock = get_low_stock_items(threshold=10)
+            from database import get_sales_data
            
-            st.subheader("Low Stock Items (Stock ≤ 10)")
+            with st.spinner("Generating sales report..."):
+                sales_data = get_sales_data(start_date, end_date, session=db)
            
-            if low_stock:
-                inventory_data = {
-                    "Item": [item['item_name'] for item in low_stock],
-                    "Category": [item['category'] for item in low_stock],
-                    "Current Stock": [item['stock'] for item in low_stock],
-                    "Price (₹)": [float(item['price']) for item in low_stock],
-                    "Status": ["🔴 Critical" if item['stock'] <= 5 else "🟠 Low" for item in low_stock]
-                }
-                inventory_df = pd.DataFrame(inventory_data)
-                st.dataframe(inventory_df, use_container_width=True)
+            if sales_data:
+                st.subheader("Sales Summary")
+                sales_df = pd.DataFrame(sales_data)
+                st.dataframe(sales_df, use_container_width=True)
+               
+                # Export button
+                csv = sales_df.to_csv(index=False)
+                st.download_button(
+                    label="📥 Download CSV",
+                    data=csv,
+                    file_name=f"sales_report_{datetime.now().strftime('%Y%m%d')}.csv",
+                    mime="text/csv",
+                    use_container_width=True
+                )
                
-                st.warning(f"⚠️ {len(low_stock)} items need restocking!")
+                # Show total revenue
+                total_revenue = sales_df['revenue'].sum()
+                total_orders = sales_df['orders'].sum()
+                st.metric("Total Revenue", f"₹{total_revenue:,.2f}")
+                st.metric("Total Orders", total_orders)
+
+                show_item_analytics(start_date, end_date)
+                show_order_export(start_date, end_date)
             else:
-                st.success("✅ All items are well stocked!")
-           
-            st.divider()
-           
-            # Full Inventory
-            st.subheader("Full Inventory")
-            menu_items = get_menu(available_only=False)
-           
-            if menu_items:
-                full_inventory = {
-                    "Item": [item['item_name'] for item in menu_items],
-                    "Category": [item['category'] for item in menu_items],
-                    "Stock": [item['stock'] for item in menu_items],
-                    "Price (₹)": [float(item['price']) for item in menu_items],
-                    "Available": ["✅" if item['is_available'] else "❌" for item in menu_items]
-                }
-                full_df = pd.DataFrame(full_inventory)
-                st.dataframe(full_df, use_container_width=True)
+                st.info("No sales data found for the selected period.")
         except Exception as e:
-            st.error(f"Error loading inventory: {e}")
+            st.error(f"Error generating report: {e}")
 
-    # TAB 4: Sales Report
-    with tab4:
-        st.header("Sales Report")
-       
-        col1, col2 = st.columns(2)
-        with col1:
-            start_date = st.date_input("Start Date")
-        with col2:
-            end_date = st.date_input("End Date")
-       
-        if st.button("Generate Report"):
-            try:
-                from database import get_sales_data
-               
-                with st.spinner("Generating sales report..."):
-                    sales_data = get_sales_data(start_date, end_date)
-               
-                if sales_data:
-                    st.subheader("Sales Summary")
-                    sales_df = pd.DataFrame(sales_data)
-                    st.dataframe(sales_df, use_container_width=True)
-                   
-                    # Export button
-                    csv = sales_df.to_csv(index=False)
-                    st.download_button(
-                        label="📥 Download CSV",
-                        data=csv,
-                        file_name=f"sales_report_{datetime.now().strftime('%Y%m%d')}.csv",
-                        mime="text/csv",
-                        use_container_width=True
-                    )
-                   
-                    # Show total revenue
-                    total_revenue = sales_df['revenue'].sum()
-                    total_orders = sales_df['orders'].sum()
-                    st.metric("Total Revenue", f"₹{total_revenue:,.2f}")
-                    st.metric("Total Orders", total_orders)
-                else:
-                    st.info("No sales data found for the selected period.")
-            except Exception as e:
-                st.error(f"Error generating report: {e}")
+def show_item_analytics(start_date, end_date):
+    """Render item-level analytics for a date range"""
+    st.divider()
+    st.subheader("Item Analytics")
+
+    with st.spinner("Analyzing item sales..."):
+        analytics = get_item_analytics(start_date, end_date)
+    if analytics is None:
+        st.error("Could not load item analytics right now. Please try again.")
+        return
+
+    basket = analytics["basket"]
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Orders Analyzed", basket["orders"])
+    with col2:
+        st.metric("Avg Items per Order", f"{basket['avg_items']:.2f}")
+    with col3:
+        st.metric("Avg Basket Value", format_currency(basket["avg_value"]))
+
+    col_top, col_mix = st.columns(2)
+    with col_top:
+        st.markdown("**Top Sellers**")
+        top = analytics["top_sellers"]
+        if not top.empty:
+            st.bar_chart(top.set_index("Item")["Quantity"])
+            st.dataframe(top, use_container_width=True, hide_index=True)
+        else:
+            st.info("No items sold in this period.")
+    with col_mix:
+        st.markdown("**Category Mix**")
+        mix = analytics["category_mix"]
+        if not mix.empty:
+            st.bar_chart(mix.set_index("Category")["Revenue (₹)"])
+            st.dataframe(mix, use_container_width=True, hide_index=True)
+        else:
+            st.info("No category data for this period.")
+
+    st.markdown("**Demand by Weekday and Hour (items sold)**")
+    st.dataframe(analytics["heatmap"], use_container_width=True)
+
+def show_order_export(start_date, end_date):
+    """Export raw orders and items for a date range, streamed to a temporary file.
+
+    The file is handed to the download button once, in the run that built
+    it, and deleted straight away; nothing is kept on disk or re-read on
+    later reruns.
+    """
+    st.divider()
+    st.subheader("Export Orders")
+
+    fmt = st.selectbox("Format", available_export_formats(), key="order_export_format")
+    if st.button("Prepare Export", use_container_width=True):
+        with st.spinner("Exporting orders..."):
+            path = export_orders(start_date, end_date, fmt)
+        if not path:
+            st.error("Export failed. Please try again.")
+            return
+
+        suffix, mime = EXPORT_FORMATS[fmt]
+        file_name = f"orders_{start_date:%Y%m%d}_{end_date:%Y%m%d}{suffix}"
+        try:
+            with open(path, "rb") as export_file:
+                st.download_button(
+                    label=f"📥 Download {file_name}",
+                    data=export_file,
+                    file_name=file_name,
+                    mime=mime,
+                    use_container_width=True
+                )
+        finally:
+            os.remove(path)
+        st.caption("Prepare the export again to download another copy.")
+
+@st.fragment
+def admin_sales_fragment():
+    """Sales Report re-runs on its own when its date range changes"""
+    render_with_session(admin_sales_tab)
 
 # Card payment page
 def card_details_page():
@@ -1434,7 +1827,7 @@ def card_details_page():
 
     with col2:
         st.subheader("Charge Summary")
-        amount = st.session_state.get("final_payment_amount", st.session_state.cart_total)
+        amount = st.session_state.get("final_payment_amount", st.session_state.cart.subtotal)
         st.write(f"Total amount: {format_currency(amount)}")
         st.write("Payments are simulated in this demo environment.")
 
@@ -1491,7 +1884,7 @@ border:1px solid rgba(6,193,103,0.5);text-align:center;">
             st.write("Please pay the total amount in cash at the counter. Present the coupon shown on the right to the cashier.")
        
         with col2:
-            amount = st.session_state.get("final_payment_amount", st.session_state.cart_total)
+            amount = st.session_state.get("final_payment_amount", st.session_state.cart.subtotal)
             st.markdown(f"""
 <div style="border-radius:16px;padding:1.2rem 1.4rem;background:linear-gradient(145deg,#262626,#1b1b1b);
 border:1px dashed #F5A623;color:#FFFFFF;">
@@ -1534,16 +1927,26 @@ def payment_success_page():
     # Save order to database
     try:
         with st.spinner("Saving your order..."):
-            amount = st.session_state.get("final_payment_amount", st.session_state.cart_total)
+            amount = st.session_state.get("final_payment_amount", st.session_state.cart.subtotal)
            
+            # Keyed by the payment reference, so reruns and retries never
+            # place the same order twice
             success, message, order_ref = create_order(
                 st.session_state.username,
                 st.session_state.cart,
-                mode
+                mode,
+                order_reference=ref,
+                discount_code=st.session_state.get("discount_code")
             )
        
         if success:
             st.toast("Order placed successfully! 🎉", icon="✅")
+
+            # The order holds the items now; empty the cart here and server-side
+            st.session_state.cart.clear()
+            save_cart(st.session_state.username, st.session_state.cart)
+            # Reload Order History however the customer leaves this page
+            st.session_state.order_history = None
            
             st.markdown("<h1 style='text-align:center;'>Payment Successful</h1>", unsafe_allow_html=True)
             st.markdown("---")
@@ -1570,13 +1973,13 @@ border:1px solid rgba(255,255,255,0.1);color:#FFFFFF;">
                
                 if st.button("Go to Customer Portal", use_container_width=True):
                     # Clear cart and payment data
-                    st.session_state.cart = []
-                    st.session_state.cart_total = 0
+                    st.session_state.cart.clear()
                     st.session_state.payment_mode = None
                     st.session_state.payment_reference = None
                     st.session_state.pending_payment_data = {}
                     st.session_state.final_payment_amount = None
-                    st.session_state.discount_applied = 0
+                    st.session_state.discount_code = None
+                    st.session_state.order_history = None
                    
                     go_to("Portal")
         else:
@@ -1596,8 +1999,25 @@ border:1px solid rgba(255,255,255,0.1);color:#FFFFFF;">
         if st.button("Go to Portal"):
             go_to("Portal")
 
+PAYMENT_PAGES = ("Payment", "CardDetails", "PaymentSuccess")
+
+def abandon_checkout():
+    """Release the stock held for a checkout the customer has left.
+
+    Browse Menu shows stock net of every live hold, the customer's own
+    included, so keeping it would cap the menu quantities below what is
+    already in the cart. Checking out again takes a fresh hold.
+    """
+    ref = st.session_state.payment_reference
+    if ref and release_reservation(ref):
+        st.session_state.payment_reference = None
+        st.session_state.payment_mode = None
+
 # Main router
 def main():
+    # Release expired stock holds in the background (starts once per process)
+    start_reservation_sweeper()
+
     page = st.session_state.current_page
 
     if not st.session_state.logged_in:
@@ -1624,6 +2044,9 @@ def main():
         else:
             home_page()
     else:
+        if page not in PAYMENT_PAGES:
+            abandon_checkout()
+
         if page in ["About", "Contact"]:
             if page == "About":
                 about_page()
@@ -0,0 +1,127 @@
+from decimal import Decimal
+
+def to_decimal(value):
+    """Convert a price to Decimal without picking up binary float noise."""
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+class CartLine:
+    """One menu item in the cart."""
+    __slots__ = ("menu_id", "name", "price", "quantity")
+
+    def __init__(self, menu_id, name, price, quantity):
+        self.menu_id = menu_id
+        self.name = name
+        self.price = to_decimal(price)
+        self.quantity = quantity
+
+    @property
+    def total(self):
+        return self.price * self.quantity
+
+    def __repr__(self):
+        return f"CartLine({self.menu_id!r}, {self.name!r}, {self.price!r}, {self.quantity!r})"
+
+class Cart:
+    """Shopping cart keyed by menu id.
+
+    Lookups and edits are O(1) per item; totals are exact Decimals computed
+    from the lines when asked for, never accumulated.
+    """
+
+    def __init__(self):
+        self._lines = {}
+
+    @classmethod
+    def from_items(cls, items):
+        """Build a cart from dicts with menu_id, name, price and quantity."""
+        cart = cls()
+        for item in items:
+            cart.add(item['menu_id'], item['name'], item['price'], item['quantity'])
+        return cart
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __bool__(self):
+        return bool(self._lines)
+
+    def __iter__(self):
+        return iter(list(self._lines.values()))
+
+    def __contains__(self, menu_id):
+        return menu_id in self._lines
+
+    def get(self, menu_id):
+        return self._lines.get(menu_id)
+
+    def quantity(self, menu_id):
+        line = self._lines.get(menu_id)
+        return line.quantity if line else 0
+
+    def add(self, menu_id, name, price, quantity=1):
+        """Add `quantity` of an item, on top of any already in the cart."""
+        line = self._lines.get(menu_id)
+        if line:
+            line.quantity += quantity
+        elif quantity > 0:
+            self._lines[menu_id] = CartLine(menu_id, name, price, quantity)
+
+    def update(self, menu_id, name, price, quantity):
+        """Set an item's quantity; zero or less removes it."""
+        if quantity <= 0:
+            self.remove(menu_id)
+            return
+        line = self._lines.get(menu_id)
+        if line:
+            line.name = name
+            line.price = to_decimal(price)
+            line.quantity = quantity
+        else:
+            self._lines[menu_id] = CartLine(menu_id, name, price, quantity)
+
+    def remove(self, menu_id):
+        self._lines.pop(menu_id, None)
+
+    def clear(self):
+        self._lines.clear()
+
+    @property
+    def item_count(self):
+        return sum(line.quantity for line in self._lines.values())
+
+    @property
+    def subtotal(self):
+        return sum((line.total for line in self._lines.values()), Decimal("0"))
+
+    def quantities(self):
+        """Quantities keyed by menu id."""
+        return {menu_id: line.quantity for menu_id, line in self._lines.items()}
+
+    def names(self):
+        """Item names keyed by menu id."""
+        return {menu_id: line.name for menu_id, line in self._lines.items()}
+
+    def to_records(self):
+        """Lines as JSON-safe dicts (price as a string); inverse of from_items."""
+        return [
+            {
+                "menu_id": line.menu_id,
+                "name": line.name,
+                "price": str(line.price),
+                "quantity": line.quantity,
+            }
+            for line in self._lines.values()
+        ]
+
+    def to_order_items(self):
+        """Lines as order item dicts (menu_id, name, quantity, price, total)."""
+        return [
+            {
+                "menu_id": line.menu_id,
+                "name": line.name,
+                "quantity": line.quantity,
+                "price": line.price,
+                "total": line.total,
+            }
+            for line in self._lines.values()
+        ]
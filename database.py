@@ -1,11 +1,25 @@
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, errorcode
+from mysql.connector.errors import PoolError
 import hashlib
-from datetime import datetime
+from datetime import datetime, date, timedelta
+from decimal import Decimal
 import uuid
+import argparse
+import json
 import logging
+import random
+import threading
+import time
+from collections import deque, OrderedDict, namedtuple
+from contextlib import contextmanager
 import pandas as pd
 
+from cart import Cart
+from search import MenuSearchIndex
+from promotions import Promotion, PromotionResult
+from debounce import DebouncedWriter
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -21,22 +35,428 @@ DB_CONFIG = {
     'database': 'cafeteria_db'  
 }
 
+# CONNECTION POOL CONFIGURATION
+POOL_CONFIG = {
+    'pool_size': 5,        # Connections kept open between requests
+    'max_overflow': 10,    # Extra connections allowed under load, closed on release
+    'timeout': 10,         # Seconds to wait for a free connection
+    'recycle': 1800,       # Reopen connections older than this (seconds)
+    'pre_ping': True       # Check liveness before handing out an idle connection
+}
+
+# CONNECTION POOL
+class PooledConnection:
+    """Proxy around a pooled MySQL connection; close() returns it to the pool."""
+
+    def __init__(self, pool, connection, created_at):
+        self._pool = pool
+        self._connection = connection
+        self._created_at = created_at
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise PoolError("Connection has already been returned to the pool")
+        return getattr(self._connection, name)
+
+    def close(self):
+        """Return the underlying connection to the pool."""
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            self._pool.release(connection, self._created_at)
+
+    def __del__(self):
+        # Safety net for code paths that never reach close()
+        if getattr(self, '_connection', None) is not None:
+            logger.warning("Pooled connection was garbage collected without close()")
+            self.close()
+
+
+class ConnectionPool:
+    """Thread-safe MySQL connection pool with overflow, timeout and recycling."""
+
+    def __init__(self, db_config, pool_size=5, max_overflow=10, timeout=10,
+                 recycle=1800, pre_ping=True):
+        self.db_config = dict(db_config)
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+
+        self._idle = deque()
+        self._cond = threading.Condition(threading.RLock())
+        self._opened = 0
+        self._checked_out = 0
+        self._waiting = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _open(self):
+        return mysql.connector.connect(**self.db_config), time.monotonic()
+
+    def _is_usable(self, connection, created_at):
+        """Return False for connections that are too old or no longer alive."""
+        if self.recycle and time.monotonic() - created_at > self.recycle:
+            return False
+        if self.pre_ping:
+            try:
+                connection.ping(reconnect=False)
+            except Error:
+                return False
+        return True
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Error:
+            pass
+
+    def acquire(self):
+        """Check out a connection, waiting up to `timeout` seconds for one to free up."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        connection, created_at = self._idle.pop()
+                        break
+                    if self._opened < self.pool_size + self.max_overflow:
+                        connection, created_at = None, None
+                        self._opened += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolError(
+                            f"Timed out after {self.timeout}s waiting for a database connection"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+            waited = time.monotonic() - started
+            self._checked_out += 1
+            self._checkouts += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+
+        try:
+            if connection is not None and not self._is_usable(connection, created_at):
+                self._discard(connection)
+                connection = None
+                with self._cond:
+                    self._recycled += 1
+            if connection is None:
+                connection, created_at = self._open()
+        except Error:
+            with self._cond:
+                self._opened -= 1
+                self._checked_out -= 1
+                self._cond.notify()
+            raise
+
+        return PooledConnection(self, connection, created_at)
+
+    def release(self, connection, created_at):
+        """Return a connection, rolling back anything left uncommitted."""
+        healthy = True
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except Error:
+            healthy = False
+
+        with self._cond:
+            self._checked_out -= 1
+            if healthy and len(self._idle) < self.pool_size:
+                self._idle.append((connection, created_at))
+                connection = None
+            else:
+                self._opened -= 1
+            self._cond.notify()
+
+        if connection is not None:
+            self._discard(connection)
+
+    def dispose(self):
+        """Close all idle connections; checked-out ones close when released."""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._opened -= len(idle)
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def stats(self):
+        """Snapshot of pool usage counters."""
+        with self._cond:
+            return {
+                'pool_size': self.pool_size,
+                'max_overflow': self.max_overflow,
+                'opened': self._opened,
+                'idle': len(self._idle),
+                'checked_out': self._checked_out,
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'recycled': self._recycled,
+                'total_wait_time': self._total_wait,
+                'avg_wait_time': self._total_wait / self._checkouts if self._checkouts else 0.0,
+                'max_wait_time': self._max_wait
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_CONFIG, **POOL_CONFIG)
+                logger.info(
+                    f"Connection pool created (size={POOL_CONFIG['pool_size']}, "
+                    f"overflow={POOL_CONFIG['max_overflow']})"
+                )
+    return _pool
+
+def get_pool_stats():
+    """Get connection pool statistics (checked-out, waiting, wait times)."""
+    return get_pool().stats()
+
 # DATABASE CONNECTION
 def get_connection():
-    """Create and return a database connection."""
+    """Check out a pooled database connection; close() returns it to the pool."""
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
+        return get_pool().acquire()
     except Error as e:
         logger.error(f"Error connecting to MySQL: {e}")
         return None
 
+# UNIT OF WORK
+class Session:
+    """One pooled connection and one transaction shared by several helpers.
+
+    Every helper accepts an optional `session`. Inside a session, helpers
+    defer commit/rollback to the outermost scope instead of finishing the
+    transaction themselves.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._depth = 1
+        self._rollback_only = False
+        self._on_commit = []
+
+    def cursor(self, **kwargs):
+        """Open a cursor on the session's connection."""
+        return self.connection.cursor(**kwargs)
+
+    def on_commit(self, callback):
+        """Run `callback` once the current transaction has been committed."""
+        self._on_commit.append(callback)
+
+    def commit(self):
+        """Commit now, or leave it to the outermost scope when nested."""
+        if self._depth <= 1 and not self._rollback_only:
+            self.connection.commit()
+            self._run_on_commit()
+
+    def rollback(self):
+        """Roll back now, or mark the whole unit of work for rollback when nested."""
+        if self._depth <= 1:
+            self.connection.rollback()
+            self._rollback_only = False
+            self._on_commit = []
+        else:
+            self._rollback_only = True
+
+    def _run_on_commit(self):
+        callbacks, self._on_commit = self._on_commit, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error in on-commit callback: {e}")
+
+    def _finish(self):
+        if self._rollback_only:
+            logger.warning("Unit of work marked for rollback; discarding changes")
+            self.connection.rollback()
+            self._on_commit = []
+        else:
+            self.connection.commit()
+            self._run_on_commit()
+
+
+@contextmanager
+def session():
+    """Open a unit of work: `with session() as s:` then pass `session=s` to helpers.
+
+    Commits when the block exits and rolls back if it raises.
+    """
+    connection = get_connection()
+    if not connection:
+        raise PoolError("Database connection failed")
+
+    s = Session(connection)
+    try:
+        yield s
+    except Exception:
+        connection.rollback()
+        s._on_commit = []
+        raise
+    except BaseException:
+        # st.rerun() and st.stop() unwind the script with BaseException
+        # subclasses; the work done before them should still be kept.
+        s._finish()
+        raise
+    else:
+        s._finish()
+    finally:
+        connection.close()
+
+
+@contextmanager
+def _scope(existing=None):
+    """Join `existing` if given, otherwise own a connection for one helper call.
+
+    Yields None when no connection could be obtained.
+    """
+    if existing is not None:
+        existing._depth += 1
+        try:
+            yield existing
+        finally:
+            existing._depth -= 1
+        return
+
+    connection = get_connection()
+    if not connection:
+        yield None
+        return
+
+    try:
+        yield Session(connection)
+    finally:
+        connection.close()
+
 # PASSWORD HASHING
 def hash_password(password):
     """Hash password using SHA-256."""
     return hashlib.sha256(password.encode()).hexdigest()
 
 # DATABASE INITIALIZATION
+def _index_exists(cursor, table, index_name):
+    cursor.execute(
+        """SELECT COUNT(*) FROM information_schema.statistics
+           WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s""",
+        (table, index_name)
+    )
+    return cursor.fetchone()[0] > 0
+
+def _ensure_index(cursor, table, index_name, columns, unique=False):
+    """Add an index to an existing table if it is missing."""
+    if not _index_exists(cursor, table, index_name):
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        cursor.execute(f"ALTER TABLE {table} ADD {kind} {index_name} {columns}")
+        logger.info(f"Added index {index_name} on {table}")
+
+def _ensure_foreign_key(cursor, table, name, definition):
+    """Add a foreign key constraint to an existing table if it is missing."""
+    cursor.execute(
+        """SELECT COUNT(*) FROM information_schema.table_constraints
+           WHERE table_schema = DATABASE() AND table_name = %s
+             AND constraint_name = %s AND constraint_type = 'FOREIGN KEY'""",
+        (table, name)
+    )
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY {definition}")
+        logger.info(f"Added foreign key {name} on {table}")
+
+def _column_nullable(cursor, table, column):
+    cursor.execute(
+        """SELECT is_nullable FROM information_schema.columns
+           WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s""",
+        (table, column)
+    )
+    return cursor.fetchone()[0] == 'YES'
+
+def _migration_applied(cursor, name):
+    cursor.execute("SELECT COUNT(*) FROM schema_migrations WHERE name = %s", (name,))
+    return cursor.fetchone()[0] > 0
+
+def _mark_migration(cursor, name):
+    """Record a data migration; commits together with the statements before it."""
+    cursor.execute("INSERT IGNORE INTO schema_migrations (name) VALUES (%s)", (name,))
+
+def _column_exists(cursor, table, column):
+    cursor.execute(
+        """SELECT COUNT(*) FROM information_schema.columns
+           WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s""",
+        (table, column)
+    )
+    return cursor.fetchone()[0] > 0
+
+def _ensure_column(cursor, table, column, definition):
+    """Add a column to an existing table if it is missing."""
+    if not _column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        logger.info(f"Added column {column} to {table}")
+
+def _migrate_to_menu_ids(cursor):
+    """Move order_items and favorites from item-name references to menu ids.
+
+    order_items keeps item_name as the name at the time of sale; favorites
+    drop it and read the current name through the menu. ALTERs commit on
+    their own, so every step checks the current schema and a run that was
+    interrupted part-way is finished by the next startup.
+    """
+    # order_items: add the reference, then link existing rows exactly once
+    _ensure_column(cursor, 'order_items', 'menu_id', "INT NULL AFTER order_id")
+    _ensure_index(cursor, 'order_items', 'idx_menu_id', '(menu_id)')
+    _ensure_foreign_key(cursor, 'order_items', 'fk_order_items_menu',
+                        "(menu_id) REFERENCES menu(id) ON DELETE SET NULL")
+    if not _migration_applied(cursor, 'order_items_menu_id_backfill'):
+        cursor.execute("""
+            UPDATE order_items i JOIN menu m ON m.item_name = i.item_name
+            SET i.menu_id = m.id
+            WHERE i.menu_id IS NULL
+        """)
+        logger.info(f"Linked {cursor.rowcount} order items to menu ids")
+        _mark_migration(cursor, 'order_items_menu_id_backfill')
+
+    # favorites: the item_name column stays until the ids are in place, so
+    # the backfill can be repeated until it is dropped
+    if _column_exists(cursor, 'favorites', 'item_name'):
+        _ensure_column(cursor, 'favorites', 'menu_id', "INT NULL AFTER username")
+        cursor.execute("""
+            UPDATE favorites f JOIN menu m ON m.item_name = f.item_name
+            SET f.menu_id = m.id
+            WHERE f.menu_id IS NULL
+        """)
+        # Favorites of items that no longer exist were already invisible
+        cursor.execute("DELETE FROM favorites WHERE menu_id IS NULL")
+
+    if _column_nullable(cursor, 'favorites', 'menu_id'):
+        cursor.execute("ALTER TABLE favorites MODIFY menu_id INT NOT NULL")
+    _ensure_index(cursor, 'favorites', 'unique_user_item', '(username, menu_id)', unique=True)
+    _ensure_foreign_key(cursor, 'favorites', 'fk_favorites_menu',
+                        "(menu_id) REFERENCES menu(id) ON DELETE CASCADE")
+
+    if _index_exists(cursor, 'favorites', 'unique_favorite'):
+        cursor.execute("ALTER TABLE favorites DROP INDEX unique_favorite")
+    if _column_exists(cursor, 'favorites', 'item_name'):
+        cursor.execute("ALTER TABLE favorites DROP COLUMN item_name")
+        logger.info("Migrated favorites to menu ids")
+
 def initialize_database():
     """Create database and tables if they don't exist."""
     try:
@@ -72,10 +492,12 @@ def initialize_database():
                 category VARCHAR(50) NOT NULL,
                 price DECIMAL(10, 2) NOT NULL,
                 stock INT NOT NULL DEFAULT 0,
+                low_stock_threshold INT NOT NULL DEFAULT 10,
                 is_available BOOLEAN DEFAULT TRUE,
                 description TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                INDEX idx_item_name (item_name),
                 INDEX idx_category (category),
                 INDEX idx_availability (is_available)
             )
@@ -88,6 +510,8 @@ def initialize_database():
                 order_reference VARCHAR(50) UNIQUE NOT NULL,
                 username VARCHAR(50) NOT NULL,
                 total_amount DECIMAL(10, 2) NOT NULL,
+                discount_code VARCHAR(30) NULL,
+                discount_amount DECIMAL(10, 2) NOT NULL DEFAULT 0,
                 payment_mode VARCHAR(20) NOT NULL,
                 status ENUM('Pending', 'Preparing', 'Ready', 'Completed', 'Cancelled') DEFAULT 'Pending',
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -96,7 +520,8 @@ def initialize_database():
                 INDEX idx_username (username),
                 INDEX idx_status (status),
                 INDEX idx_created_at (created_at),
-                INDEX idx_order_ref (order_reference)
+                INDEX idx_order_ref (order_reference),
+                INDEX idx_username_created (username, created_at)
             )
         """)
 
@@ -105,12 +530,15 @@ def initialize_database():
             CREATE TABLE IF NOT EXISTS order_items (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 order_id INT NOT NULL,
+                menu_id INT NULL,
                 item_name VARCHAR(100) NOT NULL,
                 quantity INT NOT NULL,
                 price DECIMAL(10, 2) NOT NULL,
                 total DECIMAL(10, 2) NOT NULL,
                 FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
-                INDEX idx_order_id (order_id)
+                CONSTRAINT fk_order_items_menu FOREIGN KEY (menu_id) REFERENCES menu(id) ON DELETE SET NULL,
+                INDEX idx_order_id (order_id),
+                INDEX idx_menu_id (menu_id)
             )
         """)
 
@@ -130,10 +558,11 @@ def initialize_database():
             CREATE TABLE IF NOT EXISTS favorites (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 username VARCHAR(50) NOT NULL,
-                item_name VARCHAR(100) NOT NULL,
+                menu_id INT NOT NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE KEY unique_favorite (username, item_name),
-                FOREIGN KEY (username) REFERENCES users(username) ON UPDATE CASCADE
+                UNIQUE KEY unique_user_item (username, menu_id),
+                FOREIGN KEY (username) REFERENCES users(username) ON UPDATE CASCADE,
+                CONSTRAINT fk_favorites_menu FOREIGN KEY (menu_id) REFERENCES menu(id) ON DELETE CASCADE
             )
         """)
 
@@ -149,8 +578,161 @@ def initialize_database():
             )
         """)
 
+        # Stock held between checkout and payment
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stock_reservations (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                reservation_reference VARCHAR(50) NOT NULL,
+                menu_id INT NOT NULL,
+                quantity INT NOT NULL,
+                expires_at DATETIME NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE KEY unique_reservation_item (reservation_reference, menu_id),
+                INDEX idx_menu_expiry (menu_id, expires_at),
+                INDEX idx_expires_at (expires_at),
+                FOREIGN KEY (menu_id) REFERENCES menu(id) ON DELETE CASCADE
+            )
+        """)
+
+        # Incrementally maintained dashboard counters, split over STATS_SHARDS
+        # rows (per day, and for the running totals) so concurrent checkouts
+        # rarely wait on the same row
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS daily_stats (
+                stat_date DATE NOT NULL,
+                shard TINYINT NOT NULL DEFAULT 0,
+                orders_count INT NOT NULL DEFAULT 0,
+                revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+                new_customers INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (stat_date, shard)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stats_totals (
+                shard TINYINT PRIMARY KEY,
+                total_orders INT NOT NULL DEFAULT 0,
+                total_customers INT NOT NULL DEFAULT 0
+            )
+        """)
+
+        # Pre-aggregated sales, per payment mode
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sales_hourly (
+                bucket_start DATETIME NOT NULL,
+                payment_mode VARCHAR(20) NOT NULL,
+                orders_count INT NOT NULL DEFAULT 0,
+                revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+                items_sold INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (bucket_start, payment_mode)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sales_daily (
+                sales_date DATE NOT NULL,
+                payment_mode VARCHAR(20) NOT NULL,
+                orders_count INT NOT NULL DEFAULT 0,
+                revenue DECIMAL(12, 2) NOT NULL DEFAULT 0,
+                items_sold INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (sales_date, payment_mode)
+            )
+        """)
+
+        # Saved carts, restored at login
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS carts (
+                username VARCHAR(50) PRIMARY KEY,
+                items JSON NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                FOREIGN KEY (username) REFERENCES users(username) ON UPDATE CASCADE ON DELETE CASCADE
+            )
+        """)
+
+        # Discount codes and who redeemed them
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS promotions (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                code VARCHAR(30) UNIQUE NOT NULL,
+                description VARCHAR(255),
+                discount_percent DECIMAL(5, 2) NOT NULL,
+                max_discount DECIMAL(10, 2) NULL,
+                min_basket DECIMAL(10, 2) NOT NULL DEFAULT 0,
+                category VARCHAR(50) NULL,
+                menu_id INT NULL,
+                valid_from DATETIME NULL,
+                valid_until DATETIME NULL,
+                uses_remaining INT NULL,
+                per_user_limit INT NULL,
+                is_active BOOLEAN DEFAULT TRUE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                CONSTRAINT fk_promotions_menu FOREIGN KEY (menu_id) REFERENCES menu(id) ON DELETE SET NULL
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS promotion_redemptions (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                promotion_id INT NOT NULL,
+                username VARCHAR(50) NOT NULL,
+                order_id INT NOT NULL,
+                discount_amount DECIMAL(10, 2) NOT NULL,
+                redeemed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_promotion_user (promotion_id, username),
+                FOREIGN KEY (promotion_id) REFERENCES promotions(id) ON DELETE CASCADE,
+                FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE
+            )
+        """)
+
+        # Active low-stock alerts, one row per item at or below its threshold
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS low_stock_alerts (
+                menu_id INT PRIMARY KEY,
+                stock INT NOT NULL,
+                threshold INT NOT NULL,
+                raised_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                FOREIGN KEY (menu_id) REFERENCES menu(id) ON DELETE CASCADE
+            )
+        """)
+
+        # Upgrade databases created before these indexes and columns existed
+        _ensure_index(cursor, 'orders', 'idx_username_created', '(username, created_at)')
+        _ensure_index(cursor, 'menu', 'idx_item_name', '(item_name)')
+        _ensure_column(cursor, 'menu', 'low_stock_threshold',
+                       f"INT NOT NULL DEFAULT {LOW_STOCK_THRESHOLD} AFTER stock")
+        _ensure_column(cursor, 'orders', 'discount_code', "VARCHAR(30) NULL AFTER total_amount")
+        _ensure_column(cursor, 'orders', 'discount_amount',
+                       "DECIMAL(10, 2) NOT NULL DEFAULT 0 AFTER discount_code")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name VARCHAR(100) PRIMARY KEY,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        _migrate_to_menu_ids(cursor)
+
         connection.commit()
 
+        # Backfill dashboard counters the first time they are created
+        cursor.execute("""
+            SELECT NOT EXISTS(SELECT 1 FROM stats_totals)
+                   AND (EXISTS(SELECT 1 FROM orders) OR EXISTS(SELECT 1 FROM users WHERE role = 'Customer'))
+        """)
+        if cursor.fetchone()[0]:
+            _rebuild_dashboard_stats(cursor)
+            connection.commit()
+            logger.info("Dashboard statistics backfilled from existing data")
+
+        # Backfill sales rollups for databases that already have orders
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM sales_hourly), EXISTS(SELECT 1 FROM orders)")
+        has_rollups, has_orders = cursor.fetchone()
+        if has_orders and not has_rollups:
+            _rebuild_sales_rollups(cursor)
+            connection.commit()
+            logger.info("Sales rollups backfilled from existing orders")
+
         # Insert default admin if not exists
         cursor.execute("SELECT * FROM users WHERE username = 'admin'")
         if not cursor.fetchone():
@@ -182,6 +764,25 @@ def initialize_database():
             connection.commit()
             logger.info("Sample menu items added successfully")
 
+        # Seed the discount codes the app used to hard-code
+        cursor.execute("SELECT COUNT(*) FROM promotions")
+        if cursor.fetchone()[0] == 0:
+            cursor.executemany(
+                "INSERT INTO promotions (code, description, discount_percent) VALUES (%s, %s, %s)",
+                [
+                    ('WELCOME10', 'Welcome offer', 10),
+                    ('STUDENT20', 'Student discount', 20),
+                    ('FREESHIP', 'Free service charge', 5),
+                    ('SAVE15', 'Save 15%', 15),
+                ]
+            )
+            connection.commit()
+            logger.info("Default promotions added successfully")
+
+        # Reconcile alerts with current stock (covers upgrades and manual edits)
+        _sync_low_stock_alerts(cursor)
+        connection.commit()
+
         cursor.close()
         connection.close()
         logger.info("✓ Database initialized successfully!")
@@ -192,269 +793,866 @@ def initialize_database():
         return False
 
 # USER MANAGEMENT FUNCTIONS
-def add_user(username, password, role='Customer', email=None, phone=None):
+def add_user(username, password, role='Customer', email=None, phone=None, session=None):
     """Add a new user to the database."""
-    connection = get_connection()
-    if not connection:
-        logger.error("Database connection failed while adding user")
-        return False, "Database connection failed"
-
-    try:
-        cursor = connection.cursor()
-        hashed_password = hash_password(password)
-        cursor.execute(
-            "INSERT INTO users (username, password, role, email, phone) VALUES (%s, %s, %s, %s, %s)",
-            (username, hashed_password, role, email, phone)
-        )
-        connection.commit()
-        cursor.close()
-        connection.close()
-        logger.info(f"User '{username}' added successfully with role '{role}'")
-        return True, "User added successfully"
-    except Error as e:
-        logger.error(f"Error adding user '{username}': {e}")
-        if "Duplicate entry" in str(e):
-            return False, "Username already exists"
-        return False, "Failed to create user account"
-
-def validate_user(username, password):
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while adding user")
+            return False, "Database connection failed"
+
+        try:
+            cursor = s.cursor()
+            hashed_password = hash_password(password)
+            cursor.execute(
+                "INSERT INTO users (username, password, role, email, phone) VALUES (%s, %s, %s, %s, %s)",
+                (username, hashed_password, role, email, phone)
+            )
+            if role == 'Customer':
+                _record_new_customer(cursor)
+            s.commit()
+            cursor.close()
+            logger.info(f"User '{username}' added successfully with role '{role}'")
+            return True, "User added successfully"
+        except Error as e:
+            s.rollback()
+            logger.error(f"Error adding user '{username}': {e}")
+            if "Duplicate entry" in str(e):
+                return False, "Username already exists"
+            return False, "Failed to create user account"
+
+def validate_user(username, password, session=None):
     """Validate user credentials and return role."""
-    connection = get_connection()
-    if not connection:
-        logger.error("Database connection failed during user validation")
-        return None
-
-    try:
-        cursor = connection.cursor()
-        hashed_password = hash_password(password)
-        cursor.execute(
-            "SELECT role FROM users WHERE username = %s AND password = %s",
-            (username, hashed_password)
-        )
-        result = cursor.fetchone()
-        cursor.close()
-        connection.close()
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed during user validation")
+            return None
+
+        try:
+            cursor = s.cursor()
+            hashed_password = hash_password(password)
+            cursor.execute(
+                "SELECT role FROM users WHERE username = %s AND password = %s",
+                (username, hashed_password)
+            )
+            result = cursor.fetchone()
+            cursor.close()
 
-        if result:
-            logger.info(f"User '{username}' validated successfully as '{result[0]}'")
-            return result[0]
-        logger.warning(f"Failed login attempt for username: '{username}'")
-        return None
-    except Error as e:
-        logger.error(f"Error validating user '{username}': {e}")
-        return None
+            if result:
+                logger.info(f"User '{username}' validated successfully as '{result[0]}'")
+                return result[0]
+            logger.warning(f"Failed login attempt for username: '{username}'")
+            return None
+        except Error as e:
+            logger.error(f"Error validating user '{username}': {e}")
+            return None
 
-def user_exists(username):
+def user_exists(username, session=None):
     """Check if username already exists."""
-    connection = get_connection()
-    if not connection:
-        logger.error("Database connection failed while checking user existence")
-        return False
-
-    try:
-        cursor = connection.cursor()
-        cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
-        result = cursor.fetchone()
-        cursor.close()
-        connection.close()
-        exists = result is not None
-        logger.info(f"User existence check for '{username}': {exists}")
-        return exists
-    except Error as e:
-        logger.error(f"Error checking if user '{username}' exists: {e}")
-        return False
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while checking user existence")
+            return False
+
+        try:
+            cursor = s.cursor()
+            cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
+            result = cursor.fetchone()
+            cursor.close()
+            exists = result is not None
+            logger.info(f"User existence check for '{username}': {exists}")
+            return exists
+        except Error as e:
+            logger.error(f"Error checking if user '{username}' exists: {e}")
+            return False
 
 # MENU MANAGEMENT FUNCTIONS
-def get_menu(available_only=False):
-    """Fetch all menu items."""
-    connection = get_connection()
-    if not connection:
-        logger.error("Database connection failed while fetching menu")
-        return []
+LOW_STOCK_THRESHOLD = 10  # Default per-item low-stock alert threshold
 
-    try:
-        cursor = connection.cursor(dictionary=True)
-        query = "SELECT * FROM menu"
-        if available_only:
-            query += " WHERE is_available = TRUE AND stock > 0"
-        query += " ORDER BY category, item_name"
+def get_menu(available_only=False, session=None):
+    """Fetch all menu items."""
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while fetching menu")
+            return []
+
+        try:
+            cursor = s.cursor(dictionary=True)
+            if available_only:
+                # Customers see stock net of live reservations
+                query = """
+                    SELECT m.id, m.item_name, m.category, m.price,
+                           m.stock - COALESCE(h.held, 0) AS stock,
+                           m.is_available, m.description, m.created_at, m.updated_at
+                    FROM menu m
+                    LEFT JOIN (
+                        SELECT menu_id, CAST(SUM(quantity) AS SIGNED) AS held
+                        FROM stock_reservations
+                        WHERE expires_at > NOW()
+                        GROUP BY menu_id
+                    ) h ON h.menu_id = m.id
+                    WHERE m.is_available = TRUE AND m.stock - COALESCE(h.held, 0) > 0
+                """
+            else:
+                query = "SELECT * FROM menu"
+            query += " ORDER BY category, item_name"
        
-        cursor.execute(query)
-        items = cursor.fetchall()
+            cursor.execute(query)
+            items = cursor.fetchall()
        
-        # Convert Decimal to float for all price fields
-        for item in items:
-            if 'price' in item:
-                item['price'] = float(item['price'])
+            # Convert Decimal to float for all price fields
+            for item in items:
+                if 'price' in item:
+                    item['price'] = float(item['price'])
        
-        cursor.close()
-        connection.close()
-        logger.info(f"Fetched {len(items)} menu items (available_only={available_only})")
-        return items
-    except Error as e:
-        logger.error(f"Error fetching menu: {e}")
-        return []
+            cursor.close()
+            logger.info(f"Fetched {len(items)} menu items (available_only={available_only})")
+            return items
+        except Error as e:
+            logger.error(f"Error fetching menu: {e}")
+            return []
 
-def get_menu_df():
-    """Get menu as pandas DataFrame for Streamlit."""
-    menu_items = get_menu(available_only=True)
-   
-    if not menu_items:
-        logger.warning("No menu items found, returning default menu")
-        return pd.DataFrame({
-            "Items": ["Dal Chawal", "Thali", "Half Thali", "Gulab Jamun", "Samosa", "Chai", "Coffee", "Sandwich"],
-            "Category": ["Food", "Food", "Food", "Dessert", "Snack", "Beverage", "Beverage", "Snack"],
-            "Price (₹)": [50.0, 80.0, 40.0, 15.0, 20.0, 10.0, 15.0, 30.0],
-            "Stock": [10, 5, 20, 15, 25, 50, 30, 12],
-        })
-   
-    df = pd.DataFrame(menu_items)
-    df = df.rename(columns={
-        'item_name': 'Items',
-        'category': 'Category',
-        'price': 'Price (₹)',
-        'stock': 'Stock'
+# MENU CACHE
+MENU_CACHE_TTL = 30  # Seconds; backstop for menu writes made by other processes
+
+MenuSnapshot = namedtuple(
+    'MenuSnapshot', ['version', 'loaded_at', 'items', 'df', 'search', 'by_id', 'by_category']
+)
+
+_menu_version = 0
+_menu_snapshot = None
+_menu_version_lock = threading.Lock()
+_menu_load_lock = threading.Lock()
+
+def bump_menu_version():
+    """Invalidate the cached menu snapshot after a menu or stock change."""
+    global _menu_version
+    with _menu_version_lock:
+        _menu_version += 1
+
+def get_menu_version():
+    """Current menu version; changes whenever this process writes menu or stock."""
+    return _menu_version
+
+def _build_menu_df(items):
+    return pd.DataFrame({
+        "ID": [item['id'] for item in items],
+        "Items": [item['item_name'] for item in items],
+        "Category": [item['category'] for item in items],
+        "Price (₹)": [float(item['price']) for item in items],
+        "Stock": [item['stock'] for item in items],
+        "Description": [item.get('description') or '' for item in items]
     })
-    return df[['Items', 'Category', 'Price (₹)', 'Stock']]
 
-def add_menu_item(item_name, category, price, stock, description=None):
-    """Add a new menu item."""
-    connection = get_connection()
-    if not connection:
-        logger.error("Database connection failed while adding menu item")
-        return False, "Database connection failed"
+def get_menu_snapshot():
+    """Get the available menu as a cached, read-only snapshot.
+
+    Reloads from MySQL only when the menu version changed or the snapshot is
+    older than MENU_CACHE_TTL.
+    """
+    snapshot = _menu_snapshot
+    if (snapshot is not None and snapshot.version == _menu_version
+            and time.monotonic() - snapshot.loaded_at < MENU_CACHE_TTL):
+        return snapshot
+
+    # Only one thread reloads; the others reuse its result
+    with _menu_load_lock:
+        return _reload_menu_snapshot()
+
+def _reload_menu_snapshot():
+    global _menu_snapshot
+    snapshot = _menu_snapshot
+    version = _menu_version
+    if (snapshot is not None and snapshot.version == version
+            and time.monotonic() - snapshot.loaded_at < MENU_CACHE_TTL):
+        return snapshot
+
+    items = get_menu(available_only=True)
+    by_category = {}
+    for item in items:
+        by_category.setdefault(item['category'], []).append(item)
+    snapshot = MenuSnapshot(
+        version, time.monotonic(), items, _build_menu_df(items), MenuSearchIndex(items),
+        {item['id']: item for item in items}, by_category
+    )
+    _menu_snapshot = snapshot
+    logger.info(f"Menu snapshot refreshed (version={version}, items={len(items)})")
+    return snapshot
 
-    try:
-        cursor = connection.cursor()
-        cursor.execute(
-            "INSERT INTO menu (item_name, category, price, stock, description) VALUES (%s, %s, %s, %s, %s)",
-            (item_name, category, price, stock, description)
-        )
-        connection.commit()
-        cursor.close()
-        connection.close()
-        logger.info(f"Menu item '{item_name}' added successfully")
-        return True, "Menu item added successfully"
-    except Error as e:
-        logger.error(f"Error adding menu item '{item_name}': {e}")
-        return False, "Failed to add menu item"
+def get_menu_df():
+    """Get the available menu as a pandas DataFrame (cached; treat as read-only)."""
+    return get_menu_snapshot().df
 
-def update_menu_item(item_id, item_name, category, price, stock, is_available=True, description=None):
-    """Update an existing menu item."""
-    connection = get_connection()
-    if not connection:
-        logger.error("Database connection failed while updating menu item")
-        return False, "Database connection failed"
+def add_menu_item(item_name, category, price, stock, description=None,
+                  low_stock_threshold=LOW_STOCK_THRESHOLD, session=None):
+    """Add a new menu item."""
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while adding menu item")
+            return False, "Database connection failed"
 
-    try:
-        cursor = connection.cursor()
-        cursor.execute(
-            """UPDATE menu SET item_name = %s, category = %s, price = %s,
-               stock = %s, is_available = %s, description = %s WHERE id = %s""",
-            (item_name, category, price, stock, is_available, description, item_id)
-        )
-        connection.commit()
-        affected_rows = cursor.rowcount
-        cursor.close()
-        connection.close()
+        try:
+            cursor = s.cursor()
+            cursor.execute(
+                """INSERT INTO menu (item_name, category, price, stock, low_stock_threshold, description)
+                   VALUES (%s, %s, %s, %s, %s, %s)""",
+                (item_name, category, price, stock, low_stock_threshold, description)
+            )
+            _sync_low_stock_alerts(cursor, [cursor.lastrowid])
+            s.on_commit(bump_menu_version)
+            s.commit()
+            cursor.close()
+            logger.info(f"Menu item '{item_name}' added successfully")
+            return True, "Menu item added successfully"
+        except Error as e:
+            s.rollback()
+            logger.error(f"Error adding menu item '{item_name}': {e}")
+            return False, "Failed to add menu item"
+
+def update_menu_item(item_id, item_name, category, price, stock, is_available=True, description=None,
+                     low_stock_threshold=None, session=None):
+    """Update an existing menu item.
+
+    `low_stock_threshold` of None keeps the item's current threshold.
+    """
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while updating menu item")
+            return False, "Database connection failed"
+
+        try:
+            cursor = s.cursor()
+            cursor.execute(
+                """UPDATE menu SET item_name = %s, category = %s, price = %s, stock = %s,
+                   low_stock_threshold = COALESCE(%s, low_stock_threshold),
+                   is_available = %s, description = %s WHERE id = %s""",
+                (item_name, category, price, stock, low_stock_threshold, is_available, description, item_id)
+            )
+            affected_rows = cursor.rowcount
+            _sync_low_stock_alerts(cursor, [item_id])
+            s.on_commit(bump_menu_version)
+            s.commit()
+            cursor.close()
        
-        if affected_rows > 0:
-            logger.info(f"Menu item ID {item_id} updated successfully")
-            return True, "Menu item updated successfully"
-        else:
-            logger.warning(f"No menu item found with ID {item_id}")
-            return False, "Menu item not found"
-    except Error as e:
-        logger.error(f"Error updating menu item ID {item_id}: {e}")
-        return False, "Failed to update menu item"
-
-def delete_menu_item(item_id):
+            if affected_rows > 0:
+                logger.info(f"Menu item ID {item_id} updated successfully")
+                return True, "Menu item updated successfully"
+            else:
+                logger.warning(f"No menu item found with ID {item_id}")
+                return False, "Menu item not found"
+        except Error as e:
+            s.rollback()
+            logger.error(f"Error updating menu item ID {item_id}: {e}")
+            return False, "Failed to update menu item"
+
+def _deactivate_item_promotions(s, cursor, item_ids):
+    """Switch off promotions scoped to items about to be deleted.
+
+    The delete sets their menu_id to NULL, which would otherwise turn an
+    item discount into a whole-order one. The rows and their redemption
+    history are kept.
+    """
+    placeholders = ", ".join(["%s"] * len(item_ids))
+    cursor.execute(
+        f"""UPDATE promotions SET is_active = FALSE
+            WHERE menu_id IN ({placeholders}) AND is_active = TRUE""",
+        list(item_ids)
+    )
+    if cursor.rowcount > 0:
+        s.on_commit(bump_promotion_version)
+
+def delete_menu_item(item_id, session=None):
     """Delete a menu item."""
-    connection = get_connection()
-    if not connection:
-        logger.error("Database connection failed while deleting menu item")
-        return False, "Database connection failed"
-
-    try:
-        cursor = connection.cursor()
-        cursor.execute("DELETE FROM menu WHERE id = %s", (item_id,))
-        connection.commit()
-        affected_rows = cursor.rowcount
-        cursor.close()
-        connection.close()
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while deleting menu item")
+            return False, "Database connection failed"
+
+        try:
+            cursor = s.cursor()
+            _deactivate_item_promotions(s, cursor, [item_id])
+            cursor.execute("DELETE FROM menu WHERE id = %s", (item_id,))
+            s.on_commit(bump_menu_version)
+            s.commit()
+            affected_rows = cursor.rowcount
+            cursor.close()
        
-        if affected_rows > 0:
-            logger.info(f"Menu item ID {item_id} deleted successfully")
-            return True, "Menu item deleted successfully"
-        else:
-            logger.warning(f"No menu item found with ID {item_id}")
-            return False, "Menu item not found"
-    except Error as e:
-        logger.error(f"Error deleting menu item ID {item_id}: {e}")
-        return False, "Failed to delete menu item"
+            if affected_rows > 0:
+                logger.info(f"Menu item ID {item_id} deleted successfully")
+                return True, "Menu item deleted successfully"
+            else:
+                logger.warning(f"No menu item found with ID {item_id}")
+                return False, "Menu item not found"
+        except Error as e:
+            s.rollback()
+            logger.error(f"Error deleting menu item ID {item_id}: {e}")
+            return False, "Failed to delete menu item"
+
+def update_menu_items(items, session=None):
+    """Apply many menu edits in one transaction.
+
+    `items` are dicts with id, item_name, category, price, stock_delta,
+    low_stock_threshold, is_available and description. Stock is adjusted by
+    `stock_delta` rather than overwritten, so sales made since the caller
+    read the menu are kept.
+    """
+    if not items:
+        return True, "No changes to save"
+
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while updating menu items")
+            return False, "Database connection failed"
+
+        try:
+            cursor = s.cursor()
+            cursor.executemany(
+                """UPDATE menu SET item_name = %s, category = %s, price = %s, stock = GREATEST(stock + %s, 0),
+                   low_stock_threshold = %s, is_available = %s, description = %s WHERE id = %s""",
+                [(item['item_name'], item['category'], item['price'], item['stock_delta'],
+                  item['low_stock_threshold'], item['is_available'], item['description'], item['id'])
+                 for item in items]
+            )
+            _sync_low_stock_alerts(cursor, [item['id'] for item in items])
+            s.on_commit(bump_menu_version)
+            s.commit()
+            cursor.close()
+            logger.info(f"Updated {len(items)} menu items")
+            return True, f"Updated {len(items)} menu items"
+        except Error as e:
+            s.rollback()
+            logger.error(f"Error updating {len(items)} menu items: {e}")
+            return False, "Failed to update menu items"
+
+def delete_menu_items(item_ids, session=None):
+    """Delete several menu items with one statement."""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return True, "No items to delete"
+
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while deleting menu items")
+            return False, "Database connection failed"
+
+        try:
+            cursor = s.cursor()
+            placeholders = ", ".join(["%s"] * len(item_ids))
+            _deactivate_item_promotions(s, cursor, item_ids)
+            cursor.execute(f"DELETE FROM menu WHERE id IN ({placeholders})", item_ids)
+            deleted = cursor.rowcount
+            s.on_commit(bump_menu_version)
+            s.commit()
+            cursor.close()
+            logger.info(f"Deleted {deleted} menu items")
+            return True, f"Deleted {deleted} menu items"
+        except Error as e:
+            s.rollback()
+            logger.error(f"Error deleting menu items {item_ids}: {e}")
+            return False, "Failed to delete menu items"
+
+def upsert_menu_items(rows, session=None):
+    """Insert or update many menu items in one transaction.
+
+    Rows with an id update that item and rows without one are inserted.
+    Fields left as None keep the current value (new items default to no
+    stock, the default alert threshold and available). `stock_delta` adjusts
+    the stock read under lock, so concurrent sales are not lost. Returns
+    (success, message).
+    """
+    if not rows:
+        return True, "Nothing to import"
+
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while importing menu items")
+            return False, "Database connection failed"
+
+        try:
+            cursor = s.cursor(dictionary=True)
+
+            existing_ids = [row['id'] for row in rows if row['id'] is not None]
+            current = {}
+            if existing_ids:
+                placeholders = ", ".join(["%s"] * len(existing_ids))
+                cursor.execute(
+                    f"""SELECT id, item_name, category, price, stock, low_stock_threshold,
+                               is_available, description
+                        FROM menu WHERE id IN ({placeholders}) FOR UPDATE""",
+                    existing_ids
+                )
+                current = {item['id']: item for item in cursor.fetchall()}
+
+            missing = [menu_id for menu_id in existing_ids if menu_id not in current]
+            if missing:
+                s.rollback()
+                logger.warning(f"Menu import references deleted items {missing}")
+                return False, f"Menu items {missing} were deleted; reload and try again"
+
+            # New rows get ids above the current maximum; remember it to find them afterwards
+            inserted = len(rows) - len(existing_ids)
+            if inserted:
+                cursor.execute("SELECT COALESCE(MAX(id), 0) AS max_id FROM menu")
+                max_id = cursor.fetchone()['max_id']
+
+            defaults = {'stock': 0, 'low_stock_threshold': LOW_STOCK_THRESHOLD,
+                        'is_available': True, 'description': None}
+            fields = ['item_name', 'category', 'price', 'low_stock_threshold', 'is_available', 'description']
+            values = []
+            for row in rows:
+                base = current.get(row['id'], defaults)
+                merged = {field: row[field] if row.get(field) is not None else base.get(field) for field in fields}
+                stock = row['stock'] if row.get('stock') is not None else base['stock']
+                if row.get('stock_delta') is not None:
+                    stock = max(stock + row['stock_delta'], 0)
+                values.append((row['id'], merged['item_name'], merged['category'], merged['price'], stock,
+                               merged['low_stock_threshold'], merged['is_available'], merged['description']))
+
+            # Sent as multi-row INSERTs; existing ids hit the primary key and update
+            cursor.executemany(
+                """INSERT INTO menu (id, item_name, category, price, stock, low_stock_threshold,
+                                     is_available, description)
+                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                   ON DUPLICATE KEY UPDATE item_name = VALUES(item_name), category = VALUES(category),
+                       price = VALUES(price), stock = VALUES(stock),
+                       low_stock_threshold = VALUES(low_stock_threshold),
+                       is_available = VALUES(is_available), description = VALUES(description)""",
+                values
+            )
+            changed_ids = list(existing_ids)
+            if inserted:
+                cursor.execute("SELECT id FROM menu WHERE id > %s", (max_id,))
+                changed_ids.extend(row['id'] for row in cursor.fetchall())
+            _sync_low_stock_alerts(cursor, changed_ids)
+            s.on_commit(bump_menu_version)
+            s.commit()
+            cursor.close()
 
-def check_stock_availability(item_name, quantity):
+            logger.info(f"Menu import applied: {len(existing_ids)} updated, {inserted} added")
+            return True, f"Imported {len(rows)} items ({len(existing_ids)} updated, {inserted} added)"
+        except Error as e:
+            s.rollback()
+            logger.error(f"Error importing {len(rows)} menu items: {e}")
+            return False, "Failed to import menu items"
+
+def check_stock_availability(menu_id, quantity, session=None):
     """Check if sufficient stock is available for an item."""
-    connection = get_connection()
-    if not connection:
-        logger.error(f"Database connection failed while checking stock for '{item_name}'")
-        return False, "Database connection failed"
+    with _scope(session) as s:
+        if s is None:
+            logger.error(f"Database connection failed while checking stock for item ID {menu_id}")
+            return False, "Database connection failed"
 
-    try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT stock, is_available FROM menu WHERE item_name = %s",
-            (item_name,)
-        )
-        result = cursor.fetchone()
-        cursor.close()
-        connection.close()
+        try:
+            cursor = s.cursor(dictionary=True)
+            cursor.execute(
+                "SELECT item_name, stock, is_available FROM menu WHERE id = %s",
+                (menu_id,)
+            )
+            result = cursor.fetchone()
+            cursor.close()
 
-        if not result:
-            logger.warning(f"Item '{item_name}' not found in menu")
-            return False, f"Item '{item_name}' not found"
-       
-        if not result['is_available']:
-            logger.warning(f"Item '{item_name}' is not available")
-            return False, f"Item '{item_name}' is not available"
+            if not result:
+                logger.warning(f"Item ID {menu_id} not found in menu")
+                return False, "Item not found"
+
+            item_name = result['item_name']
+            if not result['is_available']:
+                logger.warning(f"Item '{item_name}' is not available")
+                return False, f"Item '{item_name}' is not available"
        
-        if result['stock'] < quantity:
-            logger.warning(f"Insufficient stock for '{item_name}': Available={result['stock']}, Required={quantity}")
-            return False, f"Insufficient stock. Available: {result['stock']}, Required: {quantity}"
+            if result['stock'] < quantity:
+                logger.warning(f"Insufficient stock for '{item_name}': Available={result['stock']}, Required={quantity}")
+                return False, f"Insufficient stock. Available: {result['stock']}, Required: {quantity}"
        
-        logger.info(f"Stock available for '{item_name}': {result['stock']} >= {quantity}")
-        return True, "Stock available"
-    except Error as e:
-        logger.error(f"Error checking stock for '{item_name}': {e}")
-        return False, "Failed to check stock availability"
-
-def get_low_stock_items(threshold=5):
-    """Get items with low stock."""
-    connection = get_connection()
-    if not connection:
-        logger.error("Database connection failed while fetching low stock items")
-        return []
+            logger.info(f"Stock available for '{item_name}': {result['stock']} >= {quantity}")
+            return True, "Stock available"
+        except Error as e:
+            logger.error(f"Error checking stock for item ID {menu_id}: {e}")
+            return False, "Failed to check stock availability"
+
+def _as_cart(cart):
+    """Accept a Cart or a list of cart line dicts (menu_id, name, price, quantity)."""
+    return cart if isinstance(cart, Cart) else Cart.from_items(cart)
+
+def _validate_cart_rows(cursor, quantities, names, lock=False, reservation_reference=None):
+    """Fetch (and optionally lock) all cart rows by primary key and validate them.
+
+    Stock held by live reservations counts as unavailable, except holds made
+    under `reservation_reference` itself. Returns (rows keyed by menu id,
+    list of error messages).
+    """
+    ids = list(quantities)
+    placeholders = ", ".join(["%s"] * len(ids))
+    lock_clause = " FOR UPDATE" if lock else ""
+    cursor.execute(
+        f"SELECT id, item_name, is_available, stock FROM menu WHERE id IN ({placeholders}){lock_clause}",
+        ids
+    )
+    rows = {row['id']: row for row in cursor.fetchall()}
+
+    # Read the holds only once the menu rows are locked, and with a locking
+    # read: a plain read would use the transaction's snapshot, which can
+    # predate holds committed by checkouts we just waited for
+    lock_clause = " FOR SHARE" if lock else ""
+    cursor.execute(
+        f"""SELECT menu_id, SUM(quantity) AS held FROM stock_reservations
+            WHERE menu_id IN ({placeholders}) AND expires_at > NOW()
+              AND reservation_reference <> %s
+            GROUP BY menu_id{lock_clause}""",
+        ids + [reservation_reference or ""]
+    )
+    for hold in cursor.fetchall():
+        if hold['menu_id'] in rows:
+            rows[hold['menu_id']]['stock'] -= int(hold['held'])
+
+    errors = []
+    for menu_id, quantity in quantities.items():
+        row = rows.get(menu_id)
+        name = row['item_name'] if row else names.get(menu_id, f"#{menu_id}")
+        if not row:
+            errors.append(f"Item '{name}' not found")
+        elif not row['is_available']:
+            errors.append(f"Item '{name}' is not available")
+        elif row['stock'] < quantity:
+            errors.append(f"Insufficient stock for '{name}'. Available: {row['stock']}, Required: {quantity}")
+    return rows, errors
+
+def _decrement_stock(cursor, quantities_by_id):
+    """Reduce stock for several menu rows with a single UPDATE."""
+    if not quantities_by_id:
+        return
+    cases = " ".join(["WHEN %s THEN %s"] * len(quantities_by_id))
+    placeholders = ", ".join(["%s"] * len(quantities_by_id))
+    params = [value for pair in quantities_by_id.items() for value in pair]
+    params.extend(quantities_by_id)
+    cursor.execute(
+        f"UPDATE menu SET stock = stock - CASE id {cases} END WHERE id IN ({placeholders})",
+        params
+    )
+
+# STOCK RESERVATIONS
+RESERVATION_TTL = 600           # Seconds stock is held between checkout and payment
+RESERVATION_SWEEP_INTERVAL = 60 # Seconds between expired-hold sweeps
+
+def reserve_stock(reservation_reference, cart, ttl=RESERVATION_TTL, session=None):
+    """Hold stock for a cart until payment completes or the hold expires.
+
+    Replaces any earlier holds under the same reference. Returns
+    (success, list of error messages).
+    """
+    cart = _as_cart(cart)
+    quantities, names = cart.quantities(), cart.names()
+    if not quantities:
+        return False, ["Cart is empty"]
+
+    with _scope(session) as s:
+        if s is None:
+            logger.error(f"Database connection failed while reserving stock for '{reservation_reference}'")
+            return False, ["Database connection failed"]
+
+        try:
+            cursor = s.cursor(dictionary=True)
+            _, errors = _validate_cart_rows(
+                cursor, quantities, names, lock=True, reservation_reference=reservation_reference
+            )
+            if errors:
+                s.rollback()
+                logger.warning(f"Stock reservation failed for '{reservation_reference}': {'; '.join(errors)}")
+                return False, errors
 
-    try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT * FROM menu WHERE stock <= %s ORDER BY stock ASC",
-            (threshold,)
-        )
-        items = cursor.fetchall()
+            cursor.execute(
+                "DELETE FROM stock_reservations WHERE reservation_reference = %s",
+                (reservation_reference,)
+            )
+            cursor.executemany(
+                """INSERT INTO stock_reservations (reservation_reference, menu_id, quantity, expires_at)
+                   VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND)""",
+                [(reservation_reference, menu_id, quantity, ttl)
+                 for menu_id, quantity in quantities.items()]
+            )
+            s.on_commit(bump_menu_version)
+            s.commit()
+            cursor.close()
+            logger.info(f"Reserved {len(quantities)} items for '{reservation_reference}' ({ttl}s)")
+            return True, []
+        except Error as e:
+            s.rollback()
+            logger.error(f"Error reserving stock for '{reservation_reference}': {e}")
+            return False, ["Failed to reserve stock"]
+
+def release_reservation(reservation_reference, session=None):
+    """Release all stock held under a reference."""
+    with _scope(session) as s:
+        if s is None:
+            logger.error(f"Database connection failed while releasing reservation '{reservation_reference}'")
+            return False
+
+        try:
+            cursor = s.cursor()
+            cursor.execute(
+                "DELETE FROM stock_reservations WHERE reservation_reference = %s",
+                (reservation_reference,)
+            )
+            released = cursor.rowcount
+            if released:
+                s.on_commit(bump_menu_version)
+            s.commit()
+            cursor.close()
+            if released:
+                logger.info(f"Released {released} held items for '{reservation_reference}'")
+            return True
+        except Error as e:
+            logger.error(f"Error releasing reservation '{reservation_reference}': {e}")
+            return False
+
+def release_expired_reservations(session=None):
+    """Delete holds whose TTL has passed; returns the number released."""
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while sweeping expired reservations")
+            return 0
+
+        try:
+            cursor = s.cursor()
+            cursor.execute("DELETE FROM stock_reservations WHERE expires_at <= NOW()")
+            released = cursor.rowcount
+            if released:
+                s.on_commit(bump_menu_version)
+            s.commit()
+            cursor.close()
+            if released:
+                logger.info(f"Released {released} expired stock holds")
+            return released
+        except Error as e:
+            logger.error(f"Error sweeping expired reservations: {e}")
+            return 0
+
+_sweeper_thread = None
+_sweeper_lock = threading.Lock()
+
+def start_reservation_sweeper(interval=RESERVATION_SWEEP_INTERVAL):
+    """Start the background thread that releases expired holds (once per process)."""
+    global _sweeper_thread
+    with _sweeper_lock:
+        if _sweeper_thread is not None and _sweeper_thread.is_alive():
+            return _sweeper_thread
+
+        def sweep():
+            while True:
+                time.sleep(interval)
+                try:
+                    release_expired_reservations()
+                except Exception as e:
+                    logger.error(f"Reservation sweeper error: {e}")
+
+        _sweeper_thread = threading.Thread(target=sweep, name="reservation-sweeper", daemon=True)
+        _sweeper_thread.start()
+        logger.info(f"Reservation sweeper started (interval={interval}s)")
+        return _sweeper_thread
+
+# LOW STOCK ALERTS
+def _sync_low_stock_alerts(cursor, menu_ids=None):
+    """Raise or clear alerts for items whose stock crossed their threshold.
+
+    Runs inside the transaction that changed the stock, so alerts always match
+    committed stock. Items at or below their threshold get (or refresh) an
+    alert row; items restocked above it have theirs removed. With no ids the
+    whole menu is reconciled.
+    """
+    if menu_ids is not None:
+        menu_ids = list(menu_ids)
+        if not menu_ids:
+            return
+        id_filter = f"AND m.id IN ({', '.join(['%s'] * len(menu_ids))})"
+        params = menu_ids
+    else:
+        id_filter, params = "", []
+
+    cursor.execute(
+        f"""INSERT INTO low_stock_alerts (menu_id, stock, threshold)
+            SELECT m.id, m.stock, m.low_stock_threshold FROM menu m
+            WHERE m.stock <= m.low_stock_threshold {id_filter}
+            ON DUPLICATE KEY UPDATE stock = VALUES(stock), threshold = VALUES(threshold)""",
+        params
+    )
+    cursor.execute(
+        f"""DELETE a FROM low_stock_alerts a JOIN menu m ON m.id = a.menu_id
+            WHERE m.stock > m.low_stock_threshold {id_filter}""",
+        params
+    )
+
+def get_low_stock_items(threshold=None, session=None):
+    """Get items with an active low-stock alert, lowest stock first.
+
+    Reads the alert table rather than scanning the menu. Pass `threshold` to
+    narrow the result further to items at or below that stock level.
+    """
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while fetching low stock items")
+            return []
+
+        try:
+            cursor = s.cursor(dictionary=True)
+            query = """
+                SELECT m.*, a.raised_at FROM low_stock_alerts a
+                JOIN menu m ON m.id = a.menu_id
+            """
+            params = ()
+            if threshold is not None:
+                query += " WHERE a.stock <= %s"
+                params = (threshold,)
+            cursor.execute(query + " ORDER BY a.stock ASC", params)
+            items = cursor.fetchall()
        
-        # Convert Decimal to float
-        for item in items:
-            if 'price' in item:
-                item['price'] = float(item['price'])
+            # Convert Decimal to float
+            for item in items:
+                if 'price' in item:
+                    item['price'] = float(item['price'])
        
-        cursor.close()
-        connection.close()
-        logger.info(f"Found {len(items)} items with stock <= {threshold}")
-        return items
-    except Error as e:
-        logger.error(f"Error fetching low stock items: {e}")
-        return []
+            cursor.close()
+            logger.info(f"Found {len(items)} active low stock alerts")
+            return items
+        except Error as e:
+            logger.error(f"Error fetching low stock items: {e}")
+            return []
+
+# PROMOTIONS
+# Changes made through this module (redemptions, menu deletes) bump the
+# version and show at once; promotions edited directly in the database take
+# up to PROMOTION_CACHE_TTL seconds to reach running servers.
+PROMOTION_CACHE_TTL = 60
+
+_promotion_version = 0
+_promotion_cache = None   # (version, loaded_at, {code: Promotion})
+_promotion_version_lock = threading.Lock()
+_promotion_load_lock = threading.Lock()
+
+def bump_promotion_version():
+    """Invalidate the cached promotion rules after a promotion changes."""
+    global _promotion_version
+    with _promotion_version_lock:
+        _promotion_version += 1
+
+def _promotion_cache_fresh(cache, version):
+    return (cache is not None and cache[0] == version
+            and time.monotonic() - cache[1] < PROMOTION_CACHE_TTL)
+
+def get_promotions():
+    """Active promotions compiled into rules and keyed by code (cached).
+
+    Reloads only when the promotion version changed or the rules are older
+    than PROMOTION_CACHE_TTL.
+    """
+    global _promotion_cache
+    if _promotion_cache_fresh(_promotion_cache, _promotion_version):
+        return _promotion_cache[2]
+
+    with _promotion_load_lock:
+        cache = _promotion_cache
+        version = _promotion_version
+        if _promotion_cache_fresh(cache, version):
+            return cache[2]
+
+        with _scope() as s:
+            if s is None:
+                logger.error("Database connection failed while loading promotions")
+                return cache[2] if cache else {}
+            try:
+                cursor = s.cursor(dictionary=True)
+                cursor.execute("SELECT * FROM promotions WHERE is_active = TRUE")
+                rules = {row['code'].upper(): Promotion(row) for row in cursor.fetchall()}
+                cursor.close()
+            except Error as e:
+                logger.error(f"Error loading promotions: {e}")
+                return cache[2] if cache else {}
+
+        _promotion_cache = (version, time.monotonic(), rules)
+        logger.info(f"Promotions refreshed (version={version}, codes={len(rules)})")
+        return rules
+
+def _menu_category(menu_id):
+    item = get_menu_snapshot().by_id.get(menu_id)
+    return item['category'] if item else None
+
+def evaluate_promotion(code, cart):
+    """Price a discount code against a cart from the cached rules; no query.
+
+    Usage caps are only as fresh as the cache; `validate_promotion` and
+    `create_order` check them against the database.
+    """
+    code = (code or "").strip().upper()
+    rule = get_promotions().get(code)
+    if rule is None:
+        return PromotionResult(False, code, Decimal("0"), "Invalid discount code")
+    return rule.evaluate(_as_cart(cart), _menu_category)
+
+def _apply_promotion(cursor, code, username, cart, lock=False):
+    """Evaluate a code against fresh promotion and usage data.
+
+    With `lock`, a capped promotion's row stays locked so a following
+    redemption cannot race another order for the last use. Uncapped codes
+    are never locked, so checkouts using a popular code do not queue on it.
+    """
+    cursor.execute("SELECT * FROM promotions WHERE code = %s AND is_active = TRUE", (code,))
+    row = cursor.fetchone()
+    capped = row is not None and (row['uses_remaining'] is not None or row['per_user_limit'] is not None)
+    lock = lock and capped
+    if lock:
+        # Re-read under the lock: the plain read above may come from an older snapshot
+        cursor.execute("SELECT * FROM promotions WHERE id = %s AND is_active = TRUE FOR UPDATE", (row['id'],))
+        row = cursor.fetchone()
+    if not row:
+        return None, PromotionResult(False, code, Decimal("0"), "Invalid discount code")
+    rule = Promotion(row)
+
+    redemptions = 0
+    if rule.per_user_limit is not None:
+        cursor.execute(
+            "SELECT COUNT(*) AS used FROM promotion_redemptions WHERE promotion_id = %s AND username = %s"
+            + (" FOR SHARE" if lock else ""),
+            (rule.id, username)
+        )
+        redemptions = cursor.fetchone()['used']
+
+    categories = {}
+    if rule.category:
+        ids = list(cart.quantities())
+        placeholders = ", ".join(["%s"] * len(ids))
+        cursor.execute(f"SELECT id, category FROM menu WHERE id IN ({placeholders})", ids)
+        categories = {item['id']: item['category'] for item in cursor.fetchall()}
+
+    return rule, rule.evaluate(cart, categories.get, redemptions)
+
+def validate_promotion(code, username, cart, session=None):
+    """Check a discount code for a user against the database before checkout."""
+    code = (code or "").strip().upper()
+    cart = _as_cart(cart)
+    with _scope(session) as s:
+        if s is None:
+            logger.error(f"Database connection failed while validating promotion '{code}'")
+            return PromotionResult(False, code, Decimal("0"), "Database connection failed")
+
+        try:
+            cursor = s.cursor(dictionary=True)
+            _, result = _apply_promotion(cursor, code, username, cart)
+            cursor.close()
+            return result
+        except Error as e:
+            logger.error(f"Error validating promotion '{code}': {e}")
+            return PromotionResult(False, code, Decimal("0"), "Failed to check discount code")
+
+def _redeem_promotion(cursor, rule, username, order_id, discount):
+    """Use up one redemption; the promotion row is already locked."""
+    if rule.uses_remaining is not None:
+        cursor.execute(
+            "UPDATE promotions SET uses_remaining = uses_remaining - 1 WHERE id = %s AND uses_remaining > 0",
+            (rule.id,)
+        )
+    cursor.execute(
+        """INSERT INTO promotion_redemptions (promotion_id, username, order_id, discount_amount)
+           VALUES (%s, %s, %s, %s)""",
+        (rule.id, username, order_id, discount)
+    )
 
 # ORDER MANAGEMENT FUNCTIONS
 def generate_order_reference():
@@ -465,460 +1663,993 @@ def generate_order_reference():
     logger.info(f"Generated order reference: {order_ref}")
     return order_ref
 
-def create_order(username, cart_items, payment_mode, order_reference=None):
-    """Create a new order with items using transaction."""
+# Successful create_order results keyed by order reference, so reruns that
+# resubmit the same payment never touch the database again
+ORDER_RESULT_CACHE_SIZE = 1000
+_order_results = OrderedDict()
+_order_locks = {}   # order reference -> [lock, callers using it]
+_order_guard = threading.Lock()
+
+def _cached_order_result(order_reference):
+    with _order_guard:
+        return _order_results.get(order_reference)
+
+def _remember_order_result(order_reference, result):
+    with _order_guard:
+        _order_results[order_reference] = result
+        while len(_order_results) > ORDER_RESULT_CACHE_SIZE:
+            _order_results.popitem(last=False)
+
+def create_order(username, cart, payment_mode, order_reference=None, discount_code=None, session=None):
+    """Create a new order from a Cart (or list of cart line dicts) using a transaction.
+
+    Idempotent per order_reference: resubmitting a reference that was already
+    placed returns the existing order instead of inserting a duplicate. A
+    `discount_code` is re-checked and redeemed in the same transaction.
+    """
     if not order_reference:
         order_reference = generate_order_reference()
-   
-    connection = get_connection()
-    if not connection:
-        logger.error(f"Database connection failed while creating order for user '{username}'")
-        return False, "Database connection failed", None
 
+    cached = _cached_order_result(order_reference)
+    if cached:
+        logger.info(f"Order '{order_reference}' already created; returning cached result")
+        return cached
+
+    # Serialise concurrent submissions of the same reference in this process.
+    # The lock is shared until its last caller leaves, so a late arrival
+    # never gets a fresh lock while an earlier one is still running.
+    with _order_guard:
+        entry = _order_locks.setdefault(order_reference, [threading.Lock(), 0])
+        entry[1] += 1
     try:
-        cursor = connection.cursor()
-        connection.start_transaction()
-        logger.info(f"Starting order creation for user '{username}' with reference '{order_reference}'")
+        with entry[0]:
+            cached = _cached_order_result(order_reference)
+            if cached:
+                logger.info(f"Order '{order_reference}' already created; returning cached result")
+                return cached
+
+            return _create_order(
+                username, _as_cart(cart), payment_mode, order_reference, discount_code, session
+            )
+    finally:
+        with _order_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _order_locks[order_reference]
+
+def _create_order(username, cart, payment_mode, order_reference, discount_code=None, session=None):
+    with _scope(session) as s:
+        if s is None:
+            logger.error(f"Database connection failed while creating order for user '{username}'")
+            return False, "Database connection failed", None
+
+        try:
+            cursor = s.cursor(dictionary=True)
+            logger.info(f"Starting order creation for user '{username}' with reference '{order_reference}'")
+
+            # Guard against duplicates from other processes: a locking read sees
+            # committed orders and waits on one being inserted concurrently
+            cursor.execute(
+                "SELECT id FROM orders WHERE order_reference = %s FOR UPDATE",
+                (order_reference,)
+            )
+            if cursor.fetchone():
+                cursor.close()
+                logger.info(f"Order '{order_reference}' already exists; skipping duplicate submission")
+                return True, "Order already placed", order_reference
 
-        # Validate stock for all items first
-        for item in cart_items:
-            success, message = check_stock_availability(item['name'], item['quantity'])
-            if not success:
-                connection.rollback()
-                logger.warning(f"Order creation failed for '{username}': {message}")
-                return False, message, None
+            quantities, names = cart.quantities(), cart.names()
+            if not quantities:
+                logger.warning(f"Order creation failed for '{username}': cart is empty")
+                return False, "Cart is empty", None
 
-        # Calculate total amount
-        total_amount = sum(item['total'] for item in cart_items)
-        logger.info(f"Order total amount: ₹{total_amount}")
+            # A live reservation matching the cart is converted straight into a sale
+            cursor.execute(
+                """SELECT r.menu_id, r.quantity
+                   FROM stock_reservations r JOIN menu m ON m.id = r.menu_id
+                   WHERE r.reservation_reference = %s AND r.expires_at > NOW()
+                   FOR UPDATE""",
+                (order_reference,)
+            )
+            holds = {row['menu_id']: row['quantity'] for row in cursor.fetchall()}
+
+            if holds and holds == quantities:
+                stock_by_id = holds
+                logger.info(f"Using stock reservation for '{order_reference}'")
+            else:
+                # Lock every cart row and validate the whole cart in one round trip
+                _, errors = _validate_cart_rows(
+                    cursor, quantities, names, lock=True, reservation_reference=order_reference
+                )
+                if errors:
+                    s.rollback()
+                    message = "; ".join(errors)
+                    logger.warning(f"Order creation failed for '{username}': {message}")
+                    return False, message, None
+                stock_by_id = quantities
+
+            # Re-check the discount under lock so caps hold across concurrent orders
+            promotion, discount = None, Decimal("0")
+            if discount_code:
+                discount_code = discount_code.strip().upper()
+                promotion, result = _apply_promotion(cursor, discount_code, username, cart, lock=True)
+                if not result.ok:
+                    s.rollback()
+                    logger.warning(f"Order creation failed for '{username}': {result.message}")
+                    return False, result.message, None
+                discount = result.discount
+
+            # Calculate total amount (exact, from the cart lines)
+            total_amount = cart.subtotal - discount
+            logger.info(f"Order total amount: ₹{total_amount} (discount ₹{discount})")
+
+            # Insert order
+            cursor.execute(
+                """INSERT INTO orders (order_reference, username, total_amount, discount_code,
+                                       discount_amount, payment_mode, status)
+                   VALUES (%s, %s, %s, %s, %s, %s, %s)""",
+                (order_reference, username, total_amount, promotion and promotion.code,
+                 discount, payment_mode, 'Preparing')
+            )
+            order_id = cursor.lastrowid
+            logger.info(f"Order inserted with ID: {order_id}")
 
-        # Insert order
-        cursor.execute(
-            """INSERT INTO orders (order_reference, username, total_amount, payment_mode, status)
-               VALUES (%s, %s, %s, %s, %s)""",
-            (order_reference, username, total_amount, payment_mode, 'Completed')
-        )
-        order_id = cursor.lastrowid
-        logger.info(f"Order inserted with ID: {order_id}")
+            if promotion:
+                _redeem_promotion(cursor, promotion, username, order_id, discount)
+                if promotion.uses_remaining is not None:
+                    s.on_commit(bump_promotion_version)
+
+            # Bulk insert order items (sent as one multi-row INSERT)
+            cursor.executemany(
+                """INSERT INTO order_items (order_id, menu_id, item_name, quantity, price, total)
+                   VALUES (%s, %s, %s, %s, %s, %s)""",
+                [(order_id, item['menu_id'], item['name'], item['quantity'], item['price'], item['total'])
+                 for item in cart.to_order_items()]
+            )
+            logger.info(f"Added {len(cart)} items to order {order_id}")
 
-        # Insert order items and update stock
-        for item in cart_items:
+            # Decrement stock for all locked rows in one statement
+            _decrement_stock(cursor, stock_by_id)
+            _sync_low_stock_alerts(cursor, stock_by_id)
             cursor.execute(
-                """INSERT INTO order_items (order_id, item_name, quantity, price, total)
-                   VALUES (%s, %s, %s, %s, %s)""",
-                (order_id, item['name'], item['quantity'], item['price'], item['total'])
+                "DELETE FROM stock_reservations WHERE reservation_reference = %s",
+                (order_reference,)
             )
-            logger.info(f"Added item '{item['name']}' x{item['quantity']} to order")
+            logger.info(f"Updated stock for {len(stock_by_id)} menu items")
 
+            # Add to order history
             cursor.execute(
-                "UPDATE menu SET stock = stock - %s WHERE item_name = %s",
-                (item['quantity'], item['name'])
+                "INSERT INTO order_history (order_id, status) VALUES (%s, %s)",
+                (order_id, 'Preparing')
             )
-            logger.info(f"Updated stock for '{item['name']}': reduced by {item['quantity']}")
 
-        # Add to order history
-        cursor.execute(
-            "INSERT INTO order_history (order_id, status) VALUES (%s, %s)",
-            (order_id, 'Completed')
-        )
+            # Keep dashboard counters and sales rollups current in the same transaction
+            _record_order_stats(cursor, total_amount)
+            _record_sales_rollups(cursor, order_id, sum(quantities.values()))
 
-        connection.commit()
-        cursor.close()
-        connection.close()
+            # Only cache once the order is durable; an enclosing unit of work may still roll back
+            result = (True, "Order created successfully", order_reference)
+            s.on_commit(lambda: _remember_order_result(order_reference, result))
+            s.on_commit(bump_menu_version)
+            s.commit()
+            cursor.close()
        
-        logger.info(f"✓ Order '{order_reference}' created successfully for user '{username}'")
-        return True, "Order created successfully", order_reference
+            logger.info(f"✓ Order '{order_reference}' created successfully for user '{username}'")
+            return result
        
-    except Error as e:
-        if connection:
-            connection.rollback()
+        except Error as e:
+            s.rollback()
+            if getattr(e, 'errno', None) == errorcode.ER_DUP_ENTRY:
+                logger.info(f"Order '{order_reference}' was placed concurrently; treating as success")
+                return True, "Order already placed", order_reference
             logger.error(f"Transaction rolled back for order '{order_reference}'")
-        logger.error(f"✗ Error creating order for user '{username}': {e}")
-        return False, "Order creation failed. Please try again.", None
+            logger.error(f"✗ Error creating order for user '{username}': {e}")
+            return False, "Order creation failed. Please try again.", None
 
-def get_user_orders(username):
-    """Fetch all orders for a specific user."""
-    connection = get_connection()
-    if not connection:
-        logger.error(f"Database connection failed while fetching orders for user '{username}'")
-        return []
+def _attach_order_items(cursor, orders):
+    """Load the items of many orders with one IN (...) query and group them in one pass."""
+    by_id = {}
+    for order in orders:
+        # Convert Decimal to float
+        if 'total_amount' in order:
+            order['total_amount'] = float(order['total_amount'])
+        order['items'] = []
+        by_id[order['id']] = order
 
-    try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT * FROM orders WHERE username = %s ORDER BY created_at DESC",
-            (username,)
-        )
-        orders = cursor.fetchall()
+    if not by_id:
+        return orders
 
-        # Get items for each order and convert data types
-        for order in orders:
-            # Convert Decimal to float
-            if 'total_amount' in order:
-                order['total_amount'] = float(order['total_amount'])
-           
-            # Fetch order items
+    placeholders = ", ".join(["%s"] * len(by_id))
+    cursor.execute(
+        f"SELECT * FROM order_items WHERE order_id IN ({placeholders}) ORDER BY order_id, id",
+        list(by_id)
+    )
+    for item in cursor.fetchall():
+        # Convert Decimal to float for items
+        if 'price' in item:
+            item['price'] = float(item['price'])
+        if 'total' in item:
+            item['total'] = float(item['total'])
+        by_id[item['order_id']]['items'].append(item)
+    return orders
+
+def get_user_orders(username, session=None):
+    """Fetch all orders for a specific user."""
+    with _scope(session) as s:
+        if s is None:
+            logger.error(f"Database connection failed while fetching orders for user '{username}'")
+            return []
+
+        try:
+            cursor = s.cursor(dictionary=True)
             cursor.execute(
-                "SELECT * FROM order_items WHERE order_id = %s",
-                (order['id'],)
+                "SELECT * FROM orders WHERE username = %s ORDER BY created_at DESC",
+                (username,)
             )
-            items = cursor.fetchall()
-           
-            # Convert Decimal to float for items
-            for item in items:
-                if 'price' in item:
-                    item['price'] = float(item['price'])
-                if 'total' in item:
-                    item['total'] = float(item['total'])
-           
-            order['items'] = items
+            orders = cursor.fetchall()
 
-        cursor.close()
-        connection.close()
-        logger.info(f"Retrieved {len(orders)} orders for user '{username}'")
-        return orders
-    except Error as e:
-        logger.error(f"Error fetching orders for user '{username}': {e}")
-        return []
+            # Fetch items for all orders in one query
+            _attach_order_items(cursor, orders)
 
-def get_all_orders(limit=50):
-    """Fetch all orders (for admin)."""
-    connection = get_connection()
-    if not connection:
-        logger.error("Database connection failed while fetching all orders")
-        return []
+            cursor.close()
+            logger.info(f"Retrieved {len(orders)} orders for user '{username}'")
+            return orders
+        except Error as e:
+            logger.error(f"Error fetching orders for user '{username}': {e}")
+            return []
 
-    try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT * FROM orders ORDER BY created_at DESC LIMIT %s",
-            (limit,)
-        )
-        orders = cursor.fetchall()
+def get_all_orders(limit=50, session=None):
+    """Fetch all orders (for admin)."""
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while fetching all orders")
+            return []
 
-        # Get items for each order and convert data types
-        for order in orders:
-            # Convert Decimal to float
-            if 'total_amount' in order:
-                order['total_amount'] = float(order['total_amount'])
-           
-            # Fetch order items
+        try:
+            cursor = s.cursor(dictionary=True)
             cursor.execute(
-                "SELECT * FROM order_items WHERE order_id = %s",
-                (order['id'],)
+                "SELECT * FROM orders ORDER BY created_at DESC LIMIT %s",
+                (limit,)
             )
-            items = cursor.fetchall()
-           
-            # Convert Decimal to float for items
-            for item in items:
-                if 'price' in item:
-                    item['price'] = float(item['price'])
-                if 'total' in item:
-                    item['total'] = float(item['total'])
-           
-            order['items'] = items
+            orders = cursor.fetchall()
 
-        cursor.close()
-        connection.close()
-        logger.info(f"Retrieved {len(orders)} orders (admin view, limit={limit})")
-        return orders
-    except Error as e:
-        logger.error(f"Error fetching all orders: {e}")
-        return []
+            # Fetch items for all orders in one query
+            _attach_order_items(cursor, orders)
 
-def get_order_by_reference(order_reference):
+            cursor.close()
+            logger.info(f"Retrieved {len(orders)} orders (admin view, limit={limit})")
+            return orders
+        except Error as e:
+            logger.error(f"Error fetching all orders: {e}")
+            return []
+
+# KEYSET PAGINATION
+ORDER_PAGE_SIZE = 20
+ACTIVE_ORDER_STATUSES = ('Pending', 'Preparing', 'Ready')  # Shown on the kitchen board
+NEXT_ORDER_STATUS = {'Pending': 'Preparing', 'Preparing': 'Ready', 'Ready': 'Completed'}
+KITCHEN_WATERMARK_OVERLAP = 50  # order_history ids re-read below the kitchen watermark
+
+def _fetch_orders_page(s, username, after, limit):
+    """Fetch one page of orders, newest first, keyed on (created_at, id).
+
+    Returns (orders, next_cursor); next_cursor is None on the last page.
+    """
+    conditions = []
+    params = []
+    if username is not None:
+        conditions.append("username = %s")
+        params.append(username)
+    if after is not None:
+        created_at, order_id = after
+        conditions.append("(created_at < %s OR (created_at = %s AND id < %s))")
+        params.extend([created_at, created_at, order_id])
+
+    query = "SELECT * FROM orders"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY created_at DESC, id DESC LIMIT %s"
+    # One extra row tells us whether another page exists
+    params.append(limit + 1)
+
+    cursor = s.cursor(dictionary=True)
+    cursor.execute(query, params)
+    orders = cursor.fetchall()
+
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = (orders[-1]['created_at'], orders[-1]['id'])
+
+    _attach_order_items(cursor, orders)
+    cursor.close()
+    return orders, next_cursor
+
+def get_user_orders_page(username, after=None, limit=ORDER_PAGE_SIZE, session=None):
+    """Fetch one page of a user's orders; pass the returned cursor as `after` for the next.
+
+    Returns (None, None) if the page could not be loaded.
+    """
+    with _scope(session) as s:
+        if s is None:
+            logger.error(f"Database connection failed while fetching orders for user '{username}'")
+            return None, None
+
+        try:
+            orders, next_cursor = _fetch_orders_page(s, username, after, limit)
+            logger.info(f"Retrieved page of {len(orders)} orders for user '{username}'")
+            return orders, next_cursor
+        except Error as e:
+            logger.error(f"Error fetching orders page for user '{username}': {e}")
+            return None, None
+
+def get_all_orders_page(after=None, limit=ORDER_PAGE_SIZE, session=None):
+    """Fetch one page of all orders (for admin); pass the returned cursor as `after` for the next.
+
+    Returns (None, None) if the page could not be loaded.
+    """
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while fetching all orders")
+            return None, None
+
+        try:
+            orders, next_cursor = _fetch_orders_page(s, None, after, limit)
+            logger.info(f"Retrieved page of {len(orders)} orders (admin view)")
+            return orders, next_cursor
+        except Error as e:
+            logger.error(f"Error fetching orders page: {e}")
+            return None, None
+
+def get_order_by_reference(order_reference, session=None):
     """Get order details by order reference."""
-    connection = get_connection()
-    if not connection:
-        logger.error(f"Database connection failed while fetching order '{order_reference}'")
-        return None
+    with _scope(session) as s:
+        if s is None:
+            logger.error(f"Database connection failed while fetching order '{order_reference}'")
+            return None
 
-    try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT * FROM orders WHERE order_reference = %s",
-            (order_reference,)
-        )
-        order = cursor.fetchone()
-       
-        if order:
-            # Convert Decimal to float
-            if 'total_amount' in order:
-                order['total_amount'] = float(order['total_amount'])
-           
-            # Fetch order items
+        try:
+            cursor = s.cursor(dictionary=True)
             cursor.execute(
-                "SELECT * FROM order_items WHERE order_id = %s",
-                (order['id'],)
+                "SELECT * FROM orders WHERE order_reference = %s",
+                (order_reference,)
             )
-            items = cursor.fetchall()
-           
-            # Convert Decimal to float for items
-            for item in items:
-                if 'price' in item:
-                    item['price'] = float(item['price'])
-                if 'total' in item:
-                    item['total'] = float(item['total'])
-           
-            order['items'] = items
-            logger.info(f"Retrieved order '{order_reference}' successfully")
-        else:
-            logger.warning(f"Order '{order_reference}' not found")
+            order = cursor.fetchone()
+       
+            if order:
+                _attach_order_items(cursor, [order])
+                logger.info(f"Retrieved order '{order_reference}' successfully")
+            else:
+                logger.warning(f"Order '{order_reference}' not found")
 
-        cursor.close()
-        connection.close()
-        return order
-    except Error as e:
-        logger.error(f"Error fetching order by reference '{order_reference}': {e}")
-        return None
+            cursor.close()
+            return order
+        except Error as e:
+            logger.error(f"Error fetching order by reference '{order_reference}': {e}")
+            return None
 
-def update_order_status(order_id, status):
+def update_order_status(order_id, status, session=None):
     """Update order status."""
-    connection = get_connection()
-    if not connection:
-        logger.error(f"Database connection failed while updating order ID {order_id}")
-        return False, "Database connection failed"
+    with _scope(session) as s:
+        if s is None:
+            logger.error(f"Database connection failed while updating order ID {order_id}")
+            return False, "Database connection failed"
 
-    try:
-        cursor = connection.cursor()
+        try:
+            cursor = s.cursor()
        
-        # Update order status
-        cursor.execute(
-            "UPDATE orders SET status = %s WHERE id = %s",
-            (status, order_id)
-        )
-        affected_rows = cursor.rowcount
+            # Update order status
+            cursor.execute(
+                "UPDATE orders SET status = %s WHERE id = %s",
+                (status, order_id)
+            )
+            affected_rows = cursor.rowcount
        
-        if affected_rows > 0:
-            # Add to history
+            if affected_rows > 0:
+                # Add to history
+                cursor.execute(
+                    "INSERT INTO order_history (order_id, status) VALUES (%s, %s)",
+                    (order_id, status)
+                )
+                s.commit()
+                logger.info(f"Order ID {order_id} status updated to '{status}'")
+                cursor.close()
+                return True, "Order status updated successfully"
+            else:
+                logger.warning(f"No order found with ID {order_id}")
+                cursor.close()
+                return False, "Order not found"
+           
+        except Error as e:
+            s.rollback()
+            logger.error(f"Error updating order status for ID {order_id}: {e}")
+            return False, "Failed to update order status"
+
+def update_order_statuses(order_ids, status, session=None):
+    """Move many orders one step forward to `status` in one transaction.
+
+    Only orders currently in the status before it (see NEXT_ORDER_STATUS)
+    move; the rest, for example orders another screen already advanced, are
+    left alone. Every order that changes gets its order_history row.
+    """
+    previous = [current for current, following in NEXT_ORDER_STATUS.items() if following == status]
+    if not previous:
+        return False, f"Orders cannot be moved to {status} in bulk"
+
+    order_ids = list(dict.fromkeys(order_ids))
+    if not order_ids:
+        return True, "No orders selected"
+
+    with _scope(session) as s:
+        if s is None:
+            logger.error(f"Database connection failed while updating {len(order_ids)} orders")
+            return False, "Database connection failed"
+
+        try:
+            cursor = s.cursor()
+            placeholders = ", ".join(["%s"] * len(order_ids))
             cursor.execute(
-                "INSERT INTO order_history (order_id, status) VALUES (%s, %s)",
-                (order_id, status)
+                f"SELECT id FROM orders WHERE id IN ({placeholders}) AND status = %s FOR UPDATE",
+                order_ids + previous
             )
-            connection.commit()
-            logger.info(f"Order ID {order_id} status updated to '{status}'")
+            changed = [row[0] for row in cursor.fetchall()]
+
+            if changed:
+                placeholders = ", ".join(["%s"] * len(changed))
+                cursor.execute(
+                    f"UPDATE orders SET status = %s WHERE id IN ({placeholders})",
+                    [status] + changed
+                )
+                cursor.executemany(
+                    "INSERT INTO order_history (order_id, status) VALUES (%s, %s)",
+                    [(order_id, status) for order_id in changed]
+                )
+            s.commit()
             cursor.close()
-            connection.close()
-            return True, "Order status updated successfully"
-        else:
-            logger.warning(f"No order found with ID {order_id}")
+            logger.info(f"{len(changed)} of {len(order_ids)} orders moved to '{status}'")
+            skipped = len(order_ids) - len(changed)
+            if skipped:
+                return True, f"{len(changed)} orders marked {status}; {skipped} were no longer {previous[0]}"
+            return True, f"{len(changed)} orders marked {status}"
+        except Error as e:
+            s.rollback()
+            logger.error(f"Error updating status of {len(order_ids)} orders: {e}")
+            return False, "Failed to update order statuses"
+
+def get_kitchen_orders(after_change=None, session=None):
+    """Orders for the kitchen board, read from a status-change watermark.
+
+    Without `after_change`, returns every active order. With it, returns
+    orders whose status changed (or that were placed) after that
+    order_history id, in any status, so the caller can move or drop them.
+    The last KITCHEN_WATERMARK_OVERLAP ids before it are read again, since
+    ids are allocated before their transactions commit and a lower one can
+    become visible after a higher one; merging the same order twice is
+    harmless. Returns (orders, watermark); pass the watermark back on the
+    next call.
+    """
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while fetching kitchen orders")
+            return [], after_change
+
+        try:
+            cursor = s.cursor(dictionary=True)
+            # Read the watermark first: a change landing in between is
+            # fetched now and again next time, never skipped
+            cursor.execute("SELECT COALESCE(MAX(id), 0) AS watermark FROM order_history")
+            watermark = cursor.fetchone()['watermark']
+
+            if after_change is None:
+                placeholders = ", ".join(["%s"] * len(ACTIVE_ORDER_STATUSES))
+                cursor.execute(
+                    f"SELECT * FROM orders WHERE status IN ({placeholders}) ORDER BY created_at, id",
+                    list(ACTIVE_ORDER_STATUSES)
+                )
+            else:
+                cursor.execute(
+                    """SELECT * FROM orders WHERE id IN (
+                           SELECT order_id FROM order_history WHERE id > %s AND id <= %s
+                       ) ORDER BY created_at, id""",
+                    (max(after_change - KITCHEN_WATERMARK_OVERLAP, 0), watermark)
+                )
+
+            orders = cursor.fetchall()
+            _attach_order_items(cursor, orders)
             cursor.close()
-            connection.close()
-            return False, "Order not found"
-           
-    except Error as e:
-        logger.error(f"Error updating order status for ID {order_id}: {e}")
-        return False, "Failed to update order status"
+            logger.info(f"Retrieved {len(orders)} kitchen orders (watermark={watermark})")
+            return orders, watermark
+        except Error as e:
+            logger.error(f"Error fetching kitchen orders: {e}")
+            return [], after_change
 
 # ADMIN STATISTICS
-def get_dashboard_stats():
-    """Get statistics for admin dashboard."""
-    connection = get_connection()
-    if not connection:
-        logger.error("Database connection failed while fetching dashboard stats")
-        return None
-
-    try:
-        cursor = connection.cursor(dictionary=True)
-        stats = {}
-
-        # Today's orders count
-        cursor.execute(
-            "SELECT COUNT(*) as count FROM orders WHERE DATE(created_at) = CURDATE()"
-        )
-        stats['today_orders'] = cursor.fetchone()['count']
-
-        # Today's revenue (with NULL safety)
-        cursor.execute(
-            "SELECT COALESCE(SUM(total_amount), 0) as revenue FROM orders WHERE DATE(created_at) = CURDATE()"
-        )
-        stats['today_revenue'] = float(cursor.fetchone()['revenue'])
-
-        # Total menu items
-        cursor.execute("SELECT COUNT(*) as count FROM menu")
-        stats['menu_items'] = cursor.fetchone()['count']
-
-        # Low stock items (stock <= 5)
-        cursor.execute("SELECT COUNT(*) as count FROM menu WHERE stock <= 5")
-        stats['low_stock_items'] = cursor.fetchone()['count']
-
-        # Total customers
-        cursor.execute("SELECT COUNT(*) as count FROM users WHERE role = 'Customer'")
-        stats['total_customers'] = cursor.fetchone()['count']
-
-        # Total orders
-        cursor.execute("SELECT COUNT(*) as count FROM orders")
-        stats['total_orders'] = cursor.fetchone()['count']
+STATS_SHARDS = 16  # Rows per day in daily_stats and rows in stats_totals; readers sum over them
+
+def _record_order_stats(cursor, total_amount):
+    """Add one order to one shard of today's summary and of the running totals."""
+    shard = random.randrange(STATS_SHARDS)
+    cursor.execute(
+        """INSERT INTO daily_stats (stat_date, shard, orders_count, revenue) VALUES (CURDATE(), %s, 1, %s)
+           ON DUPLICATE KEY UPDATE orders_count = orders_count + 1, revenue = revenue + VALUES(revenue)""",
+        (shard, total_amount)
+    )
+    cursor.execute(
+        """INSERT INTO stats_totals (shard, total_orders) VALUES (%s, 1)
+           ON DUPLICATE KEY UPDATE total_orders = total_orders + 1""",
+        (shard,)
+    )
+
+def _record_new_customer(cursor):
+    """Add one customer signup to one shard of today's summary and of the running totals."""
+    shard = random.randrange(STATS_SHARDS)
+    cursor.execute(
+        """INSERT INTO daily_stats (stat_date, shard, new_customers) VALUES (CURDATE(), %s, 1)
+           ON DUPLICATE KEY UPDATE new_customers = new_customers + 1""",
+        (shard,)
+    )
+    cursor.execute(
+        """INSERT INTO stats_totals (shard, total_customers) VALUES (%s, 1)
+           ON DUPLICATE KEY UPDATE total_customers = total_customers + 1""",
+        (shard,)
+    )
+
+def _rebuild_dashboard_stats(cursor):
+    """Recompute daily_stats and stats_totals from the raw tables (into shard 0)."""
+    cursor.execute("DELETE FROM daily_stats")
+    cursor.execute("""
+        INSERT INTO daily_stats (stat_date, orders_count, revenue)
+        SELECT DATE(created_at), COUNT(*), SUM(total_amount) FROM orders GROUP BY DATE(created_at)
+    """)
+    cursor.execute("""
+        INSERT INTO daily_stats (stat_date, new_customers)
+        SELECT DATE(created_at), COUNT(*) FROM users WHERE role = 'Customer' GROUP BY DATE(created_at)
+        ON DUPLICATE KEY UPDATE new_customers = VALUES(new_customers)
+    """)
+    cursor.execute("DELETE FROM stats_totals")
+    cursor.execute("""
+        INSERT INTO stats_totals (shard, total_orders, total_customers)
+        SELECT 0, (SELECT COUNT(*) FROM orders), (SELECT COUNT(*) FROM users WHERE role = 'Customer')
+    """)
+
+def rebuild_dashboard_stats(session=None):
+    """Rebuild the dashboard summary tables from orders and users."""
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while rebuilding dashboard stats")
+            return False
+
+        try:
+            cursor = s.cursor()
+            _rebuild_dashboard_stats(cursor)
+            s.commit()
+            cursor.close()
+            logger.info("Dashboard statistics rebuilt")
+            return True
+        except Error as e:
+            s.rollback()
+            logger.error(f"Error rebuilding dashboard stats: {e}")
+            return False
+
+def get_dashboard_stats(session=None):
+    """Get statistics for admin dashboard in a single query."""
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while fetching dashboard stats")
+            return None
+
+        try:
+            cursor = s.cursor(dictionary=True)
+
+            # Primary-key reads of today's shards and the running-total shards,
+            # so the cost does not grow with the shop's history
+            cursor.execute("""
+                SELECT d.today_orders, d.today_revenue,
+                       (SELECT COUNT(*) FROM menu) AS menu_items,
+                       (SELECT COUNT(*) FROM low_stock_alerts) AS low_stock_items,
+                       t.total_customers, t.total_orders
+                FROM (
+                    SELECT COALESCE(SUM(orders_count), 0) AS today_orders,
+                           COALESCE(SUM(revenue), 0) AS today_revenue
+                    FROM daily_stats WHERE stat_date = CURDATE()
+                ) d
+                CROSS JOIN (
+                    SELECT COALESCE(SUM(total_customers), 0) AS total_customers,
+                           COALESCE(SUM(total_orders), 0) AS total_orders
+                    FROM stats_totals
+                ) t
+            """)
+            stats = cursor.fetchone()
+
+            stats['today_revenue'] = float(stats['today_revenue'])
+            for key in ('today_orders', 'menu_items', 'low_stock_items', 'total_customers', 'total_orders'):
+                stats[key] = int(stats[key])
 
-        cursor.close()
-        connection.close()
-        logger.info("Dashboard statistics retrieved successfully")
-        return stats
-    except Error as e:
-        logger.error(f"Error fetching dashboard stats: {e}")
-        return None
+            cursor.close()
+            logger.info("Dashboard statistics retrieved successfully")
+            return stats
+        except Error as e:
+            logger.error(f"Error fetching dashboard stats: {e}")
+            return None
+
+# PERSISTENT CARTS
+CART_SAVE_DELAY = 2       # Seconds of quiet before a cart change is written
+CART_SAVE_MAX_DELAY = 10  # Longest a cart change may wait while edits continue
+
+def _write_carts(batch):
+    """Upsert or delete many saved carts in one transaction."""
+    with _scope() as s:
+        if s is None:
+            raise Error("Database connection failed while saving carts")
+        try:
+            cursor = s.cursor()
+            saved = [(username, json.dumps(records)) for username, records in batch.items() if records]
+            cleared = [(username,) for username, records in batch.items() if not records]
+            if saved:
+                cursor.executemany(
+                    """INSERT INTO carts (username, items) VALUES (%s, %s)
+                       ON DUPLICATE KEY UPDATE items = VALUES(items)""",
+                    saved
+                )
+            if cleared:
+                cursor.executemany("DELETE FROM carts WHERE username = %s", cleared)
+            s.commit()
+            cursor.close()
+            logger.info(f"Saved {len(saved)} carts, cleared {len(cleared)}")
+        except Error:
+            s.rollback()
+            raise
+
+_cart_writer = DebouncedWriter("cart-writer", _write_carts, CART_SAVE_DELAY, CART_SAVE_MAX_DELAY)
+
+def save_cart(username, cart):
+    """Queue a snapshot of the user's cart to be saved; an empty cart clears it."""
+    _cart_writer.submit(username, cart.to_records())
+
+def load_cart(username, session=None):
+    """Load the user's saved cart, repriced from the current menu.
+
+    Items that were deleted or made unavailable since the cart was saved are
+    dropped; stock is checked again at checkout.
+    """
+    # Make sure a change still queued in this process is not lost
+    _cart_writer.flush(username)
+
+    with _scope(session) as s:
+        if s is None:
+            logger.error(f"Database connection failed while loading cart for '{username}'")
+            return Cart()
+
+        try:
+            cursor = s.cursor(dictionary=True)
+            cursor.execute("SELECT items FROM carts WHERE username = %s", (username,))
+            row = cursor.fetchone()
+            records = json.loads(row['items']) if row else []
+            quantities = {record['menu_id']: record['quantity'] for record in records}
+
+            cart = Cart()
+            if quantities:
+                placeholders = ", ".join(["%s"] * len(quantities))
+                cursor.execute(
+                    f"SELECT id, item_name, price FROM menu WHERE id IN ({placeholders}) AND is_available = TRUE",
+                    list(quantities)
+                )
+                current = {item['id']: item for item in cursor.fetchall()}
+                for menu_id, quantity in quantities.items():
+                    item = current.get(menu_id)
+                    if item:
+                        cart.add(menu_id, item['item_name'], item['price'], quantity)
+            cursor.close()
+            logger.info(f"Restored cart with {len(cart)} items for user '{username}'")
+            return cart
+        except (Error, ValueError) as e:
+            logger.error(f"Error loading cart for user '{username}': {e}")
+            return Cart()
 
 # FAVORITES MANAGEMENT
-def get_user_favorites(username):
-    """Get user's favorite items."""
-    connection = get_connection()
-    if not connection:
-        logger.error(f"Database connection failed while fetching favorites for '{username}'")
-        return []
+# Favorite toggles are queued per (username, menu_id) and written in batches
+FAVORITE_SAVE_DELAY = 2
+FAVORITE_SAVE_MAX_DELAY = 10
+
+def _write_favorites(batch):
+    """Apply queued favorite toggles in one transaction."""
+    with _scope() as s:
+        if s is None:
+            raise Error("Database connection failed while saving favorites")
+        try:
+            cursor = s.cursor()
+            added = [key for key, is_favorite in batch.items() if is_favorite]
+            removed = [key for key, is_favorite in batch.items() if not is_favorite]
+            if added:
+                cursor.executemany("INSERT IGNORE INTO favorites (username, menu_id) VALUES (%s, %s)", added)
+            if removed:
+                cursor.executemany("DELETE FROM favorites WHERE username = %s AND menu_id = %s", removed)
+            s.commit()
+            cursor.close()
+            logger.info(f"Saved favorites: {len(added)} added, {len(removed)} removed")
+        except Error:
+            s.rollback()
+            raise
 
-    try:
-        cursor = connection.cursor()
-        cursor.execute(
-            "SELECT item_name FROM favorites WHERE username = %s",
-            (username,)
-        )
-        favorites = [row[0] for row in cursor.fetchall()]
-        cursor.close()
-        connection.close()
-        logger.info(f"Retrieved {len(favorites)} favorites for user '{username}'")
-        return favorites
-    except Error as e:
-        logger.error(f"Error fetching favorites for user '{username}': {e}")
-        return []
+_favorite_writer = DebouncedWriter(
+    "favorite-writer", _write_favorites, FAVORITE_SAVE_DELAY, FAVORITE_SAVE_MAX_DELAY
+)
 
-def add_favorite(username, item_name):
-    """Add item to user's favorites."""
-    connection = get_connection()
-    if not connection:
-        logger.error(f"Database connection failed while adding favorite for '{username}'")
-        return False
+def queue_favorite(username, menu_id, is_favorite):
+    """Record a favorite toggle now and write it to MySQL in the next batch."""
+    _favorite_writer.submit((username, menu_id), is_favorite)
 
-    try:
-        cursor = connection.cursor()
-        cursor.execute(
-            "INSERT IGNORE INTO favorites (username, item_name) VALUES (%s, %s)",
-            (username, item_name)
-        )
-        connection.commit()
-        cursor.close()
-        connection.close()
-        logger.info(f"Added '{item_name}' to favorites for user '{username}'")
-        return True
-    except Error as e:
-        logger.error(f"Error adding favorite for user '{username}': {e}")
-        return False
+def get_user_favorites(username, session=None):
+    """Get a user's favorite items as full menu rows, oldest favorite first."""
+    # This user's toggles still queued in this process must be visible to the read
+    _favorite_writer.flush_matching(lambda key: key[0] == username)
 
-def remove_favorite(username, item_name):
-    """Remove item from user's favorites."""
-    connection = get_connection()
-    if not connection:
-        logger.error(f"Database connection failed while removing favorite for '{username}'")
-        return False
+    with _scope(session) as s:
+        if s is None:
+            logger.error(f"Database connection failed while fetching favorites for '{username}'")
+            return []
 
-    try:
-        cursor = connection.cursor()
-        cursor.execute(
-            "DELETE FROM favorites WHERE username = %s AND item_name = %s",
-            (username, item_name)
-        )
-        connection.commit()
-        cursor.close()
-        connection.close()
-        logger.info(f"Removed '{item_name}' from favorites for user '{username}'")
-        return True
-    except Error as e:
-        logger.error(f"Error removing favorite for user '{username}': {e}")
-        return False
+        try:
+            cursor = s.cursor(dictionary=True)
+            cursor.execute(
+                """SELECT m.id, m.item_name, m.category, m.price, m.stock, m.is_available, m.description
+                   FROM favorites f JOIN menu m ON m.id = f.menu_id
+                   WHERE f.username = %s
+                   ORDER BY f.created_at, f.id""",
+                (username,)
+            )
+            favorites = cursor.fetchall()
+            for item in favorites:
+                item['price'] = float(item['price'])
+            cursor.close()
+            logger.info(f"Retrieved {len(favorites)} favorites for user '{username}'")
+            return favorites
+        except Error as e:
+            logger.error(f"Error fetching favorites for user '{username}': {e}")
+            return []
 
 # RATINGS MANAGEMENT
-def add_order_rating(order_reference, rating, feedback=None):
+def add_order_rating(order_reference, rating, feedback=None, session=None):
     """Add rating for an order."""
-    connection = get_connection()
-    if not connection:
-        logger.error(f"Database connection failed while adding rating for order '{order_reference}'")
-        return False
+    with _scope(session) as s:
+        if s is None:
+            logger.error(f"Database connection failed while adding rating for order '{order_reference}'")
+            return False
 
-    try:
-        cursor = connection.cursor()
-        cursor.execute(
-            "INSERT INTO order_ratings (order_reference, rating, feedback) VALUES (%s, %s, %s)",
-            (order_reference, rating, feedback)
-        )
-        connection.commit()
-        cursor.close()
-        connection.close()
-        logger.info(f"Rating {rating}/5 added for order '{order_reference}'")
-        return True
-    except Error as e:
-        logger.error(f"Error adding rating for order '{order_reference}': {e}")
-        return False
+        try:
+            cursor = s.cursor()
+            cursor.execute(
+                "INSERT INTO order_ratings (order_reference, rating, feedback) VALUES (%s, %s, %s)",
+                (order_reference, rating, feedback)
+            )
+            s.commit()
+            cursor.close()
+            logger.info(f"Rating {rating}/5 added for order '{order_reference}'")
+            return True
+        except Error as e:
+            logger.error(f"Error adding rating for order '{order_reference}': {e}")
+            return False
 
-def get_order_rating(order_reference):
+def get_order_rating(order_reference, session=None):
     """Get rating for an order."""
-    connection = get_connection()
-    if not connection:
-        logger.error(f"Database connection failed while fetching rating for order '{order_reference}'")
-        return None
+    with _scope(session) as s:
+        if s is None:
+            logger.error(f"Database connection failed while fetching rating for order '{order_reference}'")
+            return None
 
-    try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute(
-            "SELECT * FROM order_ratings WHERE order_reference = %s",
-            (order_reference,)
-        )
-        rating = cursor.fetchone()
-        cursor.close()
-        connection.close()
-        if rating:
-            logger.info(f"Retrieved rating for order '{order_reference}'")
-        return rating
-    except Error as e:
-        logger.error(f"Error fetching rating for order '{order_reference}': {e}")
-        return None
+        try:
+            cursor = s.cursor(dictionary=True)
+            cursor.execute(
+                "SELECT * FROM order_ratings WHERE order_reference = %s",
+                (order_reference,)
+            )
+            rating = cursor.fetchone()
+            cursor.close()
+            if rating:
+                logger.info(f"Retrieved rating for order '{order_reference}'")
+            return rating
+        except Error as e:
+            logger.error(f"Error fetching rating for order '{order_reference}': {e}")
+            return None
+
+def get_order_ratings(order_references, session=None):
+    """Get ratings for many orders in one query, keyed by order reference.
+
+    Returns None if the ratings could not be loaded.
+    """
+    order_references = list(order_references)
+    if not order_references:
+        return {}
+
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while fetching order ratings")
+            return None
+
+        try:
+            cursor = s.cursor(dictionary=True)
+            placeholders = ", ".join(["%s"] * len(order_references))
+            cursor.execute(
+                f"SELECT * FROM order_ratings WHERE order_reference IN ({placeholders})",
+                order_references
+            )
+            ratings = {row['order_reference']: row for row in cursor.fetchall()}
+            cursor.close()
+            logger.info(f"Retrieved {len(ratings)} ratings for {len(order_references)} orders")
+            return ratings
+        except Error as e:
+            logger.error(f"Error fetching order ratings: {e}")
+            return None
+
+# SALES ROLLUPS
+# Hour bucket of a timestamp column, computed the same way everywhere
+_HOUR_BUCKET = "TIMESTAMP(DATE({col}), MAKETIME(HOUR({col}), 0, 0))"
+
+def _record_sales_rollups(cursor, order_id, items_sold):
+    """Add a newly inserted order to its hourly and daily sales rollups."""
+    cursor.execute(
+        f"""INSERT INTO sales_hourly (bucket_start, payment_mode, orders_count, revenue, items_sold)
+            SELECT {_HOUR_BUCKET.format(col='created_at')}, payment_mode, 1, total_amount, %s
+            FROM orders WHERE id = %s
+            ON DUPLICATE KEY UPDATE orders_count = orders_count + 1,
+                                    revenue = revenue + VALUES(revenue),
+                                    items_sold = items_sold + VALUES(items_sold)""",
+        (items_sold, order_id)
+    )
+    cursor.execute(
+        """INSERT INTO sales_daily (sales_date, payment_mode, orders_count, revenue, items_sold)
+           SELECT DATE(created_at), payment_mode, 1, total_amount, %s
+           FROM orders WHERE id = %s
+           ON DUPLICATE KEY UPDATE orders_count = orders_count + 1,
+                                   revenue = revenue + VALUES(revenue),
+                                   items_sold = items_sold + VALUES(items_sold)""",
+        (items_sold, order_id)
+    )
+
+def _rebuild_sales_rollups(cursor, start_date=None, end_date=None):
+    """Recompute rollups from raw orders, for all time or for whole days in a range."""
+    if start_date and end_date:
+        range_start = datetime.combine(start_date, datetime.min.time())
+        range_end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+        order_filter = "WHERE o.created_at >= %s AND o.created_at < %s"
+        params = (range_start, range_end)
+        cursor.execute("DELETE FROM sales_hourly WHERE bucket_start >= %s AND bucket_start < %s", params)
+        cursor.execute("DELETE FROM sales_daily WHERE sales_date >= %s AND sales_date < %s", params)
+    else:
+        order_filter = ""
+        params = ()
+        cursor.execute("DELETE FROM sales_hourly")
+        cursor.execute("DELETE FROM sales_daily")
+
+    cursor.execute(
+        f"""INSERT INTO sales_hourly (bucket_start, payment_mode, orders_count, revenue, items_sold)
+            SELECT {_HOUR_BUCKET.format(col='o.created_at')} AS bucket, o.payment_mode,
+                   COUNT(*), SUM(o.total_amount), COALESCE(SUM(i.items), 0)
+            FROM orders o
+            LEFT JOIN (
+                SELECT order_id, SUM(quantity) AS items FROM order_items GROUP BY order_id
+            ) i ON i.order_id = o.id
+            {order_filter}
+            GROUP BY bucket, o.payment_mode""",
+        params
+    )
+    hourly_filter = "WHERE bucket_start >= %s AND bucket_start < %s" if params else ""
+    cursor.execute(
+        f"""INSERT INTO sales_daily (sales_date, payment_mode, orders_count, revenue, items_sold)
+            SELECT DATE(bucket_start) AS day, payment_mode,
+                   SUM(orders_count), SUM(revenue), SUM(items_sold)
+            FROM sales_hourly
+            {hourly_filter}
+            GROUP BY day, payment_mode""",
+        params
+    )
+
+def rebuild_sales_rollups(start_date=None, end_date=None, session=None):
+    """Rebuild sales rollups from raw orders (backfill); whole history when no range is given."""
+    if (start_date is None) != (end_date is None):
+        logger.error("Rebuilding sales rollups needs both a start and an end date, or neither")
+        return False
 
-# SALES DATA FOR REPORTS
-def get_sales_data(start_date=None, end_date=None):
-    """Get sales data for reports."""
-    connection = get_connection()
-    if not connection:
-        logger.error("Database connection failed while fetching sales data")
-        return []
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while rebuilding sales rollups")
+            return False
 
-    try:
-        cursor = connection.cursor(dictionary=True)
-       
-        query = """
-            SELECT
-                DATE(created_at) as date,
-                COUNT(*) as orders,
-                SUM(total_amount) as revenue
-            FROM orders
-        """
-       
-        if start_date and end_date:
-            query += " WHERE DATE(created_at) BETWEEN %s AND %s"
-            params = (start_date, end_date)
-            logger.info(f"Fetching sales data from {start_date} to {end_date}")
-        else:
-            query += " WHERE DATE(created_at) >= DATE_SUB(CURDATE(), INTERVAL 7 DAY)"
-            params = ()
-            logger.info("Fetching sales data for last 7 days")
-       
-        query += " GROUP BY DATE(created_at) ORDER BY date DESC"
-       
-        cursor.execute(query, params)
-        sales_data = cursor.fetchall()
+        try:
+            cursor = s.cursor()
+            _rebuild_sales_rollups(cursor, start_date, end_date)
+            s.commit()
+            cursor.close()
+            logger.info(f"Sales rollups rebuilt (range: {start_date or 'all'} to {end_date or 'all'})")
+            return True
+        except Error as e:
+            s.rollback()
+            logger.error(f"Error rebuilding sales rollups: {e}")
+            return False
+
+# SALES DATA FOR REPORTS
+def get_sales_data(start_date=None, end_date=None, session=None):
+    """Get daily sales data for reports.
+
+    Completed days come from sales_daily, today's completed hours from
+    sales_hourly, and only the current partial hour from raw orders.
+    """
+    with _scope(session) as s:
+        if s is None:
+            logger.error("Database connection failed while fetching sales data")
+            return []
+
+        try:
+            cursor = s.cursor(dictionary=True)
+
+            if start_date and end_date:
+                logger.info(f"Fetching sales data from {start_date} to {end_date}")
+            else:
+                # "Today" by the database clock, like CURDATE() in the query below
+                cursor.execute("SELECT CURDATE() AS today")
+                end_date = cursor.fetchone()['today']
+                start_date = end_date - timedelta(days=7)
+                logger.info("Fetching sales data for last 7 days")
+
+            range_start = datetime.combine(start_date, datetime.min.time())
+            range_end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+            current_hour = _HOUR_BUCKET.format(col='NOW()')
+
+            query = f"""
+                SELECT day AS date, SUM(orders) AS orders, SUM(revenue) AS revenue
+                FROM (
+                    SELECT sales_date AS day, orders_count AS orders, revenue
+                    FROM sales_daily
+                    WHERE sales_date >= %s AND sales_date < %s AND sales_date < CURDATE()
+
+                    UNION ALL
+
+                    SELECT DATE(bucket_start), orders_count, revenue
+                    FROM sales_hourly
+                    WHERE bucket_start >= GREATEST(CAST(%s AS DATETIME), TIMESTAMP(CURDATE()))
+                      AND bucket_start < LEAST(CAST(%s AS DATETIME), {current_hour})
+
+                    UNION ALL
+
+                    SELECT DATE(created_at), 1, total_amount
+                    FROM orders
+                    WHERE created_at >= GREATEST(CAST(%s AS DATETIME), {current_hour}) AND created_at < %s
+                ) sales
+                GROUP BY day
+                ORDER BY date DESC
+            """
+            params = (start_date, end_date + timedelta(days=1),
+                      range_start, range_end,
+                      range_start, range_end)
+
+            cursor.execute(query, params)
+            sales_data = cursor.fetchall()
        
-        # Convert Decimal to float
-        for row in sales_data:
-            if 'revenue' in row:
-                row['revenue'] = float(row['revenue'])
+            # Convert Decimal to float
+            for row in sales_data:
+                row['orders'] = int(row['orders'])
+                if 'revenue' in row:
+                    row['revenue'] = float(row['revenue'])
        
-        cursor.close()
-        connection.close()
-        logger.info(f"Retrieved {len(sales_data)} sales records")
-        return sales_data
-    except Error as e:
-        logger.error(f"Error fetching sales data: {e}")
-        return []
+            cursor.close()
+            logger.info(f"Retrieved {len(sales_data)} sales records")
+            return sales_data
+        except Error as e:
+            logger.error(f"Error fetching sales data: {e}")
+            return []
 
 # INITIALIZE DATABASE ON IMPORT
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cafeteria database maintenance")
+    parser.add_argument("--rebuild-rollups", action="store_true",
+                        help="rebuild sales rollups from raw orders")
+    parser.add_argument("--start", type=date.fromisoformat, help="first day to rebuild (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, help="last day to rebuild (YYYY-MM-DD)")
+    args = parser.parse_args()
+    if (args.start is None) != (args.end is None):
+        parser.error("--start and --end must be given together")
+
     initialize_database()
+    if args.rebuild_rollups:
+        rebuild_sales_rollups(args.start, args.end)
 else:
     initialize_database()
\ No newline at end of file
@@ -0,0 +1,125 @@
+import atexit
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class DebouncedWriter:
+    """Coalesce frequent writes per key and flush them from a background thread.
+
+    Each submit replaces the pending value for its key, so only the latest
+    value is written. A key is flushed once it has been quiet for `delay`
+    seconds, or `max_delay` seconds after its first pending change. `write`
+    receives a dict of key -> value for everything due at once.
+
+    A batch whose write raises is queued again with exponential backoff
+    (from `retry_delay` up to `max_retry_delay` seconds), except for keys
+    that were submitted again or discarded meanwhile: a newer value always
+    wins over a retried older one.
+    """
+
+    def __init__(self, name, write, delay=2.0, max_delay=10.0, retry_delay=1.0, max_retry_delay=60.0):
+        self.name = name
+        self.delay = delay
+        self.max_delay = max_delay
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._write = write
+        self._pending = {}   # key -> (sequence, value)
+        self._latest = {}    # key -> sequence of the newest value not yet written
+        self._first = {}
+        self._due = {}
+        self._sequence = 0
+        self._failures = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def submit(self, key, value):
+        now = time.monotonic()
+        with self._cond:
+            self._sequence += 1
+            self._pending[key] = (self._sequence, value)
+            self._latest[key] = self._sequence
+            first = self._first.setdefault(key, now)
+            self._due[key] = min(now + self.delay, first + self.max_delay)
+            self._wake()
+
+    def discard(self, key):
+        """Drop a pending write without flushing it."""
+        with self._cond:
+            self._take([key])
+            self._latest.pop(key, None)
+
+    def flush(self, key=None):
+        """Write pending values now: one key, or everything when key is None."""
+        self.flush_matching(None if key is None else (lambda pending: pending == key))
+
+    def flush_matching(self, match=None):
+        """Write pending values now for the keys where `match(key)` is true (all when None)."""
+        with self._cond:
+            batch = self._take([key for key in self._pending if match is None or match(key)])
+        if batch:
+            self._write_batch(batch)
+
+    def _wake(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        self._cond.notify()
+
+    def _take(self, keys):
+        batch = {}
+        for key in keys:
+            if key in self._pending:
+                batch[key] = self._pending.pop(key)
+                self._first.pop(key, None)
+                self._due.pop(key, None)
+        return batch
+
+    def _write_batch(self, batch):
+        try:
+            self._write({key: value for key, (_, value) in batch.items()})
+        except Exception as e:
+            self._retry(batch, e)
+            return
+
+        with self._cond:
+            self._failures = 0
+            for key, (sequence, _) in batch.items():
+                if self._latest.get(key) == sequence:
+                    del self._latest[key]
+
+    def _retry(self, batch, error):
+        with self._cond:
+            self._failures += 1
+            backoff = min(self.retry_delay * 2 ** (self._failures - 1), self.max_retry_delay)
+            due = time.monotonic() + backoff
+            retried = 0
+            for key, (sequence, value) in batch.items():
+                # Submitted again or discarded since: the newer state wins
+                if self._latest.get(key) != sequence:
+                    continue
+                self._pending[key] = (sequence, value)
+                self._first.setdefault(key, due)
+                self._due[key] = due
+                retried += 1
+            if retried:
+                self._wake()
+        logger.error(
+            f"{self.name} failed to write {len(batch)} pending values: {error}; "
+            f"retrying {retried} in {backoff:.0f}s"
+        )
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    ready = [key for key, due in self._due.items() if due <= now]
+                    if ready:
+                        batch = self._take(ready)
+                        break
+                    self._cond.wait(min(self._due.values()) - now if self._due else None)
+            self._write_batch(batch)
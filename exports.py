@@ -0,0 +1,161 @@
+import csv
+import glob
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from database import get_connection
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+# EXPORT CONFIGURATION
+EXPORT_CHUNK_SIZE = 5000  # Rows pulled from MySQL and written per step
+EXPORT_FILE_PREFIX = "orders_export_"
+EXPORT_STALE_SECONDS = 3600  # Leftover export files older than this are removed
+
+EXPORT_COLUMNS = [
+    "order_reference", "username", "created_at", "status", "payment_mode",
+    "order_total", "menu_id", "item_name", "quantity", "price", "item_total"
+]
+
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+def available_export_formats():
+    """Export formats usable in this environment."""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != "Parquet" or pa is not None]
+
+def _parquet_schema():
+    return pa.schema([
+        ("order_reference", pa.string()),
+        ("username", pa.string()),
+        ("created_at", pa.timestamp("s")),
+        ("status", pa.string()),
+        ("payment_mode", pa.string()),
+        ("order_total", pa.decimal128(10, 2)),
+        ("menu_id", pa.int32()),
+        ("item_name", pa.string()),
+        ("quantity", pa.int32()),
+        ("price", pa.decimal128(10, 2)),
+        ("item_total", pa.decimal128(10, 2)),
+    ])
+
+class _CsvSink:
+    def __init__(self, path):
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(EXPORT_COLUMNS)
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+class _ParquetSink:
+    def __init__(self, path):
+        self._schema = _parquet_schema()
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self._writer.write_table(pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, self._schema)],
+            schema=self._schema
+        ))
+
+    def close(self):
+        self._writer.close()
+
+def cleanup_stale_exports(max_age=EXPORT_STALE_SECONDS):
+    """Remove export files left behind (e.g. by a crashed run) older than `max_age` seconds."""
+    cutoff = time.time() - max_age
+    removed = 0
+    for path in glob.glob(os.path.join(tempfile.gettempdir(), EXPORT_FILE_PREFIX + "*")):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass  # Already gone, or another process is cleaning up
+    if removed:
+        logger.info(f"Removed {removed} stale export files")
+    return removed
+
+def export_orders(start_date, end_date, fmt="CSV", chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream orders and their items for a date range into a temporary file.
+
+    Rows are read through an unbuffered cursor and written chunk by chunk, so
+    memory use does not depend on the size of the range. Returns the file
+    path, or None if the export failed. The caller owns (and deletes) the file.
+    """
+    if fmt not in available_export_formats():
+        logger.error(f"Export format '{fmt}' is not available")
+        return None
+
+    connection = get_connection()
+    if not connection:
+        logger.error("Database connection failed while exporting orders")
+        return None
+
+    cleanup_stale_exports()
+
+    suffix, _ = EXPORT_FORMATS[fmt]
+    handle, path = tempfile.mkstemp(prefix=EXPORT_FILE_PREFIX, suffix=suffix)
+    os.close(handle)
+
+    sink = None
+    exported = 0
+    completed = False
+    try:
+        sink = _ParquetSink(path) if fmt == "Parquet" else _CsvSink(path)
+        cursor = connection.cursor(buffered=False)
+        cursor.execute(
+            """SELECT o.order_reference, o.username, o.created_at, o.status, o.payment_mode,
+                      o.total_amount, i.menu_id, i.item_name, i.quantity, i.price, i.total
+               FROM orders o
+               JOIN order_items i ON i.order_id = o.id
+               WHERE o.created_at >= %s AND o.created_at < %s
+               ORDER BY o.created_at, o.id, i.id""",
+            (
+                datetime.combine(start_date, datetime.min.time()),
+                datetime.combine(end_date + timedelta(days=1), datetime.min.time()),
+            )
+        )
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            sink.write(rows)
+            exported += len(rows)
+        cursor.close()
+        sink.close()
+        sink = None
+
+        logger.info(f"Exported {exported} order item rows from {start_date} to {end_date} as {fmt}")
+        completed = True
+        return path
+    except Exception as e:
+        # Database, file system and pyarrow errors all just fail the export
+        logger.error(f"Error exporting orders: {e}")
+        return None
+    finally:
+        if not completed:
+            try:
+                if sink is not None:
+                    sink.close()
+            except Exception:
+                pass
+            os.remove(path)
+        connection.close()
@@ -0,0 +1,193 @@
+import io
+import logging
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# FILE LAYOUT
+# Import and export share these columns. Only item_name (or id) is required;
+# blank cells keep the item's current value.
+MENU_FILE_COLUMNS = [
+    "id", "item_name", "category", "price", "stock", "stock_delta",
+    "low_stock_threshold", "is_available", "description"
+]
+
+INTEGER_COLUMNS = ["id", "stock", "stock_delta", "low_stock_threshold"]
+TEXT_COLUMNS = ["item_name", "category", "description"]
+
+TRUE_VALUES = {"1", "true", "yes", "y"}
+FALSE_VALUES = {"0", "false", "no", "n"}
+
+MAX_NAME_LENGTH = 100
+
+def excel_supported():
+    """Whether pandas can read and write .xlsx files here (needs openpyxl)."""
+    try:
+        import openpyxl  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+# READING
+def read_menu_file(file, file_name):
+    """Read an uploaded CSV or Excel file with every cell as text."""
+    if file_name.lower().endswith((".xlsx", ".xls")):
+        df = pd.read_excel(file, dtype=str)
+    else:
+        df = pd.read_csv(file, dtype=str, keep_default_na=False)
+
+    df.columns = [str(column).strip().lower().replace(" ", "_") for column in df.columns]
+    if "item_name" not in df.columns and "id" not in df.columns:
+        raise ValueError("The file needs an 'item_name' or 'id' column")
+    return df.reindex(columns=MENU_FILE_COLUMNS)
+
+# VALIDATION
+def validate_menu_import(df, menu_items, categories=None):
+    """Validate an import against the current menu with column-wise checks.
+
+    Rows are matched to existing items by id, or by item name when id is
+    blank; anything unmatched is a new item. Returns (rows ready for
+    `upsert_menu_items`, list of (file row number, message)).
+    """
+    errors = pd.Series("", index=df.index)
+
+    def flag(mask, message):
+        errors.loc[mask.fillna(False).astype(bool)] += message + "; "
+
+    text = {
+        column: df[column].astype("string").str.strip().replace("", pd.NA)
+        for column in MENU_FILE_COLUMNS
+    }
+
+    numbers = {}
+    for column in INTEGER_COLUMNS + ["price"]:
+        numbers[column] = pd.to_numeric(text[column], errors="coerce")
+        flag(text[column].notna() & numbers[column].isna(), f"{column} is not a number")
+    for column in INTEGER_COLUMNS:
+        flag(numbers[column].notna() & (numbers[column] % 1 != 0), f"{column} must be a whole number")
+
+    flag(numbers["price"] <= 0, "price must be above zero")
+    flag(numbers["stock"] < 0, "stock cannot be negative")
+    flag(numbers["low_stock_threshold"] < 0, "low_stock_threshold cannot be negative")
+    flag(numbers["stock"].notna() & numbers["stock_delta"].notna(), "give stock or stock_delta, not both")
+    flag(text["item_name"].str.len() > MAX_NAME_LENGTH, f"item_name is longer than {MAX_NAME_LENGTH} characters")
+    if categories:
+        flag(text["category"].notna() & ~text["category"].isin(categories),
+             f"category must be one of {', '.join(categories)}")
+
+    availability = text["is_available"].str.lower()
+    flag(availability.notna() & ~availability.isin(TRUE_VALUES | FALSE_VALUES), "is_available must be yes or no")
+
+    # Resolve every row to a menu id
+    menu = pd.DataFrame(menu_items, columns=["id", "item_name"])
+    name_keys = menu["item_name"].str.strip().str.lower()
+    name_counts = name_keys.value_counts()
+    unique_names = dict(zip(name_keys, menu["id"]))
+    row_names = text["item_name"].str.lower()
+
+    flag(numbers["id"].notna() & ~numbers["id"].isin(menu["id"]), "id is not on the menu")
+    flag(numbers["id"].isna() & row_names.map(name_counts).fillna(0).gt(1),
+         "item_name matches several menu items; give the id")
+    target = numbers["id"].fillna(row_names.map(unique_names).where(row_names.map(name_counts).eq(1)))
+
+    is_new = target.isna()
+    flag(is_new & text["item_name"].isna(), "item_name is required")
+    flag(is_new & text["category"].isna(), "category is required for new items")
+    flag(is_new & numbers["price"].isna(), "price is required for new items")
+    flag(is_new & numbers["stock_delta"].notna(), "stock_delta needs an existing item; use stock")
+
+    duplicate_key = target.astype("string").fillna("new:" + row_names.fillna(""))
+    flag(duplicate_key.duplicated(), "item appears more than once in the file")
+
+    # Header is file line 1, so data row i is line i + 2
+    bad = errors != ""
+    row_errors = [(int(index) + 2, message.rstrip("; ")) for index, message in errors[bad].items()]
+
+    def value(column, index):
+        cell = (numbers if column in numbers else text)[column].at[index]
+        if pd.isna(cell):
+            return None
+        if column in INTEGER_COLUMNS:
+            return int(cell)
+        if column == "price":
+            return float(cell)
+        return str(cell)
+
+    rows = []
+    for index in df.index[~bad]:
+        row = {column: value(column, index) for column in MENU_FILE_COLUMNS if column != "is_available"}
+        row["id"] = None if pd.isna(target.at[index]) else int(target.at[index])
+        flag_value = availability.at[index]
+        row["is_available"] = None if pd.isna(flag_value) else flag_value in TRUE_VALUES
+        rows.append(row)
+
+    logger.info(f"Validated menu import: {len(rows)} valid rows, {len(row_errors)} rows with errors")
+    return rows, row_errors
+
+# GRID EDITING
+# Menu editor grid column -> menu table field
+MENU_EDITOR_FIELDS = {
+    "Item": "item_name",
+    "Category": "category",
+    "Price (₹)": "price",
+    "Stock": "stock",
+    "Alert At": "low_stock_threshold",
+    "Available": "is_available",
+    "Description": "description",
+}
+
+def menu_editor_frame(menu_items):
+    """Build the menu editor grid, indexed by menu id."""
+    frame = pd.DataFrame(
+        {
+            column: [item[field] for item in menu_items]
+            for column, field in MENU_EDITOR_FIELDS.items()
+        },
+        index=pd.Index([item['id'] for item in menu_items], name="ID"),
+        columns=list(MENU_EDITOR_FIELDS),
+    )
+    frame["Price (₹)"] = frame["Price (₹)"].astype(float)
+    frame["Available"] = frame["Available"].astype(bool)
+    frame["Description"] = frame["Description"].fillna("")
+    frame["Delete"] = False
+    return frame
+
+def diff_menu_edits(snapshot, edited):
+    """Compare the edited grid with its snapshot.
+
+    Returns (changed rows as update dicts, ids marked for deletion). Stock
+    is sent as a change relative to the snapshot so orders placed while the
+    grid was open are not overwritten.
+    """
+    columns = list(MENU_EDITOR_FIELDS)
+    deleted = edited["Delete"].fillna(False).astype(bool)
+    current = edited.loc[~deleted, columns].copy()
+    current["Description"] = current["Description"].fillna("")
+    changed = current.ne(snapshot.loc[current.index, columns]).any(axis=1)
+
+    changes = [
+        {"id": menu_id, **{MENU_EDITOR_FIELDS[column]: value for column, value in row.items()}}
+        for menu_id, row in current[changed].to_dict("index").items()
+    ]
+    for change in changes:
+        change["description"] = change["description"] or None
+        change["stock_delta"] = int(change.pop("stock")) - int(snapshot.at[change["id"], "Stock"])
+    return changes, edited.index[deleted].tolist()
+
+# EXPORT
+def menu_export_frame(menu_items):
+    """The current menu in the import file layout."""
+    frame = pd.DataFrame(menu_items).reindex(columns=MENU_FILE_COLUMNS)
+    frame["price"] = frame["price"].astype(float)
+    frame["is_available"] = frame["is_available"].map(lambda flag: "yes" if flag else "no")
+    return frame
+
+def export_menu(menu_items, fmt="CSV"):
+    """Serialize the menu as CSV or Excel bytes ready for download."""
+    frame = menu_export_frame(menu_items)
+    if fmt == "Excel":
+        buffer = io.BytesIO()
+        frame.to_excel(buffer, index=False, sheet_name="menu")
+        return buffer.getvalue()
+    return frame.to_csv(index=False).encode("utf-8")
@@ -0,0 +1,83 @@
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+from cart import to_decimal
+
+CENT = Decimal("0.01")
+
+PromotionResult = namedtuple('PromotionResult', ['ok', 'code', 'discount', 'message'])
+
+class Promotion:
+    """A promotion row compiled into a rule that can be evaluated without a query.
+
+    Scope is the whole cart, one category (`category`) or one item
+    (`menu_id`). Usage caps are checked against the counts the rule was
+    compiled with; `create_order` enforces them again under lock.
+    """
+    __slots__ = (
+        "id", "code", "description", "percent", "max_discount", "min_basket",
+        "category", "menu_id", "valid_from", "valid_until", "uses_remaining", "per_user_limit"
+    )
+
+    def __init__(self, row):
+        self.id = row['id']
+        self.code = row['code'].upper()
+        self.description = row.get('description')
+        self.percent = to_decimal(row['discount_percent'])
+        self.max_discount = to_decimal(row['max_discount']) if row.get('max_discount') is not None else None
+        self.min_basket = to_decimal(row.get('min_basket') or 0)
+        self.category = row.get('category')
+        self.menu_id = row.get('menu_id')
+        self.valid_from = row.get('valid_from')
+        self.valid_until = row.get('valid_until')
+        self.uses_remaining = row.get('uses_remaining')
+        self.per_user_limit = row.get('per_user_limit')
+
+    def scope_label(self):
+        if self.menu_id is not None:
+            return "one menu item"
+        if self.category:
+            return f"{self.category} items"
+        return "your whole order"
+
+    def _in_scope(self, line, category_of):
+        if self.menu_id is not None:
+            return line.menu_id == self.menu_id
+        if self.category:
+            return category_of(line.menu_id) == self.category
+        return True
+
+    def evaluate(self, cart, category_of, user_redemptions=0, now=None):
+        """Work out the discount for a cart.
+
+        `category_of` maps a menu id to its category. Returns a PromotionResult.
+        """
+        now = now or datetime.now()
+        if self.valid_from and now < self.valid_from:
+            return PromotionResult(False, self.code, Decimal("0"), f"{self.code} is not active yet")
+        if self.valid_until and now > self.valid_until:
+            return PromotionResult(False, self.code, Decimal("0"), f"{self.code} has expired")
+        if self.uses_remaining is not None and self.uses_remaining <= 0:
+            return PromotionResult(False, self.code, Decimal("0"), f"{self.code} has been fully redeemed")
+        if self.per_user_limit is not None and user_redemptions >= self.per_user_limit:
+            return PromotionResult(False, self.code, Decimal("0"), f"You have already used {self.code}")
+
+        subtotal = cart.subtotal
+        if subtotal < self.min_basket:
+            return PromotionResult(
+                False, self.code, Decimal("0"),
+                f"Spend at least ₹{self.min_basket:.2f} to use {self.code}"
+            )
+
+        eligible = sum((line.total for line in cart if self._in_scope(line, category_of)), Decimal("0"))
+        if eligible <= 0:
+            return PromotionResult(
+                False, self.code, Decimal("0"), f"{self.code} only applies to {self.scope_label()}"
+            )
+
+        discount = (eligible * self.percent / 100).quantize(CENT, rounding=ROUND_HALF_UP)
+        if self.max_discount is not None:
+            discount = min(discount, self.max_discount)
+        percent = f"{self.percent:.2f}".rstrip("0").rstrip(".")
+        return PromotionResult(True, self.code, discount, f"{percent}% off {self.scope_label()}")
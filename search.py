@@ -0,0 +1,145 @@
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import OrderedDict
+
+# Relative weight of a match in each field
+FIELD_WEIGHTS = {"name": 3.0, "category": 1.5, "description": 1.0}
+
+# Score multipliers by match kind
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.8
+FUZZY_SCORE = 0.6
+
+FUZZY_MIN_SIMILARITY = 0.4  # Trigram Jaccard similarity needed for a typo match
+FUZZY_MIN_LENGTH = 3        # Shorter query terms only match exactly or by prefix
+NAME_PREFIX_BONUS = 2.0     # Whole query is the start of the item name
+QUERY_CACHE_SIZE = 256
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def normalize(text):
+    """Lowercase and strip accents so 'Café' matches 'cafe'."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+def tokenize(text):
+    return _TOKEN_RE.findall(normalize(text))
+
+def trigrams(term):
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class MenuSearchIndex:
+    """In-memory search over menu item names, categories and descriptions.
+
+    Supports exact, prefix and trigram-fuzzy term matching. Every query term
+    must match; results are ranked by field-weighted score. Build once per
+    menu version; queries only touch the terms that can match.
+    """
+
+    def __init__(self, items):
+        self._ids = [item['id'] for item in items]
+        self._names = [normalize(item['item_name']) for item in items]
+
+        postings = {}
+        for doc, item in enumerate(items):
+            fields = {
+                "name": item['item_name'],
+                "category": item.get('category'),
+                "description": item.get('description'),
+            }
+            for field, text in fields.items():
+                weight = FIELD_WEIGHTS[field]
+                for term in tokenize(text):
+                    docs = postings.setdefault(term, {})
+                    if docs.get(doc, 0) < weight:
+                        docs[doc] = weight
+
+        self._terms = sorted(postings)
+        self._postings = [postings[term] for term in self._terms]
+
+        self._trigram_terms = {}
+        self._trigram_counts = []
+        for term_id, term in enumerate(self._terms):
+            grams = trigrams(term)
+            self._trigram_counts.append(len(grams))
+            for gram in grams:
+                self._trigram_terms.setdefault(gram, []).append(term_id)
+
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def search(self, query, limit=None):
+        """Menu ids matching `query`, best match first."""
+        key = normalize(query).strip()
+        if not key:
+            return []
+
+        with self._cache_lock:
+            ranked = self._cache.get(key)
+            if ranked is not None:
+                self._cache.move_to_end(key)
+        if ranked is None:
+            ranked = self._rank(key)
+            with self._cache_lock:
+                self._cache[key] = ranked
+                if len(self._cache) > QUERY_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return ranked[:limit] if limit else list(ranked)
+
+    def _rank(self, query):
+        totals = None
+        for term in tokenize(query):
+            scores = self._match_term(term)
+            if totals is None:
+                totals = scores
+            else:
+                totals = {doc: totals[doc] + score for doc, score in scores.items() if doc in totals}
+            if not totals:
+                return []
+        if not totals:
+            return []
+
+        for doc in totals:
+            if self._names[doc].startswith(query):
+                totals[doc] += NAME_PREFIX_BONUS
+
+        order = sorted(totals, key=lambda doc: (-totals[doc], self._names[doc]))
+        return [self._ids[doc] for doc in order]
+
+    def _match_term(self, term):
+        """Best score per document for one query term."""
+        scores = {}
+
+        def add(term_id, multiplier):
+            for doc, weight in self._postings[term_id].items():
+                score = weight * multiplier
+                if score > scores.get(doc, 0):
+                    scores[doc] = score
+
+        # Exact and prefix matches: a contiguous range of the sorted vocabulary
+        start = bisect_left(self._terms, term)
+        for term_id in range(start, len(self._terms)):
+            candidate = self._terms[term_id]
+            if not candidate.startswith(term):
+                break
+            add(term_id, EXACT_SCORE if candidate == term else PREFIX_SCORE)
+
+        # Typo tolerance: vocabulary terms sharing enough trigrams
+        if len(term) >= FUZZY_MIN_LENGTH:
+            grams = trigrams(term)
+            shared = {}
+            for gram in grams:
+                for term_id in self._trigram_terms.get(gram, ()):
+                    shared[term_id] = shared.get(term_id, 0) + 1
+            for term_id, count in shared.items():
+                similarity = count / (len(grams) + self._trigram_counts[term_id] - count)
+                if similarity >= FUZZY_MIN_SIMILARITY and not self._terms[term_id].startswith(term):
+                    add(term_id, FUZZY_SCORE * similarity)
+
+        return scores
@@ -0,0 +1,71 @@
+from decimal import Decimal
+
+from cart import Cart, to_decimal
+
+def test_to_decimal_avoids_float_noise():
+    assert to_decimal(0.1) == Decimal("0.1")
+    assert to_decimal(Decimal("2.50")) == Decimal("2.50")
+
+def test_add_accumulates_quantity_per_item():
+    cart = Cart()
+    cart.add(1, "Chai", 15, 2)
+    cart.add(1, "Chai", 15, 1)
+    cart.add(2, "Samosa", "12.50")
+    assert len(cart) == 2
+    assert cart.quantity(1) == 3
+    assert cart.item_count == 4
+    assert 1 in cart and 3 not in cart
+
+def test_add_ignores_non_positive_quantity_for_new_items():
+    cart = Cart()
+    cart.add(1, "Chai", 15, 0)
+    assert not cart
+
+def test_update_sets_quantity_and_removes_at_zero():
+    cart = Cart()
+    cart.update(1, "Chai", 15, 2)
+    cart.update(1, "Masala Chai", 18, 5)
+    line = cart.get(1)
+    assert (line.name, line.price, line.quantity) == ("Masala Chai", Decimal("18"), 5)
+    cart.update(1, "Masala Chai", 18, 0)
+    assert 1 not in cart
+
+def test_subtotal_is_exact():
+    cart = Cart()
+    cart.add(1, "Coffee", 0.1, 3)
+    cart.add(2, "Cookie", 0.2, 1)
+    assert cart.subtotal == Decimal("0.5")
+    assert Cart().subtotal == Decimal("0")
+
+def test_iteration_allows_removing_lines():
+    cart = Cart.from_items([
+        {"menu_id": 1, "name": "Chai", "price": 15, "quantity": 1},
+        {"menu_id": 2, "name": "Samosa", "price": 12, "quantity": 2},
+    ])
+    for line in cart:
+        cart.remove(line.menu_id)
+    assert not cart
+
+def test_records_round_trip():
+    cart = Cart()
+    cart.add(1, "Chai", "15.50", 2)
+    cart.add(2, "Samosa", 12, 1)
+    records = cart.to_records()
+    assert records[0] == {"menu_id": 1, "name": "Chai", "price": "15.50", "quantity": 2}
+    restored = Cart.from_items(records)
+    assert restored.quantities() == {1: 2, 2: 1}
+    assert restored.subtotal == cart.subtotal
+
+def test_order_items_carry_line_totals():
+    cart = Cart()
+    cart.add(7, "Sandwich", "40.00", 3)
+    assert cart.to_order_items() == [
+        {"menu_id": 7, "name": "Sandwich", "quantity": 3, "price": Decimal("40.00"), "total": Decimal("120.00")}
+    ]
+    assert cart.names() == {7: "Sandwich"}
+
+def test_clear_empties_the_cart():
+    cart = Cart()
+    cart.add(1, "Chai", 15)
+    cart.clear()
+    assert len(cart) == 0 and cart.item_count == 0
@@ -0,0 +1,137 @@
+import threading
+import time
+
+from debounce import DebouncedWriter
+
+def make_writer(fail_times=0, **kwargs):
+    """A writer recording every batch; the first `fail_times` writes raise."""
+    batches = []
+    failures = [fail_times]
+
+    def write(batch):
+        if failures[0] > 0:
+            failures[0] -= 1
+            raise RuntimeError("database unavailable")
+        batches.append(dict(batch))
+
+    kwargs.setdefault("delay", 60)
+    kwargs.setdefault("max_delay", 60)
+    kwargs.setdefault("retry_delay", 60)
+    return DebouncedWriter("test-writer", write, **kwargs), batches
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def test_only_latest_value_per_key_is_written():
+    writer, batches = make_writer()
+    writer.submit("alice", 1)
+    writer.submit("alice", 2)
+    writer.submit("bob", 3)
+    writer.flush()
+    assert batches == [{"alice": 2, "bob": 3}]
+
+def test_flush_single_key_leaves_others_pending():
+    writer, batches = make_writer()
+    writer.submit("alice", 1)
+    writer.submit("bob", 2)
+    writer.flush("alice")
+    assert batches == [{"alice": 1}]
+    writer.flush()
+    assert batches == [{"alice": 1}, {"bob": 2}]
+
+def test_discard_drops_pending_value():
+    writer, batches = make_writer()
+    writer.submit("alice", 1)
+    writer.discard("alice")
+    writer.flush()
+    assert batches == []
+
+def test_background_thread_writes_after_delay():
+    writer, batches = make_writer(delay=0.05, max_delay=1)
+    writer.submit("alice", 1)
+    assert wait_for(lambda: batches == [{"alice": 1}])
+
+def test_failed_batch_is_retried():
+    writer, batches = make_writer(fail_times=1)
+    writer.submit("alice", 1)
+    writer.flush()
+    assert batches == []
+    writer.flush()
+    assert batches == [{"alice": 1}]
+
+def test_failed_batch_is_retried_in_background_with_backoff():
+    writer, batches = make_writer(fail_times=2, delay=0.01, retry_delay=0.02)
+    writer.submit("alice", 1)
+    assert wait_for(lambda: batches == [{"alice": 1}])
+
+def test_retry_never_overwrites_a_newer_value():
+    submitted = threading.Event()
+    batches = []
+
+    def write(batch):
+        if not submitted.is_set():
+            # A newer value arrives while the first write is in flight
+            writer.submit("alice", "new")
+            submitted.set()
+            raise RuntimeError("database unavailable")
+        batches.append(dict(batch))
+
+    writer = DebouncedWriter("test-writer", write, delay=60, max_delay=60, retry_delay=60)
+    writer.submit("alice", "old")
+    writer.submit("bob", "kept")
+    writer.flush()
+    writer.flush()
+    assert batches == [{"alice": "new", "bob": "kept"}]
+
+def test_retry_skips_values_written_by_a_later_flush():
+    writer = None
+    batches = []
+    calls = [0]
+
+    def write(batch):
+        calls[0] += 1
+        if calls[0] == 1:
+            # The newer value is submitted and written before this write fails
+            writer.submit("alice", "new")
+            writer.flush()
+            raise RuntimeError("database unavailable")
+        batches.append(dict(batch))
+
+    writer = DebouncedWriter("test-writer", write, delay=60, max_delay=60, retry_delay=60)
+    writer.submit("alice", "old")
+    writer.flush()
+    writer.flush()
+    assert batches == [{"alice": "new"}]
+
+def test_retry_skips_discarded_keys():
+    writer = None
+    calls = [0]
+    batches = []
+
+    def write(batch):
+        calls[0] += 1
+        if calls[0] == 1:
+            writer.discard("alice")
+            raise RuntimeError("database unavailable")
+        batches.append(dict(batch))
+
+    writer = DebouncedWriter("test-writer", write, delay=60, max_delay=60, retry_delay=60)
+    writer.submit("alice", 1)
+    writer.flush()
+    writer.flush()
+    assert batches == []
+
+def test_flush_matching_writes_only_matching_keys():
+    writer, batches = make_writer()
+    writer.submit(("alice", 1), True)
+    writer.submit(("alice", 2), False)
+    writer.submit(("bob", 1), True)
+    writer.flush_matching(lambda key: key[0] == "alice")
+    assert batches == [{("alice", 1): True, ("alice", 2): False}]
+    writer.flush()
+    assert batches[-1] == {("bob", 1): True}
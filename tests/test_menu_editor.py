@@ -0,0 +1,55 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from menu_io import menu_editor_frame, diff_menu_edits
+
+MENU = [
+    {"id": 1, "item_name": "Chai", "category": "Beverage", "price": "15.00", "stock": 40,
+     "low_stock_threshold": 10, "is_available": 1, "description": None},
+    {"id": 2, "item_name": "Samosa", "category": "Snack", "price": "12.00", "stock": 25,
+     "low_stock_threshold": 5, "is_available": 1, "description": "Spicy"},
+]
+
+def test_frame_is_indexed_by_menu_id_with_clean_types():
+    frame = menu_editor_frame(MENU)
+    assert frame.index.tolist() == [1, 2]
+    assert frame.at[1, "Price (₹)"] == 15.0
+    assert frame.at[1, "Description"] == ""
+    assert not frame["Delete"].any()
+
+def test_unchanged_grid_has_no_changes():
+    frame = menu_editor_frame(MENU)
+    assert diff_menu_edits(frame, frame.copy()) == ([], [])
+
+def test_changed_row_becomes_update_with_stock_delta():
+    snapshot = menu_editor_frame(MENU)
+    edited = snapshot.copy()
+    edited.at[1, "Price (₹)"] = 18.0
+    edited.at[1, "Stock"] = 35
+    changes, deleted = diff_menu_edits(snapshot, edited)
+    assert deleted == []
+    assert len(changes) == 1
+    change = changes[0]
+    assert change["id"] == 1
+    assert change["price"] == 18.0
+    assert change["stock_delta"] == -5
+    assert "stock" not in change
+    assert change["description"] is None
+
+def test_deleted_rows_are_reported_and_not_updated():
+    snapshot = menu_editor_frame(MENU)
+    edited = snapshot.copy()
+    edited.at[2, "Delete"] = True
+    edited.at[2, "Item"] = "Renamed"
+    changes, deleted = diff_menu_edits(snapshot, edited)
+    assert changes == []
+    assert deleted == [2]
+
+def test_cleared_description_is_sent_as_none():
+    snapshot = menu_editor_frame(MENU)
+    edited = snapshot.copy()
+    edited.at[2, "Description"] = None
+    changes, _ = diff_menu_edits(snapshot, edited)
+    assert [change["id"] for change in changes] == [2]
+    assert changes[0]["description"] is None
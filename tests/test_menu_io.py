@@ -0,0 +1,83 @@
+import io
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+
+from menu_io import MENU_FILE_COLUMNS, read_menu_file, validate_menu_import, menu_export_frame, export_menu
+
+CATEGORIES = ["Food", "Dessert", "Snack", "Beverage"]
+
+MENU = [
+    {"id": 1, "item_name": "Chai", "category": "Beverage", "price": "15.00", "stock": 40,
+     "low_stock_threshold": 10, "is_available": 1, "description": None},
+    {"id": 2, "item_name": "Samosa", "category": "Snack", "price": "12.00", "stock": 25,
+     "low_stock_threshold": 5, "is_available": 0, "description": "Spicy"},
+]
+
+def read(text):
+    return read_menu_file(io.StringIO(text), "menu.csv")
+
+def test_read_normalizes_headers_and_adds_missing_columns():
+    df = read("Item Name,Price\nChai,15\n")
+    assert list(df.columns) == MENU_FILE_COLUMNS
+    assert df.at[0, "item_name"] == "Chai"
+
+def test_read_requires_item_name_or_id():
+    with pytest.raises(ValueError):
+        read("category,price\nSnack,10\n")
+
+def test_existing_items_match_by_id_or_name():
+    df = read("id,item_name,stock_delta,price\n1,,5,\n,samosa,,14\n")
+    rows, errors = validate_menu_import(df, MENU, CATEGORIES)
+    assert errors == []
+    assert rows[0]["id"] == 1 and rows[0]["stock_delta"] == 5 and rows[0]["price"] is None
+    assert rows[1]["id"] == 2 and rows[1]["price"] == 14.0
+
+def test_new_item_needs_category_and_price():
+    df = read("item_name,category,price,stock,is_available\nVada Pav,Food,20,30,yes\nPuff,,,,\n")
+    rows, errors = validate_menu_import(df, MENU, CATEGORIES)
+    assert len(rows) == 1
+    assert rows[0]["id"] is None and rows[0]["is_available"] is True and rows[0]["stock"] == 30
+    assert [row for row, _ in errors] == [3]
+    assert "category is required" in errors[0][1] and "price is required" in errors[0][1]
+
+def test_column_checks_report_file_row_numbers():
+    df = read(
+        "id,item_name,category,price,stock,stock_delta,is_available\n"
+        "1,,,abc,,,\n"
+        "2,,,,-1,,\n"
+        "1,,,,,,maybe\n"
+        ",Pizza,Mains,50,,,\n"
+        "9,,,,,,\n"
+        ",Chai,,,5,2,\n"
+    )
+    rows, errors = validate_menu_import(df, MENU, CATEGORIES)
+    problems = dict(errors)
+    assert rows == []
+    assert "price is not a number" in problems[2]
+    assert "stock cannot be negative" in problems[3]
+    assert "is_available must be yes or no" in problems[4]
+    assert "item appears more than once" in problems[4]
+    assert "category must be one of" in problems[5]
+    assert "id is not on the menu" in problems[6]
+    assert "give stock or stock_delta, not both" in problems[7]
+
+def test_ambiguous_name_needs_an_id():
+    menu = MENU + [dict(MENU[0], id=3)]
+    rows, errors = validate_menu_import(read("item_name,price\nChai,16\n"), menu, CATEGORIES)
+    assert rows == []
+    assert "matches several menu items" in errors[0][1]
+
+def test_export_uses_file_layout():
+    frame = menu_export_frame(MENU)
+    assert list(frame.columns) == MENU_FILE_COLUMNS
+    assert frame["is_available"].tolist() == ["yes", "no"]
+    exported = export_menu(MENU).decode("utf-8")
+    assert exported.splitlines()[0] == ",".join(MENU_FILE_COLUMNS)
+
+def test_export_round_trips_through_import():
+    df = read(export_menu(MENU).decode("utf-8"))
+    rows, errors = validate_menu_import(df, MENU, CATEGORIES)
+    assert errors == []
+    assert [(row["id"], row["price"], row["is_available"]) for row in rows] == [(1, 15.0, True), (2, 12.0, False)]
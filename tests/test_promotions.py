@@ -0,0 +1,77 @@
+from datetime import datetime
+from decimal import Decimal
+
+from cart import Cart
+from promotions import Promotion
+
+NOW = datetime(2026, 5, 1, 12, 0)
+CATEGORIES = {1: "Beverages", 2: "Snacks", 3: "Snacks"}
+
+def make_promotion(**overrides):
+    row = {'id': 1, 'code': 'save10', 'discount_percent': 10}
+    row.update(overrides)
+    return Promotion(row)
+
+def make_cart():
+    cart = Cart()
+    cart.add(1, "Chai", 15, 2)
+    cart.add(2, "Samosa", "12.50", 4)
+    cart.add(3, "Vada Pav", 20, 1)
+    return cart
+
+def evaluate(promotion, cart=None, **kwargs):
+    kwargs.setdefault('now', NOW)
+    return promotion.evaluate(cart or make_cart(), CATEGORIES.get, **kwargs)
+
+def test_whole_order_discount():
+    result = evaluate(make_promotion())
+    assert result.ok
+    assert result.code == "SAVE10"
+    assert result.discount == Decimal("10.00")
+    assert result.message == "10% off your whole order"
+
+def test_category_scope_discounts_only_matching_lines():
+    result = evaluate(make_promotion(category="Snacks", discount_percent=Decimal("12.5")))
+    assert result.ok
+    assert result.discount == Decimal("8.75")
+    assert result.message == "12.5% off Snacks items"
+
+def test_item_scope_discounts_only_that_item():
+    result = evaluate(make_promotion(menu_id=1, discount_percent=50))
+    assert result.ok
+    assert result.discount == Decimal("15.00")
+    assert result.message == "50% off one menu item"
+
+def test_out_of_scope_cart_is_rejected():
+    cart = Cart()
+    cart.add(1, "Chai", 15, 2)
+    result = evaluate(make_promotion(category="Snacks"), cart)
+    assert not result.ok
+    assert result.discount == Decimal("0")
+    assert result.message == "SAVE10 only applies to Snacks items"
+
+def test_discount_is_capped_and_rounded():
+    assert evaluate(make_promotion(max_discount=4)).discount == Decimal("4")
+    cart = Cart()
+    cart.add(1, "Chai", "0.25", 1)
+    assert evaluate(make_promotion(), cart).discount == Decimal("0.03")
+
+def test_validity_window():
+    early = evaluate(make_promotion(valid_from=datetime(2026, 6, 1)))
+    assert not early.ok and early.message == "SAVE10 is not active yet"
+    late = evaluate(make_promotion(valid_until=datetime(2026, 4, 30)))
+    assert not late.ok and late.message == "SAVE10 has expired"
+    assert evaluate(make_promotion(valid_from=datetime(2026, 4, 1), valid_until=datetime(2026, 6, 1))).ok
+
+def test_usage_caps():
+    spent = evaluate(make_promotion(uses_remaining=0))
+    assert not spent.ok and spent.message == "SAVE10 has been fully redeemed"
+    used = evaluate(make_promotion(per_user_limit=1), user_redemptions=1)
+    assert not used.ok and used.message == "You have already used SAVE10"
+    assert evaluate(make_promotion(uses_remaining=1, per_user_limit=2), user_redemptions=1).ok
+
+def test_minimum_basket():
+    result = evaluate(make_promotion(min_basket=200))
+    assert not result.ok
+    assert result.message == "Spend at least ₹200.00 to use SAVE10"
+    assert evaluate(make_promotion(min_basket=100)).ok
@@ -0,0 +1,54 @@
+from search import MenuSearchIndex, normalize, tokenize, trigrams
+
+MENU = [
+    {"id": 1, "item_name": "Masala Chai", "category": "Beverage", "description": "Spiced milk tea"},
+    {"id": 2, "item_name": "Chai Latte", "category": "Beverage", "description": None},
+    {"id": 3, "item_name": "Samosa", "category": "Snack", "description": "Crispy potato pastry"},
+    {"id": 4, "item_name": "Chocolate Brownie", "category": "Dessert", "description": "Sweet and rich"},
+    {"id": 5, "item_name": "Café Mocha", "category": "Beverage", "description": "Coffee with chocolate"},
+]
+
+def test_normalize_strips_accents_and_case():
+    assert normalize("Café MOCHA") == "cafe mocha"
+    assert tokenize("Chai-Latte, 2x") == ["chai", "latte", "2x"]
+    assert "ch" not in trigrams("chai") and " ch" in trigrams("chai")
+
+def test_exact_and_prefix_matches():
+    index = MenuSearchIndex(MENU)
+    assert set(index.search("chai")) == {1, 2}
+    assert index.search("samo") == [3]
+
+def test_name_prefix_ranks_first():
+    index = MenuSearchIndex(MENU)
+    assert index.search("chai")[0] == 2
+
+def test_name_outranks_description():
+    index = MenuSearchIndex(MENU)
+    assert index.search("chocolate") == [4, 5]
+
+def test_all_terms_must_match():
+    index = MenuSearchIndex(MENU)
+    assert index.search("chai spiced") == [1]
+    assert index.search("chai pastry") == []
+
+def test_typos_match_by_trigram_similarity():
+    index = MenuSearchIndex(MENU)
+    assert index.search("samossa") == [3]
+    assert index.search("brwnie") == [4]
+
+def test_category_and_accent_insensitive_matches():
+    index = MenuSearchIndex(MENU)
+    assert set(index.search("dessert")) == {4}
+    assert index.search("cafe") == [5]
+
+def test_blank_query_and_limit():
+    index = MenuSearchIndex(MENU)
+    assert index.search("   ") == []
+    assert len(index.search("beverage", limit=2)) == 2
+    assert len(index) == len(MENU)
+
+def test_cached_results_are_not_shared_lists():
+    index = MenuSearchIndex(MENU)
+    first = index.search("chai")
+    first.clear()
+    assert set(index.search("chai")) == {1, 2}